@@ -1,26 +1,84 @@
+import os
+import threading
 import time
 
-from flask import Flask, render_template, session, request, jsonify
+from flask import Flask, render_template, session, request, jsonify, make_response, g
 from flask_socketio import SocketIO, emit, join_room, leave_room
 import uuid
 from datetime import datetime
 import redis
 from board_state import *
 from game_setup import *
-
-HOST = 'localhost'
+from board_assets import STATIC_DIR, BoardAssetCache, tile_name
+from board_map import BOARD_MAP_FILE, BoardMap
+from game_registry import GameRegistry
+from game_store import GameStore, create_connection_pool
+from game_views import get_views
+from game_engine import GameEngine
+from mcts import MCTSBot
+from geometry_format import select_lod
+from geometry_tiles import select_zoom
+from lobby_list import PAGE_SIZE, LobbyFilter, LobbyListFeed
+from lobby_store import LobbyError, LobbyStore
+import metrics
+from metrics import timed
+
+HOST = os.environ.get('REDIS_HOST', 'localhost')
+# Emits to rooms go through Redis so that they reach clients connected to any server
+# process. Set SOCKETIO_MESSAGE_QUEUE to an empty string to run a single process without it.
+MESSAGE_QUEUE = os.environ.get('SOCKETIO_MESSAGE_QUEUE', f"redis://{HOST}:6379/0")
+# 'threading' for development with app.py; serve.py runs on 'gevent'
+ASYNC_MODE = os.environ.get('SOCKETIO_ASYNC_MODE', 'threading')
+REDIS_MAX_CONNECTIONS = int(os.environ.get('REDIS_MAX_CONNECTIONS', 64))  # per process
+# Set to a number of seconds to profile one handler call in PROFILE_SAMPLE_EVERY and keep the
+# profiles of those slower than that in PROFILE_DIR
+PROFILE_SLOW_HANDLERS = float(os.environ.get('PROFILE_SLOW_HANDLERS', 0))
+PROFILE_SAMPLE_EVERY = int(os.environ.get('PROFILE_SAMPLE_EVERY', 100))
+PROFILE_DIR = os.environ.get('PROFILE_DIR', 'profiles')
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'your-secret-key-change-in-production'
-socketio = SocketIO(app, cors_allowed_origins="*")
+# The client manager and json module count emit fan-out and payload sizes for /metrics
+socketio = SocketIO(app, cors_allowed_origins="*", async_mode=ASYNC_MODE,
+                    client_manager=metrics.client_manager(MESSAGE_QUEUE), json=metrics.PayloadSizeJSON)
+if PROFILE_SLOW_HANDLERS:
+    metrics.enable_profiler(PROFILE_SLOW_HANDLERS, PROFILE_SAMPLE_EVERY, PROFILE_DIR)
 
-redis_client = redis.Redis(host=HOST, port=6379, db=0)
+redis_pool = create_connection_pool(host=HOST, port=6379, db=0, max_connections=REDIS_MAX_CONNECTIONS)
+redis_client = metrics.TimedRedis(connection_pool=redis_pool)
 
 MAX_PLAYERS = 5
-
-# In-memory storage for lobbies
-lobbies = {}
-# Track which lobby each player is in
-player_lobbies = {}
+MIN_PLAYERS = 2  # empty seats below this are filled with bots when the game starts
+# Bot seats search for at most this long per move, keeping humans' waits under 500 ms
+BOT_MOVE_BUDGET = 0.4
+BOT_WORKERS = 0  # extra processes searching in parallel for each bot move
+LOBBY_LIST_DELAY = 0.25  # seconds, lobby changes within this window go out as one delta
+# Running games kept in memory per worker; colder ones are spilled to Redis
+MAX_RESIDENT_GAMES = 500
+MAX_RESIDENT_GAME_BYTES = None
+# Tiles requested with the current tile version (?v=) never change, see board_geometry_tile
+TILE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+
+# Board geometry is loaded and precompressed once at startup
+board_assets = BoardAssetCache()
+board_assets.load_boards()
+# Which city or route is where, for the boards with a board_map.json (see board_map.py)
+board_maps = {
+    board: BoardMap.load(board, BoardTemplate.for_board(board).graph)
+    for board in board_assets.boards() if os.path.isfile(os.path.join(STATIC_DIR, board, BOARD_MAP_FILE))
+}
+
+# Lobbies and who is in which, shared by every server process
+lobbies = LobbyStore(redis_client, MAX_PLAYERS, MIN_PLAYERS)
+# What the lobby browser shows, pushed to subscribers as deltas
+lobby_list = LobbyListFeed(lobbies)
+# Games with a bot turn scheduled or under way in this process, at most one each
+bot_turns = set()
+bot_turns_lock = threading.Lock()
+# Running games by lobby id
+games = GameRegistry(GameStore(redis_client), max_games=MAX_RESIDENT_GAMES, max_bytes=MAX_RESIDENT_GAME_BYTES)
+
+metrics.Gauge('ttr_open_lobbies', "Lobbies waiting for players, across all processes.", lobbies.open_count)
+metrics.Gauge('ttr_resident_games', "Running games held in this process.", lambda: len(games))
 
 @app.route('/')
 def index():
@@ -34,28 +92,29 @@ def lobby_room(lobby_id):
     return render_template('index.html')
 
 @socketio.on('connect')
-def handle_connect():
+@timed('connect')
+def handle_connect(auth=None):
+    metrics.CONNECTED_SOCKETS.inc()
     # Generate a unique player ID if they don't have one
     if 'player_id' not in session:
         session['player_id'] = str(uuid.uuid4())
-    
-    # Send current lobbies to the newly connected player
-    lobby_list = get_lobby_list()
-    emit('lobby_list_update', {'lobbies': lobby_list})
+    # The lobby list is only sent to the lobby browser, which asks for it with get_lobby_list
 
 @socketio.on('disconnect')
-def handle_disconnect():
-    player_id = session.get('player_id')
-    if player_id in player_lobbies:
-        lobby_id = player_lobbies[player_id]
-        leave_lobby_helper(player_id, lobby_id)
+@timed('disconnect')
+def handle_disconnect(reason=None):
+    metrics.CONNECTED_SOCKETS.dec()
+    lobby_list.unsubscribe(request.sid)
+    leave_lobby_helper(session.get('player_id'))
 
 @socketio.on('set_username')
+@timed('set_username')
 def handle_set_username(data):
     session['username'] = data['username']
     emit('username_set', {'username': data['username']})
 
 @socketio.on('create_lobby')
+@timed('create_lobby')
 def handle_create_lobby(data):
     player_id = session.get('player_id')
     username = session.get('username', 'Anonymous')
@@ -64,7 +123,7 @@ def handle_create_lobby(data):
     lobby_id = str(uuid.uuid4())[:8].upper()
     
     # Create lobby
-    lobbies[lobby_id] = {
+    lobby = {
         'id': lobby_id,
         'name': data.get('name', f"{username}'s Game"),
         'host': player_id,
@@ -76,56 +135,39 @@ def handle_create_lobby(data):
         'created_at': datetime.now().isoformat(),
         'started': False
     }
-    
-    # Track player's lobby
-    player_lobbies[player_id] = lobby_id
+    try:
+        lobbies.create(lobby, time.time())
+    except LobbyError as e:
+        emit('error', {'message': str(e)})
+        return
     
     # Join the room
     join_room(lobby_id)
     
     # Notify the creator
     emit('lobby_joined', {
-        'lobby': lobbies[lobby_id],
+        'lobby': lobby,
         'player_id': player_id
     })
     
-    # Broadcast updated lobby list to all clients
-    broadcast_lobby_list()
+    # Update lobby list
+    lobby_list_changed(lobby_id)
 
 @socketio.on('join_lobby')
+@timed('join_lobby')
 def handle_join_lobby(data):
     player_id = session.get('player_id')
     username = session.get('username', 'Anonymous')
     lobby_id = data['lobby_id']
     
-    if lobby_id not in lobbies:
-        emit('error', {'message': 'Lobby not found'})
-        return
-    
-    lobby = lobbies[lobby_id]
-    
-    # Check if lobby is full
-    if len(lobby['players']) >= MAX_PLAYERS:
-        emit('error', {'message': 'Lobby is full'})
-        return
-    
-    # Check if game already started
-    if lobby['started']:
-        emit('error', {'message': 'Game already started'})
+    # Checks that the lobby exists, is not full or started and that the player is in no
+    # other lobby, and adds the player, in one step
+    try:
+        lobby = lobbies.join(lobby_id, {'id': player_id, 'username': username})
+    except LobbyError as e:
+        emit('error', {'message': str(e)})
         return
     
-    # Check if player is already in a lobby
-    if player_id in player_lobbies:
-        emit('error', {'message': 'You are already in a lobby'})
-        return
-    
-    # Add player to lobby
-    lobby['players'].append({
-        'id': player_id,
-        'username': username
-    })
-    
-    player_lobbies[player_id] = lobby_id
     join_room(lobby_id)
     
     # Notify the player
@@ -140,41 +182,36 @@ def handle_join_lobby(data):
         'lobby': lobby
     }, room=lobby_id, include_self=False)
     
-    # Broadcast updated lobby list
-    broadcast_lobby_list()
+    # Update lobby list
+    lobby_list_changed(lobby_id)
 
 @socketio.on('leave_lobby')
+@timed('leave_lobby')
 def handle_leave_lobby():
-    player_id = session.get('player_id')
-    
-    if player_id not in player_lobbies:
-        return
-    
-    lobby_id = player_lobbies[player_id]
-    leave_lobby_helper(player_id, lobby_id)
+    leave_lobby_helper(session.get('player_id'))
 
 @socketio.on('start_game')
+@timed('start_game')
 def handle_start_game(data):
     player_id = session.get('player_id')
     lobby_id = data.get('lobby_id')
-    
-    if lobby_id not in lobbies:
-        emit('error', {'message': 'Lobby not found'})
+    bots = data.get('bots')
+    if bots is not None and not isinstance(bots, int):
+        emit('error', {'message': 'Invalid number of bots'})
         return
     
-    lobby = lobbies[lobby_id]
-    
-    # Check if player is the host
-    if lobby['host'] != player_id:
-        emit('error', {'message': 'Only the host can start the game'})
+    # Checks that the player is the host, fills empty seats with bots (as many as asked
+    # for or enough to play) and marks the lobby started, in one step
+    try:
+        lobby = lobbies.start(lobby_id, player_id, bots)
+    except LobbyError as e:
+        emit('error', {'message': str(e)})
         return
 
     # --- Set up game state ---
     board_type = lobby['board']
 
-    cities_file = f"static/{board_type}/cities.txt"
-    connections_file = f"static/{board_type}/connections.txt"
-    tickets_file = f"static/{board_type}/tickets.txt"
+    cities_file, connections_file, tickets_file = board_files(board_type)
 
     # Map each player in the lobby to a PlayerColor
     available_colors = list(PlayerColor)
@@ -182,23 +219,13 @@ def handle_start_game(data):
         (p['id'], available_colors[i])
         for i, p in enumerate(lobby['players'])
     ]
+    ai_players = [p['id'] for p in lobby['players'] if p.get('bot')]
 
-    global game_state
-    game_state = setup_game(cities_file, connections_file, tickets_file, player_info)
-    game_state_data = game_state.to_dict()
-
-    redis_payload = {
-        'lobby': lobby,
-        'game_state': game_state_data
-    }
-    redis_client.set(
-        f"game:{lobby_id}",
-        json.dumps(redis_payload),
-        ex=86400  # expire after 24 hours
-    )
-
-    # Mark game as started
-    lobby['started'] = True
+    game_state = setup_game(cities_file, connections_file, tickets_file, player_info, ai_players)
+    # Only store the game: it is loaded by whichever process the game page connects to (see
+    # the README on routing game connections by lobby)
+    games.put(lobby_id, lobby, game_state)
+    games.release(lobby_id)
     
     # Notify all players in the lobby
     emit('game_started', {
@@ -206,33 +233,38 @@ def handle_start_game(data):
     }, room=lobby_id)
     
     # Update lobby list
-    broadcast_lobby_list()
+    lobby_list_changed(lobby_id)
 
 @socketio.on('get_lobby_list')
-def handle_get_lobby_list():
-    lobby_list = get_lobby_list()
-    emit('lobby_list_update', {'lobbies': lobby_list})
+@timed('get_lobby_list')
+def handle_get_lobby_list(data=None):
+    """A page of open lobbies, optionally only on one board or with a number of free seats.
+    Deltas for the same filter follow until the next request."""
+    data = data or {}
+    try:
+        # Bounded to real boards and seat counts, as every distinct filter is a room
+        min_free_seats = min(max(int(data.get('min_free_seats', 0)), 0), MAX_PLAYERS)
+        lobby_filter = LobbyFilter(data.get('board') or None, min_free_seats)
+        offset, limit = int(data.get('offset', 0)), int(data.get('limit', PAGE_SIZE))
+    except (TypeError, ValueError):
+        emit('error', {'message': 'Invalid lobby list request'})
+        return
+    if lobby_filter.board is not None and lobby_filter.board not in board_assets.boards():
+        emit('error', {'message': 'Unknown board'})
+        return
+    subscribe_lobby_list(lobby_filter)
+    emit('lobby_list_update', lobby_list.page(lobby_filter, offset, limit))
 
-def leave_lobby_helper(player_id, lobby_id):
-    if lobby_id not in lobbies:
+def leave_lobby_helper(player_id):
+    left = lobbies.leave(player_id)
+    if left is None:
         return
-    
-    lobby = lobbies[lobby_id]
-    
-    # Remove player from lobby
-    lobby['players'] = [p for p in lobby['players'] if p['id'] != player_id]
-    
-    # Remove from tracking
-    del player_lobbies[player_id]
+    lobby_id, lobby, host_changed = left
     leave_room(lobby_id)
     
-    # If lobby is empty, delete it
-    if len(lobby['players']) == 0:
-        del lobbies[lobby_id]
-    else:
-        # If host left, assign new host
-        if lobby['host'] == player_id:
-            lobby['host'] = lobby['players'][0]['id']
+    # The lobby is deleted once nobody is left
+    if lobby is not None:
+        if host_changed:
             emit('new_host', {'host_id': lobby['host']}, room=lobby_id)
         
         # Notify others in the lobby
@@ -244,32 +276,26 @@ def leave_lobby_helper(player_id, lobby_id):
     # Notify the player who left
     emit('left_lobby')
     
-    # Broadcast updated lobby list
-    broadcast_lobby_list()
-
-def get_lobby_list():
-    """Get list of available lobbies (not started)"""
-    return [
-        {
-            'id': lobby['id'],
-            'name': lobby['name'],
-            'host': lobby['players'][0]['username'] if lobby['players'] else 'Unknown',
-            'player_count': len(lobby['players']),
-            'board': lobby['board'],
-            'started': lobby['started']
-        }
-        for lobby in lobbies.values()
-        if not lobby['started']  # Only show lobbies that haven't started
-    ]
+    # Update lobby list
+    lobby_list_changed(lobby_id)
 
-def broadcast_lobby_list():
-    """Broadcast updated lobby list to all connected clients"""
-    lobby_list = get_lobby_list()
-    socketio.emit('lobby_list_update', {'lobbies': lobby_list})
+def subscribe_lobby_list(lobby_filter):
+    old_room, room = lobby_list.subscribe(request.sid, lobby_filter)
+    if old_room is not None:
+        leave_room(old_room)
+    join_room(room)
 
-# ============================== GAME API ==============================
+def lobby_list_changed(lobby_id):
+    """Queue a lobby for the next lobby list delta, scheduling one if none is pending."""
+    if lobby_list.touch(lobby_id):
+        socketio.start_background_task(publish_lobby_list)
 
-game_state: GameState | None = None
+@timed('publish_lobby_list')
+def publish_lobby_list():
+    socketio.sleep(LOBBY_LIST_DELAY)
+    lobby_list.flush(lambda room, delta: socketio.emit('lobby_list_delta', delta, room=room))
+
+# ============================== GAME API ==============================
 
 @app.route('/game/<lobby_id>')
 def game(lobby_id):
@@ -277,27 +303,340 @@ def game(lobby_id):
 
 @app.route('/api/game-data/<lobby_id>', methods=['GET'])
 def get_game_data(lobby_id):
-    data = redis_client.get(f"game:{lobby_id}")
-    if not data:
-        return jsonify({'error': 'Game not found'}), 404
-    return data, 200, {'Content-Type': 'application/json'}
+    # Plain requests are not routed by lobby (see the README), so they never take a game over
+    with games.locked(lobby_id):
+        entry = games.read(lobby_id)
+        if entry is None:
+            return jsonify({'error': 'Game not found'}), 404
+        lobby, game_state = entry
+        return jsonify({'lobby': lobby, 'game_state': get_views(game_state).public_view()}), 200
+
+def serve_board_asset(board, name, cache_control='public, no-cache'):
+    asset = board_assets.get(board, name)
+    if asset is None:
+        return jsonify({'error': 'Board not found'}), 404
+    if asset.is_not_modified(request.headers.get('If-None-Match'), request.headers.get('If-Modified-Since')):
+        response = make_response('', 304)
+    else:
+        encoding, body = asset.select_encoding(request.headers.get('Accept-Encoding'))
+        response = make_response(body, 200)
+        response.headers['Content-Type'] = asset.content_type
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    response.headers['ETag'] = asset.etag
+    response.headers['Last-Modified'] = asset.last_modified
+    response.headers['Cache-Control'] = cache_control
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 @app.route('/api/init_board', methods = ['GET'])
-def init_board():
-    with open('static/europe/svg_elements.json', 'r') as f:
-        return f.read(), 200, {'Content-Type': 'application/json'}
+@app.route('/api/init_board/<board>', methods = ['GET'])
+def init_board(board='europe'):
+    return serve_board_asset(board, 'geometry')
+
+@app.route('/api/board/<board>/geometry', methods = ['GET'])
+def board_geometry(board):
+    # Compact binary geometry (see geometry_format.py); the client either asks for
+    # an explicit level of detail or passes its zoom in screen pixels per board unit
+    tolerances = board_assets.lod_tolerances.get(board)
+    if not tolerances:
+        return jsonify({'error': 'Board not found'}), 404
+    lod = request.args.get('lod', type=int)
+    if lod is None:
+        lod = select_lod(tolerances, request.args.get('zoom', 1.0, type=float))
+    if not 0 <= lod < len(tolerances):
+        return jsonify({'error': f'Level of detail must be between 0 and {len(tolerances) - 1}'}), 400
+    return serve_board_asset(board, f'geometry_lod{lod}')
+
+@app.route('/api/board/<board>/tiles', methods = ['GET'])
+def board_geometry_tiles(board):
+    # Index of the board's geometry tiles (see geometry_tiles.py); with a zoom in screen
+    # pixels per board unit, only the tile level to draw at that zoom
+    index = board_assets.tile_indexes.get(board)
+    if index is None:
+        return jsonify({'error': 'Board not found'}), 404
+    zoom = request.args.get('zoom', type=float)
+    if zoom is None:
+        return serve_board_asset(board, 'tile_index')
+    if zoom <= 0:
+        return jsonify({'error': 'Zoom must be positive'}), 400
+    return jsonify({'z': select_zoom(index, zoom), 'version': index['version']}), 200
+
+@app.route('/api/board/<board>/tiles/<int:z>/<int:x>/<int:y>', methods = ['GET'])
+def board_geometry_tile(board, z, x, y):
+    # One tile in the binary geometry format. Clients pass the index version as ?v= so that
+    # the tile can be cached for good: a rebuilt board gets a new version and new URLs
+    index = board_assets.tile_indexes.get(board)
+    if index is None:
+        return jsonify({'error': 'Board not found'}), 404
+    if not (0 <= z < index['zooms'] and 0 <= x < 2 ** z and 0 <= y < 2 ** z):
+        return jsonify({'error': 'Tile not found'}), 404
+    if board_assets.get(board, tile_name(z, x, y)) is None:
+        return '', 204  # nothing is drawn there
+    if request.args.get('v') == index['version']:
+        return serve_board_asset(board, tile_name(z, x, y), TILE_CACHE_CONTROL)
+    return serve_board_asset(board, tile_name(z, x, y))
+
+@app.route('/api/board/<board>/hit', methods = ['GET'])
+def board_hit_test(board):
+    # The city or route drawn at x, y, in the coordinates of the board geometry
+    board_map = board_maps.get(board)
+    if board_map is None:
+        return jsonify({'error': 'Board not found'}), 404
+    x, y = request.args.get('x', type=float), request.args.get('y', type=float)
+    if x is None or y is None:
+        return jsonify({'error': 'x and y are required'}), 400
+    target = board_map.hit_test(x, y)
+    if isinstance(target, Edge):
+        return jsonify({'route': target.index, 'city1': target.node1.name, 'city2': target.node2.name}), 200
+    if isinstance(target, Node):
+        return jsonify({'city': target.name}), 200
+    return jsonify({}), 200
+
+@app.route('/api/board/<board>/elements', methods = ['GET'])
+def board_elements_in(board):
+    # Ids of the geometry elements in the viewport x0, y0 - x1, y1
+    board_map = board_maps.get(board)
+    if board_map is None:
+        return jsonify({'error': 'Board not found'}), 404
+    bounds = [request.args.get(name, type=float) for name in ('x0', 'y0', 'x1', 'y1')]
+    if None in bounds:
+        return jsonify({'error': 'x0, y0, x1 and y1 are required'}), 400
+    return jsonify({'ids': board_map.elements_in(*bounds)}), 200
 
 @app.route('/api/get-game-state', methods = ['GET'])
 def get_game_state():
-    #game_id = request.args.get('game_id')
-    if game_state is None:
+    lobby_id = request.args.get('lobby_id')
+    if not lobby_id:
         return jsonify({'error': 'Game not initialized'}), 400
-    return jsonify(game_state.to_dict()), 200
+    since = request.args.get('since', type=int)
+    player_since = request.args.get('player_since', type=int)
+    with games.locked(lobby_id):
+        entry = games.read(lobby_id)
+        if entry is None:
+            return jsonify({'error': 'Game not initialized'}), 400
+        game_state = entry[1]
+        return jsonify({
+            'public': public_sync_message(game_state, since),
+            'private': private_sync_message(game_state, session.get('player_id'), player_since)
+        }), 200
+
+def sync_message(version, since, patch, snapshot):
+    """A patch from the client's last seen version, or a full snapshot if it is too far behind."""
+    if patch is None:
+        return {'type': 'snapshot', 'version': version, 'state': snapshot()}
+    return {'type': 'patch', 'from_version': since, 'version': version, 'patch': patch}
+
+def public_sync_message(game_state, since=None):
+    views = get_views(game_state)
+    patch = views.public_patch(since) if since is not None else None
+    return sync_message(game_state.version, since, patch, views.public_view)
+
+def private_sync_message(game_state, player_id, since=None):
+    views = get_views(game_state)
+    if player_id not in game_state.players:
+        return None
+    patch = views.private_patches(since) if since is not None else None
+    if patch is not None:
+        patch = patch.get(player_id, [])
+    # Versioned by the player's own last change, see GameViews.private_versions
+    return sync_message(views.private_version(player_id), since, patch, lambda: views.private_view(player_id))
+
+def player_room(player_id):
+    return f"player:{player_id}"
+
+def commit_game_changes(lobby_id, game_state, since):
+    """Commit pending changes and queue them for Redis, or write a finished game out and drop
+    it from memory. Returns what to emit once the game is released: one public patch for the
+    game room and one private patch for each player whose own view changed, from the version
+    their view last changed at."""
+    views = get_views(game_state)
+    previous = dict(views.private_versions) if views.version == since else {}
+    game_state.commit()
+    if game_state.version == since:
+        return []
+    games.mark_dirty(lobby_id)
+    if game_state.game_over:
+        # Written out now rather than at eviction, nothing changes a finished game
+        games.release(lobby_id)
+    messages = [('game_update', public_sync_message(game_state, since), lobby_id)]
+    private_patches = views.private_patches(since)
+    for player_id in game_state.players:
+        if private_patches is None or player_id in private_patches:
+            message = private_sync_message(game_state, player_id, previous.get(player_id))
+            messages.append(('player_update', message, player_room(player_id)))
+    return messages
+
+def emit_messages(messages):
+    # Emits go through the message queue, so they are sent with no game held
+    for event, message, room in messages:
+        socketio.emit(event, message, room=room)
+
+@socketio.on('rejoin_game')
+@timed('rejoin_game')
+def handle_rejoin_game(data):
+    lobby_id = data.get('lobby_id')
+    player_id = session.get('player_id')
+    with games.locked(lobby_id):
+        game_state = games.get(lobby_id)
+        if game_state is not None:
+            messages = game_sync_messages(game_state, player_id, data.get('version'), data.get('player_version'))
+    if game_state is None:
+        emit('error', {'message': 'Game not found'})
+        return
+    join_room(lobby_id)
+    join_room(player_room(player_id))
+    for event, message in messages:
+        emit(event, message)
+    # Bots move in the process hosting the game, which is this one once players are here
+    schedule_bot_turn(lobby_id)
+
+@socketio.on('sync_game')
+@timed('sync_game')
+def handle_sync_game(data):
+    lobby_id = data.get('lobby_id')
+    with games.locked(lobby_id):
+        game_state = games.get(lobby_id)
+        if game_state is not None:
+            messages = game_sync_messages(game_state, session.get('player_id'), data.get('version'), data.get('player_version'))
+    if game_state is None:
+        emit('error', {'message': 'Game not found'})
+        return
+    for event, message in messages:
+        emit(event, message)
+
+def game_sync_messages(game_state, player_id, since, player_since):
+    messages = [('game_update', public_sync_message(game_state, since))]
+    private_message = private_sync_message(game_state, player_id, player_since)
+    if private_message is not None:
+        messages.append(('player_update', private_message))
+    return messages
+
+@socketio.on('game_command')
+@timed('game_command')
+def handle_game_command(data):
+    lobby_id = data.get('lobby_id')
+    command = dict(data, player=session.get('player_id'))
+    # Commands are validated and applied in constant time, so they are simply serialized per game
+    with games.locked(lobby_id):
+        game_state = games.get(lobby_id)
+        if game_state is None:
+            error = 'Game not found'
+        else:
+            since = game_state.version
+            events, error = GameEngine(game_state).apply(command)
+        if error is None:
+            messages = commit_game_changes(lobby_id, game_state, since)
+            messages.append(('game_events', {'version': game_state.version, 'events': events}, lobby_id))
+            observe_command(game_state, command)
+    if error is not None:
+        emit('error', {'message': error})
+        return
+    emit_messages(messages)
+    schedule_bot_turn(lobby_id)
+
+def observe_command(game_state, command):
+    """Let the bots' searches follow the game."""
+    for player in game_state.players.values():
+        if isinstance(player, AIPlayer):
+            player.observe(command)
+
+def run_cpu_bound(func, *args):
+    """Under gevent, run func on a real thread so the other connections keep being served."""
+    if ASYNC_MODE == 'gevent':
+        from gevent import get_hub
+        return get_hub().threadpool.apply(func, args)
+    return func(*args)
+
+def schedule_bot_turn(lobby_id):
+    with games.locked(lobby_id):
+        game_state = games.get(lobby_id)
+        bot_to_move = game_state is not None and not game_state.game_over and \
+            isinstance(game_state.players[game_state.current_player_turn], AIPlayer)
+    if not bot_to_move:
+        return
+    with bot_turns_lock:
+        if lobby_id in bot_turns:
+            return
+        bot_turns.add(lobby_id)
+    socketio.start_background_task(play_bot_turn, lobby_id)
+
+@timed('bot_turn')
+def play_bot_turn(lobby_id):
+    try:
+        played = take_bot_turn(lobby_id)
+    finally:
+        with bot_turns_lock:
+            bot_turns.discard(lobby_id)
+    if played:
+        schedule_bot_turn(lobby_id)
+
+def take_bot_turn(lobby_id):
+    """Search on a snapshot with the game released, then apply the move unless the game moved
+    on in the meantime. Returns whether a move was made."""
+    with games.locked(lobby_id):
+        game_state = games.get(lobby_id)
+        if game_state is None or game_state.game_over:
+            return False
+        player_id = game_state.current_player_turn
+        player = game_state.players[player_id]
+        if not isinstance(player, AIPlayer):
+            return False
+        if player.bot is None:
+            player.bot = MCTSBot(budget=BOT_MOVE_BUDGET, workers=BOT_WORKERS)
+        since = game_state.version
+        snapshot = game_state.clone()
+    command = run_cpu_bound(player.choose_command, snapshot, player_id)
+    with games.locked(lobby_id):
+        if games.get(lobby_id) is not game_state or game_state.version != since:
+            return False
+        engine = GameEngine(game_state)
+        events, error = engine.apply(command) if command is not None else ([], None)
+        if command is None or error is not None:
+            command = player.bot.fallback(game_state, player_id)
+            if command is None:
+                return False  # nothing left to draw, the seat is stuck
+            events, error = engine.apply(command)
+            if error is not None:
+                return False
+        messages = commit_game_changes(lobby_id, game_state, since)
+        messages.append(('game_events', {'version': game_state.version, 'events': events}, lobby_id))
+        observe_command(game_state, command)
+    emit_messages(messages)
+    return True
 
 @socketio.on('get_player_data')
+@timed('get_player_data')
 def get_player_data(data):
     pass
     # TODO: Fetch player data from game state using player_id
 
+# ============================== METRICS ==============================
+
+@app.before_request
+def start_request_timer():
+    g.request_start = time.perf_counter()
+    g.request_event = f"http:{request.url_rule.rule if request.url_rule else 'unmatched'}"
+    g.request_event_token = metrics.current_event.set(g.request_event)
+
+@app.after_request
+def record_response_size(response):
+    if response.content_length is not None:
+        metrics.PAYLOAD_BYTES.observe(response.content_length, g.request_event, 'out')
+    return response
+
+@app.teardown_request
+def record_request_time(exception=None):
+    if 'request_start' in g:
+        metrics.HANDLER_SECONDS.observe(time.perf_counter() - g.request_start, g.request_event)
+        metrics.current_event.reset(g.request_event_token)
+
+@app.route('/metrics')
+def prometheus_metrics():
+    """This process's metrics; scrape every server process."""
+    response = make_response(metrics.render(), 200)
+    response.headers['Content-Type'] = 'text/plain; version=0.0.4; charset=utf-8'
+    return response
+
 if __name__ == '__main__':
-    socketio.run(app, debug=True, host='0.0.0.0', port=5000, allow_unsafe_werkzeug=True)
+    socketio.run(app, debug=True, host='0.0.0.0', port=int(os.environ.get('PORT', 5000)), allow_unsafe_werkzeug=True)
@@ -0,0 +1,228 @@
+"""Measure the game core's hot functions on the Europe board and on boards 10x and 100x its
+size, and check them against a stored baseline.
+
+The larger boards are copies of Europe chained together by a few extra routes, with every
+city, ticket and SVG element repeated once per copy, so they keep its shape and only grow.
+Each function is timed for ops/s (best of a few rounds), then run once more under
+tracemalloc for the peak memory it allocates. A function fails the check when its ops/s
+drop, or its peak allocations grow, by more than the threshold against the baseline.
+
+extract_svg_elements takes about a second per copy of the board, so it only runs up to
+10x unless --svg-max-scale allows more.
+
+Baselines depend on the machine; save one with --save-baseline on the machine that runs
+the checks. Run from the repository root:
+    python -m benchmarks.bench_core [--scales 1,10,100] [--only NAME] [--threshold 0.3]
+        [--baseline FILE] [--save-baseline]
+"""
+import argparse
+import json
+import os
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+from functools import partial
+
+from board_state import CardColor, parse_graph
+from game_setup import BoardTemplate, GameState, PlayerColor, board_files, setup_game
+from legal_moves import claimable_routes, legal_commands
+from svg_parser import extract_svg_elements
+
+BASELINE = os.path.join(os.path.dirname(__file__), 'baseline_core.json')
+SVG_FILE = 'static/europe/svg/board.svg'
+SCALES = (1, 10, 100)
+SVG_MAX_SCALE = 10
+BRIDGES = 3  # routes joining each copy of the board to the next
+PLAYERS = 5
+
+class Board:
+    """Board files at one scale, and the game objects the functions run on."""
+    def __init__(self, directory, scale, svg_scale):
+        self.scale = scale
+        if scale == 1:
+            self.files = board_files('europe')
+            self.svg_file = SVG_FILE
+        else:
+            self.files = write_scaled_board(directory, scale)
+            self.svg_file = write_scaled_svg(directory, scale) if scale <= svg_scale else None
+        self.cities_file, self.connections_file, self.tickets_file = self.files
+        self.template = BoardTemplate.load(*self.files)
+        self.graph = self.template.graph
+        self.connections = [(edge.node1.name, edge.node2.name) for edge in self.graph.edge_list]
+        self.player_info = [(f"player{i}", color) for i, color in enumerate(list(PlayerColor)[:PLAYERS])]
+        self.game_state = setup_game(*self.files, self.player_info, seed=0)
+        # Mid-game: a hand of cards and a third of the routes claimed
+        rng = random.Random(0)
+        self.player = self.game_state.players['player0']
+        for color in CardColor:
+            self.player.cards[color] = rng.randrange(5)
+        names = list(self.game_state.players)
+        for index in rng.sample(range(len(self.graph.edge_list)), len(self.graph.edge_list) // 3):
+            self.game_state.edge_owners[index] = rng.choice(names)
+
+def scaled_name(name, copy):
+    return name if copy == 0 else f"{name}_{copy}"
+
+def write_scaled_board(directory, scale):
+    """Europe repeated scale times, copy k+1 joined to copy k between the same cities."""
+    with open(board_files('europe')[0]) as f:
+        cities = f.read().split()
+    with open(board_files('europe')[1]) as f:
+        connections = [line.split() for line in f.read().splitlines() if line.strip()]
+    with open(board_files('europe')[2]) as f:
+        tickets = [line.split() for line in f.read().splitlines() if line.strip()]
+    bridges = random.Random(scale).sample(cities, BRIDGES)
+    files = [os.path.join(directory, f"{name}_{scale}.txt") for name in ('cities', 'connections', 'tickets')]
+    with open(files[0], 'w') as f:
+        f.writelines(f"{scaled_name(city, copy)}\n" for copy in range(scale) for city in cities)
+    with open(files[1], 'w') as f:
+        for copy in range(scale):
+            for city1, city2, *rest in connections:
+                f.write(' '.join([scaled_name(city1, copy), scaled_name(city2, copy), *rest]) + '\n')
+            if copy > 0:
+                f.writelines(f"{scaled_name(city, copy - 1)} {scaled_name(city, copy)} 4\n" for city in bridges)
+    with open(files[2], 'w') as f:
+        for copy in range(scale):
+            for city1, city2, *rest in tickets:
+                f.write(' '.join([scaled_name(city1, copy), scaled_name(city2, copy), *rest]) + '\n')
+    return tuple(files)
+
+def write_scaled_svg(directory, scale):
+    """The Europe SVG with its content repeated scale times, side by side."""
+    with open(SVG_FILE) as f:
+        svg = f.read()
+    body_start = svg.index('>', svg.index('<svg')) + 1
+    body_end = svg.rindex('</svg>')
+    head, body = svg[:body_start], svg[body_start:body_end]
+    path = os.path.join(directory, f"board_{scale}.svg")
+    with open(path, 'w') as f:
+        f.write(head)
+        for copy in range(scale):
+            f.write(f'<g transform="translate({copy % 10 * 700} {copy // 10 * 500})">{body}</g>')
+        f.write('</svg>')
+    return path
+
+def parse_tickets(board):
+    game_state = GameState(board.template)
+    return partial(game_state.parse_tickets, board.tickets_file)
+
+def check_every_route(board):
+    check = board.player.check_can_claim_route
+    edges = board.graph.edge_list
+    def run():
+        for edge in edges:
+            check(edge)
+    return run
+
+def get_every_edge(board):
+    get_edge = board.graph.get_edge
+    connections = board.connections
+    def run():
+        for city1, city2 in connections:
+            get_edge(city1, city2)
+    return run
+
+# name -> function of a Board returning the call to measure
+CASES = {
+    'parse_graph': lambda board: partial(parse_graph, board.cities_file, board.connections_file),
+    'setup_game': lambda board: partial(setup_game, *board.files, board.player_info),
+    'GameState.parse_tickets': parse_tickets,
+    'GameState.to_dict': lambda board: board.game_state.to_dict,
+    'Player.check_can_claim_route': check_every_route,  # once per route of the board
+    'Graph.get_edge': get_every_edge,  # once per route of the board
+    'claimable_routes': lambda board: partial(claimable_routes, board.game_state, 'player0'),
+    'legal_commands': lambda board: partial(legal_commands, board.game_state, 'player0'),
+    'extract_svg_elements': lambda board: partial(extract_svg_elements, board.svg_file) if board.svg_file else None,
+}
+
+def measure(func, rounds, min_time):
+    """Best ops/s over rounds of at least min_time each, and the peak memory of one call."""
+    func()  # warm up
+    best = 0
+    for _ in range(rounds):
+        runs = 0
+        start = time.perf_counter()
+        while True:
+            func()
+            runs += 1
+            elapsed = time.perf_counter() - start
+            if elapsed >= min_time:
+                break
+        best = max(best, runs / elapsed)
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return {'ops_per_sec': round(best, 2), 'peak_kib': round(peak / 1024, 1)}
+
+def check(results, baseline, threshold):
+    """Regressions past the threshold, as messages."""
+    failures = []
+    for name, by_scale in results.items():
+        for scale, result in by_scale.items():
+            expected = baseline.get(name, {}).get(scale)
+            if expected is None:
+                continue
+            if result['ops_per_sec'] < expected['ops_per_sec'] * (1 - threshold):
+                failures.append(f"{name} at {scale}x: {result['ops_per_sec']:.1f} ops/s, "
+                                f"baseline {expected['ops_per_sec']:.1f}")
+            if result['peak_kib'] > expected['peak_kib'] * (1 + threshold) + 1:
+                failures.append(f"{name} at {scale}x: {result['peak_kib']:.1f} KiB peak, "
+                                f"baseline {expected['peak_kib']:.1f}")
+    return failures
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default=','.join(map(str, SCALES)))
+    parser.add_argument('--svg-max-scale', type=int, default=SVG_MAX_SCALE)
+    parser.add_argument('--only', action='append', help="run only the functions with this in their name")
+    parser.add_argument('--rounds', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.1, help="seconds per round")
+    parser.add_argument('--threshold', type=float, default=0.3, help="allowed regression, as a fraction")
+    parser.add_argument('--baseline', default=BASELINE)
+    parser.add_argument('--save-baseline', action='store_true', help="store these results as the baseline")
+    args = parser.parse_args()
+
+    scales = [int(scale) for scale in args.scales.split(',')]
+    cases = {name: case for name, case in CASES.items()
+             if not args.only or any(only in name for only in args.only)}
+    results = {name: {} for name in cases}
+    with tempfile.TemporaryDirectory() as directory:
+        for scale in scales:
+            board = Board(directory, scale, args.svg_max_scale)
+            print(f"{scale}x: {len(board.graph.nodes)} cities, {len(board.graph.edge_list)} routes, "
+                  f"{len(board.template.tickets) + len(board.template.long_tickets)} tickets")
+            for name, case in cases.items():
+                func = case(board)
+                if func is not None:
+                    results[name][str(scale)] = measure(func, args.rounds, args.min_time)
+
+    print(f"\n{'':<30}" + ''.join(f"{f'{scale}x ops/s':>14}{'peak KiB':>11}" for scale in scales))
+    for name, by_scale in results.items():
+        row = ''
+        for scale in scales:
+            result = by_scale.get(str(scale))
+            row += f"{result['ops_per_sec']:>14.1f}{result['peak_kib']:>11.1f}" if result else f"{'-':>14}{'-':>11}"
+        print(f"{name:<30}{row}")
+
+    if args.save_baseline:
+        with open(args.baseline, 'w') as f:
+            json.dump(results, f, indent=2)
+        print(f"\nBaseline saved to {args.baseline}")
+        return
+    if not os.path.isfile(args.baseline):
+        print(f"\nNo baseline at {args.baseline}; save one with --save-baseline")
+        return
+    with open(args.baseline) as f:
+        failures = check(results, json.load(f), args.threshold)
+    if failures:
+        print(f"\nRegressed by more than {args.threshold:.0%}:")
+        for failure in failures:
+            print(f"  {failure}")
+        sys.exit(1)
+    print(f"\nWithin {args.threshold:.0%} of the baseline")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,94 @@
+"""Measure longest_path latency on random dense route ownership.
+
+Each trial gives one player up to 45 trains' worth of routes, grown as a connected region
+from a random city (the worst case for the search: many cycles, double routes included),
+or scattered over the whole board. Results are checked against a plain exhaustive search.
+
+Run from the repository root:
+    python -m benchmarks.bench_longest_path [board] [--trials N] [--seed N]
+"""
+import argparse
+import random
+import time
+
+from game_setup import BoardTemplate, board_files
+from longest_path import longest_path
+
+TRAINS = 45
+
+def dense_ownership(graph, rng, trains=TRAINS):
+    """Routes of a connected region around a random city, up to the train budget."""
+    start = rng.randrange(len(graph.node_list))
+    frontier = [edge for _, edge in graph.neighbours(start)]
+    owned, seen = [], set()
+    while frontier and trains > 0:
+        edge = frontier.pop(rng.randrange(len(frontier)))
+        if edge in seen:
+            continue
+        seen.add(edge)
+        if graph.edge_length[edge] > trains:
+            continue
+        owned.append(edge)
+        trains -= graph.edge_length[edge]
+        for node in (graph.edge_node1[edge], graph.edge_node2[edge]):
+            frontier.extend(e for _, e in graph.neighbours(node) if e not in seen)
+    return owned
+
+def scattered_ownership(graph, rng, trains=TRAINS):
+    edges = list(range(len(graph.edge_list)))
+    rng.shuffle(edges)
+    owned = []
+    for edge in edges:
+        if graph.edge_length[edge] <= trains:
+            owned.append(edge)
+            trains -= graph.edge_length[edge]
+    return owned
+
+def exhaustive(graph, edge_ids):
+    """Reference: try every start city and every trail, no pruning or memoization."""
+    edge_ids = list(edge_ids)
+    def extend(node, used):
+        best = 0
+        for edge in edge_ids:
+            if edge in used:
+                continue
+            a, b = graph.edge_node1[edge], graph.edge_node2[edge]
+            if node in (a, b):
+                best = max(best, graph.edge_length[edge] + extend(b if node == a else a, used | {edge}))
+        return best
+    nodes = {graph.edge_node1[e] for e in edge_ids} | {graph.edge_node2[e] for e in edge_ids}
+    return max((extend(node, frozenset()) for node in nodes), default=0)
+
+def run(graph, make_ownership, rng, trials, check):
+    latencies = []
+    for trial in range(trials):
+        owned = make_ownership(graph, rng)
+        start = time.perf_counter()
+        length = longest_path(graph, owned)
+        latencies.append(time.perf_counter() - start)
+        if trial < check:
+            # The exhaustive search is only feasible on a prefix of the routes
+            subset = owned[:14]
+            assert longest_path(graph, subset) == exhaustive(graph, subset), subset
+    latencies.sort()
+    return latencies
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('board', nargs='?', default='europe')
+    parser.add_argument('--trials', type=int, default=2000)
+    parser.add_argument('--check', type=int, default=50, help='trials verified against the exhaustive search')
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args()
+
+    graph = BoardTemplate.load(*board_files(args.board)).graph
+    rng = random.Random(args.seed)
+    print(f"{args.board}, {args.trials} trials, {TRAINS} trains")
+    for label, make_ownership in (("dense    ", dense_ownership), ("scattered", scattered_ownership)):
+        latencies = run(graph, make_ownership, rng, args.trials, args.check)
+        mean = sum(latencies) / len(latencies)
+        p99 = latencies[int(len(latencies) * 0.99) - 1]
+        print(f"  {label}  mean {mean * 1e3:7.3f} ms  p99 {p99 * 1e3:7.3f} ms  max {latencies[-1] * 1e3:7.3f} ms")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,56 @@
+"""Measure setup_game throughput and per-game memory with and without the shared BoardTemplate.
+
+Run from the repository root:
+    python -m benchmarks.bench_setup_game [board] [--games N] [--players N]
+"""
+import argparse
+import time
+import tracemalloc
+
+from game_setup import BoardTemplate, PlayerColor, board_files, setup_game
+
+def setup_game_uncached(cities_file, connections_file, tickets_file, player_info):
+    """What setup_game used to do: re-read and re-parse the board files for every game."""
+    BoardTemplate._cache.clear()
+    return setup_game(cities_file, connections_file, tickets_file, player_info)
+
+def throughput(func, files, player_info, games):
+    start = time.perf_counter()
+    for _ in range(games):
+        func(*files, player_info)
+    elapsed = time.perf_counter() - start
+    return games / elapsed, elapsed / games
+
+def memory_per_game(func, files, player_info, games):
+    kept = []
+    tracemalloc.start()
+    before = tracemalloc.take_snapshot()
+    for _ in range(games):
+        kept.append(func(*files, player_info))
+    after = tracemalloc.take_snapshot()
+    tracemalloc.stop()
+    return sum(stat.size_diff for stat in after.compare_to(before, 'filename')) / games
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('board', nargs='?', default='europe')
+    parser.add_argument('--games', type=int, default=2000)
+    parser.add_argument('--players', type=int, default=5)
+    args = parser.parse_args()
+
+    files = board_files(args.board)
+    player_info = [(f"player{i}", color) for i, color in enumerate(list(PlayerColor)[:args.players])]
+    BoardTemplate.load(*files)  # warm the cache
+
+    print(f"{args.board}, {args.players} players, {args.games} games")
+    for label, func, games in (
+        ("uncached (before)", setup_game_uncached, max(args.games // 20, 1)),
+        ("shared template  ", setup_game, args.games),
+    ):
+        rate, latency = throughput(func, files, player_info, games)
+        memory = memory_per_game(func, files, player_info, min(games, 200))
+        BoardTemplate.load(*files)
+        print(f"  {label}  {rate:10.0f} games/s  {latency * 1e6:9.1f} us/game  {memory / 1024:7.1f} KiB/game")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,78 @@
+"""Time svg_parser.extract_svg_elements against the original per-segment implementation.
+
+Run from the repository root:
+    python -m benchmarks.bench_svg_parser [path/to/board.svg] [--repeat N]
+"""
+import argparse
+import json
+import time
+
+from svgelements import SVG, Ellipse, Path
+
+import svg_parser
+
+def extract_svg_elements_reference(svg_path):
+    """The original pipeline: Python-level ring walking and a separate drawing.bbox() pass."""
+    elements_data = []
+    drawing = SVG.parse(svg_path)
+    bbox = drawing.bbox()
+    for element in drawing.elements():
+        if type(element) not in [Ellipse, Path]:
+            continue
+        bodies = []
+        holes = []
+        attributes = {
+            'fill': str(element.fill),
+            'stroke': str(element.stroke),
+            'stroke_width': float(element.stroke_width)
+        }
+        if isinstance(element, Ellipse):
+            attributes['centre'] = (element.cx, element.cy)
+            attributes['radius'] = (element.rx, element.ry)
+        elif isinstance(element, Path):
+            for sub in element.as_subpaths():
+                vertices = svg_parser.subpath_vertices(sub)
+                if len(vertices) < 4:
+                    continue
+                if svg_parser.signed_area(vertices) > 0:
+                    bodies.append(vertices)
+                else:
+                    holes.append(vertices)
+        elements_data.append({
+            'type': type(element).__name__,
+            'id': element.id,
+            'bodies': bodies,
+            'holes': holes,
+            'attributes': attributes
+        })
+    return elements_data, bbox
+
+def best_of(func, svg_path, repeat):
+    best = float('inf')
+    result = None
+    for _ in range(repeat):
+        start = time.perf_counter()
+        result = func(svg_path)
+        best = min(best, time.perf_counter() - start)
+    return best, result
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('svg_path', nargs='?', default='static/europe/svg/board.svg')
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    parse_time, _ = best_of(SVG.parse, args.svg_path, args.repeat)
+    before, (old_elements, old_bbox) = best_of(extract_svg_elements_reference, args.svg_path, args.repeat)
+    after, (new_elements, new_bbox) = best_of(svg_parser.extract_svg_elements, args.svg_path, args.repeat)
+
+    same = (json.dumps(old_elements) == json.dumps(new_elements)
+            and all(abs(a - b) < 1e-9 for a, b in zip(old_bbox, new_bbox)))
+    print(f"{args.svg_path}: {len(new_elements)} elements, best of {args.repeat}")
+    print(f"  SVG.parse alone  {parse_time * 1000:8.1f} ms")
+    print(f"  before           {before * 1000:8.1f} ms  ({(before - parse_time) * 1000:.1f} ms after parsing)")
+    print(f"  after            {after * 1000:8.1f} ms  ({(after - parse_time) * 1000:.1f} ms after parsing)")
+    print(f"  speedup          {before / after:8.2f}x  (identical output: {same})")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,333 @@
+"""Load-test one server process with simulated players.
+
+Every table is one lobby played out by its own python-socketio clients: they connect and
+set a username, the host creates a lobby, the others join it, the host starts the game,
+and from then on every player polls /api/game-data and /api/init_board until the run
+ends. Tables start spread over the ramp-up time.
+
+Socket.IO events are timed from the emit to the event the server answers with, HTTP
+requests until the whole body is read. Server CPU and RSS are sampled from /proc, so the
+server has to run on this machine: started by this script (--spawn runs serve.py) or
+given by --pid. The report is JSON; --compare prints the change against an earlier one.
+
+Needs redis-server running and python-socketio's client extras (requests,
+websocket-client). Run from the repository root:
+    python -m benchmarks.load_test [--url URL] [--spawn | --pid PID] [--tables N] [--players N]
+        [--duration S] [--output FILE] [--compare FILE]
+"""
+import argparse
+import json
+import os
+import queue
+import random
+import subprocess
+import sys
+import threading
+import time
+import urllib.error
+import urllib.request
+from collections import defaultdict
+from datetime import datetime, timezone
+from urllib.parse import urlparse
+
+import socketio
+
+REPLY_TIMEOUT = 10  # seconds to wait for the server to answer an event
+SERVER_START_TIMEOUT = 30
+PERCENTILES = (50, 95, 99)
+
+class Recorder:
+    """Latencies and errors per event type, shared by all clients."""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+
+    def time(self, event, start):
+        with self.lock:
+            self.latencies[event].append((time.perf_counter() - start) * 1000)
+
+    def error(self, event):
+        with self.lock:
+            self.errors[event] += 1
+
+    def summary(self, elapsed):
+        events = {}
+        for event in sorted(set(self.latencies) | set(self.errors)):
+            latencies = sorted(self.latencies[event])
+            events[event] = {
+                'count': len(latencies),
+                'errors': self.errors[event],
+                'per_second': round(len(latencies) / elapsed, 2),
+                **{f"p{q}_ms": round(percentile(latencies, q), 2) for q in PERCENTILES},
+                'max_ms': round(latencies[-1], 2) if latencies else None,
+            }
+        return events
+
+def percentile(ordered, q):
+    """Nearest-rank percentile of a sorted list."""
+    if not ordered:
+        return float('nan')
+    return ordered[max(0, -(-len(ordered) * q // 100) - 1)]
+
+class Player:
+    def __init__(self, url, recorder, name):
+        self.url = url
+        self.recorder = recorder
+        self.name = name
+        self.replies = queue.Queue()
+        self.etag = None
+        self.client = socketio.Client(reconnection=False)
+        for event in ('username_set', 'lobby_joined', 'game_started', 'error'):
+            self.client.on(event, self.handler(event))
+
+    def handler(self, event):
+        return lambda data=None: self.replies.put((event, data))
+
+    def connect(self):
+        start = time.perf_counter()
+        self.client.connect(self.url, transports=['websocket'], wait_timeout=REPLY_TIMEOUT)
+        self.recorder.time('connect', start)
+
+    def wait_for(self, reply):
+        deadline = time.monotonic() + REPLY_TIMEOUT
+        while True:
+            event, data = self.replies.get(timeout=max(deadline - time.monotonic(), 0))
+            if event == reply:
+                return data
+            if event == 'error':
+                raise RuntimeError(data.get('message') if data else 'error')
+
+    def call(self, event, data, reply):
+        """Emit an event and wait for the server's answer, timing the round trip."""
+        start = time.perf_counter()
+        self.client.emit(event, data)
+        try:
+            result = self.wait_for(reply)
+        except (queue.Empty, RuntimeError):
+            self.recorder.error(event)
+            raise
+        self.recorder.time(event, start)
+        return result
+
+    def get(self, name, path):
+        headers = {'Accept-Encoding': 'gzip'}
+        if name == 'init_board' and self.etag:
+            headers['If-None-Match'] = self.etag  # as a browser revalidates its cached board
+        start = time.perf_counter()
+        try:
+            with urllib.request.urlopen(urllib.request.Request(self.url + path, headers=headers),
+                                        timeout=REPLY_TIMEOUT) as response:
+                response.read()
+                if name == 'init_board':
+                    self.etag = response.headers.get('ETag')
+        except urllib.error.HTTPError as e:
+            if e.code != 304:
+                self.recorder.error(name)
+                return
+        except OSError:
+            self.recorder.error(name)
+            return
+        self.recorder.time(name, start)
+
+    def poll(self, lobby_id, deadline, interval, rng):
+        while time.monotonic() < deadline:
+            self.get('game_data', f"/api/game-data/{lobby_id}")
+            self.get('init_board', '/api/init_board')
+            time.sleep(interval * rng.uniform(0.5, 1.5))
+
+    def close(self):
+        try:
+            self.client.disconnect()
+        except Exception:
+            pass
+
+def play_table(table, args, recorder, deadline, failures):
+    rng = random.Random(args.seed * 1000 + table)
+    players = [Player(args.url, recorder, f"load-{table}-{seat}") for seat in range(args.players)]
+    try:
+        for player in players:
+            player.connect()
+            player.call('set_username', {'username': player.name}, 'username_set')
+        host = players[0]
+        lobby_id = host.call('create_lobby', {'name': f"Load test {table}", 'board': args.board},
+                             'lobby_joined')['lobby']['id']
+        for player in players[1:]:
+            player.call('join_lobby', {'lobby_id': lobby_id}, 'lobby_joined')
+        host.call('start_game', {'lobby_id': lobby_id, 'bots': args.bots}, 'game_started')
+        for player in players[1:]:
+            player.wait_for('game_started')
+        pollers = [threading.Thread(target=player.poll, args=(lobby_id, deadline, args.interval, rng), daemon=True)
+                   for player in players]
+        for poller in pollers:
+            poller.start()
+        for poller in pollers:
+            poller.join()
+    except Exception as e:
+        failures.append(f"table {table}: {type(e).__name__}: {e}")
+    finally:
+        for player in players:
+            player.close()
+
+class ServerSampler(threading.Thread):
+    """CPU use and resident memory of the server process, read from /proc once a period."""
+    def __init__(self, pid, period):
+        super().__init__(daemon=True)
+        self.pid = pid
+        self.period = period
+        self.samples = []
+        self.stopped = threading.Event()
+        self.ticks = os.sysconf('SC_CLK_TCK')
+        self.page_size = os.sysconf('SC_PAGE_SIZE')
+
+    def read(self):
+        with open(f"/proc/{self.pid}/stat") as f:
+            fields = f.read().rsplit(')', 1)[1].split()
+        with open(f"/proc/{self.pid}/statm") as f:
+            rss_pages = int(f.read().split()[1])
+        return (int(fields[11]) + int(fields[12])) / self.ticks, rss_pages * self.page_size
+
+    def run(self):
+        start = time.monotonic()
+        cpu, _ = self.read()
+        last = start
+        while not self.stopped.wait(self.period):
+            try:
+                now_cpu, rss = self.read()
+            except OSError:
+                return  # the server exited
+            now = time.monotonic()
+            self.samples.append({
+                't': round(now - start, 2),
+                'cpu_percent': round(100 * (now_cpu - cpu) / (now - last), 1),
+                'rss_mb': round(rss / 2**20, 1),
+            })
+            cpu, last = now_cpu, now
+
+    def summary(self):
+        if not self.samples:
+            return {'samples': []}
+        return {
+            'cpu_percent_mean': round(sum(s['cpu_percent'] for s in self.samples) / len(self.samples), 1),
+            'cpu_percent_max': max(s['cpu_percent'] for s in self.samples),
+            'rss_mb_max': max(s['rss_mb'] for s in self.samples),
+            'samples': self.samples,
+        }
+
+def spawn_server(url):
+    address = urlparse(url)
+    server = subprocess.Popen([sys.executable, 'serve.py', '--host', address.hostname, '--port', str(address.port or 80)])
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if server.poll() is not None:
+            raise SystemExit(f"serve.py exited with code {server.returncode}")
+        try:
+            urllib.request.urlopen(url + '/api/init_board', timeout=1).read()
+            return server
+        except OSError:
+            time.sleep(0.2)
+    server.terminate()
+    raise SystemExit(f"serve.py did not answer on {url} within {SERVER_START_TIMEOUT} s")
+
+def current_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def run(args):
+    recorder = Recorder()
+    server = spawn_server(args.url) if args.spawn else None
+    pid = server.pid if server else args.pid
+    sampler = ServerSampler(pid, args.sample_period) if pid else None
+    failures = []
+    try:
+        if sampler:
+            sampler.start()
+        start = time.monotonic()
+        deadline = start + args.ramp + args.duration
+        tables = []
+        for table in range(args.tables):
+            tables.append(threading.Thread(target=play_table, args=(table, args, recorder, deadline, failures)))
+            tables[-1].start()
+            time.sleep(args.ramp / args.tables)
+        for thread in tables:
+            thread.join()
+        elapsed = time.monotonic() - start
+    finally:
+        if sampler:
+            sampler.stopped.set()
+            sampler.join()
+        if server:
+            server.terminate()
+            server.wait()
+    return {
+        'commit': current_commit(),
+        'started': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+        'config': {key: getattr(args, key) for key in
+                   ('url', 'tables', 'players', 'bots', 'board', 'duration', 'ramp', 'interval', 'seed')},
+        'clients': args.tables * args.players,
+        'elapsed_s': round(elapsed, 2),
+        'failed_tables': failures,
+        'events': recorder.summary(elapsed),
+        'server': sampler.summary() if sampler else None,
+    }
+
+def print_report(report):
+    print(f"{report['clients']} clients at {report['config']['tables']} tables for {report['elapsed_s']} s, "
+          f"commit {report['commit']}")
+    print(f"{'event':<14}{'count':>8}{'errors':>8}{'per s':>9}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for event, stats in report['events'].items():
+        print(f"{event:<14}{stats['count']:>8}{stats['errors']:>8}{stats['per_second']:>9}"
+              f"{stats['p50_ms']:>9}{stats['p95_ms']:>9}{stats['p99_ms']:>9}")
+    server = report['server']
+    if server and server['samples']:
+        print(f"server: CPU {server['cpu_percent_mean']}% mean, {server['cpu_percent_max']}% max; "
+              f"RSS {server['rss_mb_max']} MB max")
+    for failure in report['failed_tables']:
+        print(failure)
+
+def print_comparison(old, new):
+    print(f"change from {old.get('commit')} to {new.get('commit')}:")
+    for event, stats in new['events'].items():
+        before = old['events'].get(event)
+        if before is None:
+            continue
+        changes = []
+        for key in ('per_second', *(f"p{q}_ms" for q in PERCENTILES)):
+            if before[key]:
+                changes.append(f"{key} {100 * (stats[key] - before[key]) / before[key]:+.0f}%")
+        print(f"  {event:<14}" + ', '.join(changes))
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', default='http://127.0.0.1:5000')
+    server = parser.add_mutually_exclusive_group()
+    server.add_argument('--spawn', action='store_true', help="start serve.py on the --url address for the run")
+    server.add_argument('--pid', type=int, help="sample CPU and RSS of this already running server")
+    parser.add_argument('--tables', type=int, default=20, help="lobbies played at once")
+    parser.add_argument('--players', type=int, default=3, help="simulated players per table")
+    parser.add_argument('--bots', type=int, default=0, help="bots added to each table on start")
+    parser.add_argument('--board', default='europe')
+    parser.add_argument('--duration', type=float, default=30, help="seconds of polling once all tables started")
+    parser.add_argument('--ramp', type=float, default=5, help="seconds over which tables start")
+    parser.add_argument('--interval', type=float, default=1, help="mean seconds between a player's polls")
+    parser.add_argument('--sample-period', type=float, default=1, help="seconds between server samples")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help="write the JSON report here")
+    parser.add_argument('--compare', help="an earlier JSON report to compare with")
+    args = parser.parse_args()
+    args.url = args.url.rstrip('/')
+
+    report = run(args)
+    print_report(report)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            print_comparison(json.load(f), report)
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,144 @@
+from __future__ import annotations
+
+import gzip
+import hashlib
+import json
+import os
+from email.utils import formatdate, parsedate_to_datetime
+from typing import Callable, Dict, List, Tuple
+
+from geometry_format import read_header
+from geometry_tiles import TILE_DIR, TILE_INDEX
+
+try:
+    import brotli
+except ImportError:  # brotli is optional, gzip is always available
+    brotli = None
+
+STATIC_DIR = 'static'
+GEOMETRY_FILE = 'svg_elements.json'
+GEOMETRY_LOD_DIR = 'geometry'  # binary levels of detail written by svg_parser
+GZIP_LEVEL = 9
+BROTLI_QUALITY = 11  # slow, but it only runs once per asset at startup
+
+class BoardAsset:
+    """A static payload kept in memory together with its precompressed encodings."""
+    def __init__(self, data: bytes, mtime: float, content_type: str = 'application/json'):
+        self.content_type: str = content_type
+        self.encodings: Dict[str, bytes] = {'identity': data}
+        gzipped = gzip.compress(data, GZIP_LEVEL, mtime=0)
+        if len(gzipped) < len(data):
+            self.encodings['gzip'] = gzipped
+        if brotli is not None:
+            compressed = brotli.compress(data, quality=BROTLI_QUALITY)
+            if len(compressed) < len(data):
+                self.encodings['br'] = compressed
+        self.etag: str = f'"{hashlib.sha1(data).hexdigest()}"'
+        self.mtime: int = int(mtime)
+        self.last_modified: str = formatdate(self.mtime, usegmt=True)
+
+    @property
+    def data(self) -> bytes:
+        return self.encodings['identity']
+
+    def select_encoding(self, accept_encoding: str | None) -> Tuple[str, bytes]:
+        """Pick the smallest encoding the client accepts."""
+        accepted = set()
+        for part in (accept_encoding or '').split(','):
+            coding, _, params = part.strip().partition(';')
+            key, _, value = params.strip().partition('=')
+            if key.strip() == 'q':
+                try:
+                    if float(value) == 0:
+                        continue
+                except ValueError:
+                    continue
+            accepted.add(coding.strip().lower())
+        best = 'identity'
+        for coding in ('br', 'gzip'):
+            if coding in self.encodings and (coding in accepted or '*' in accepted):
+                if len(self.encodings[coding]) < len(self.encodings[best]):
+                    best = coding
+        return best, self.encodings[best]
+
+    def is_not_modified(self, if_none_match: str | None, if_modified_since: str | None) -> bool:
+        # If-None-Match takes precedence over If-Modified-Since (RFC 9110)
+        if if_none_match:
+            tags = [tag.strip() for tag in if_none_match.split(',')]
+            return '*' in tags or any(tag.removeprefix('W/') == self.etag for tag in tags)
+        if if_modified_since:
+            try:
+                since = parsedate_to_datetime(if_modified_since)
+            except (TypeError, ValueError):
+                return False
+            return self.mtime <= since.timestamp()
+        return False
+
+class BoardAssetCache:
+    """In-memory store of per-board assets, keyed by (board, asset name)."""
+    def __init__(self, static_dir: str = STATIC_DIR):
+        self.static_dir: str = static_dir
+        self.assets: Dict[Tuple[str, str], BoardAsset] = {}
+        self.lod_tolerances: Dict[str, List[float]] = {}
+        self.tile_indexes: Dict[str, dict] = {}
+
+    def boards(self) -> List[str]:
+        if not os.path.isdir(self.static_dir):
+            return []
+        return sorted(
+            name for name in os.listdir(self.static_dir)
+            if os.path.isfile(os.path.join(self.static_dir, name, GEOMETRY_FILE))
+        )
+
+    def add(self, board: str, name: str, data: bytes, mtime: float, content_type: str = 'application/json') -> BoardAsset:
+        asset = BoardAsset(data, mtime, content_type)
+        self.assets[(board, name)] = asset
+        return asset
+
+    def add_file(self, board: str, name: str, filename: str, content_type: str = 'application/json',
+                 transform: Callable[[bytes], bytes] | None = None) -> BoardAsset:
+        path = os.path.join(self.static_dir, board, filename)
+        with open(path, 'rb') as f:
+            data = f.read()
+        if transform is not None:
+            data = transform(data)
+        return self.add(board, name, data, os.path.getmtime(path), content_type)
+
+    def get(self, board: str, name: str) -> BoardAsset | None:
+        return self.assets.get((board, name))
+
+    def load_boards(self) -> None:
+        for board in self.boards():
+            self.add_file(board, 'geometry', GEOMETRY_FILE, transform=compact_json)
+            self.load_geometry_lods(board)
+            self.load_geometry_tiles(board)
+
+    def load_geometry_lods(self, board: str) -> None:
+        tolerances = []
+        while True:
+            filename = os.path.join(GEOMETRY_LOD_DIR, f'lod{len(tolerances)}.bin')
+            if not os.path.isfile(os.path.join(self.static_dir, board, filename)):
+                break
+            asset = self.add_file(board, f'geometry_lod{len(tolerances)}', filename, 'application/octet-stream')
+            tolerances.append(read_header(asset.data)['tolerance'])
+        self.lod_tolerances[board] = tolerances
+
+    def load_geometry_tiles(self, board: str) -> None:
+        if not os.path.isfile(os.path.join(self.static_dir, board, TILE_DIR, TILE_INDEX)):
+            return
+        asset = self.add_file(board, 'tile_index', os.path.join(TILE_DIR, TILE_INDEX), transform=compact_json)
+        index = json.loads(asset.data)
+        for z in range(index['zooms']):
+            for x in range(2 ** z):
+                for y in range(2 ** z):
+                    filename = os.path.join(TILE_DIR, str(z), str(x), f'{y}.bin')
+                    if os.path.isfile(os.path.join(self.static_dir, board, filename)):
+                        self.add_file(board, tile_name(z, x, y), filename, 'application/octet-stream')
+        self.tile_indexes[board] = index
+
+def tile_name(z: int, x: int, y: int) -> str:
+    return f'tile{z}/{x}/{y}'
+
+def compact_json(data: bytes) -> bytes:
+    """Re-serialize pretty-printed JSON without whitespace."""
+    return json.dumps(json.loads(data), separators=(',', ':')).encode('utf-8')
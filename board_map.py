@@ -0,0 +1,347 @@
+"""Which city or route each element of a board's artwork draws, and a spatial index over the
+elements to find them by position.
+
+The artwork (svg_elements.json) only has Inkscape ids. The map from element ids to cities and
+routes is inferred once per board and saved next to it as board_map.json: city markers are
+the ellipses, routes are chains of train cars, and the ellipses are named by matching the
+chains, by their length and color, to the routes of connections.txt.
+
+Run from the repository root to (re)build a board's map:
+    python board_map.py [board]
+"""
+from __future__ import annotations
+
+import json
+import math
+import os
+import sys
+from collections import Counter, defaultdict
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+
+from board_assets import GEOMETRY_FILE, STATIC_DIR
+from board_state import CardColor, ColoredEdge, Edge, Graph, Node, parse_graph
+
+BOARD_MAP_FILE = 'board_map.json'
+
+# Fills of the train cars of each color in the artwork, None for grey routes
+CAR_FILLS: Dict[str, CardColor | None] = {
+    '#d5291a': CardColor.RED,
+    '#ee8816': CardColor.ORANGE,
+    '#fbe82b': CardColor.YELLOW,
+    '#9dc131': CardColor.GREEN,
+    '#029ff6': CardColor.BLUE,
+    '#c991c4': CardColor.PINK,
+    '#2e3144': CardColor.BLACK,
+    '#e6e7f1': CardColor.WHITE,
+    '#ebefe9': CardColor.WHITE,
+    '#9c9c9a': None,
+}
+CAR_LENGTH = (15.0, 30.0)  # board units; smaller or larger shapes in those fills are not cars
+MAX_GAP = 25.0  # farthest a car end is linked to the next car or to a city
+MAX_TURN = math.radians(100)  # sharpest bend between consecutive cars of a route
+MAX_MISMATCHES = 3  # chains that may fail to match a route while naming the cities
+
+# ----- spatial index -----
+
+class BoardMap:
+    """Spatial index over the elements of a board's artwork.
+
+    hit_test() looks only at the elements that draw a city or a route, filed by bounding box
+    in a uniform grid, and confirms a candidate with an exact point-in-polygon test (holes
+    excluded) or, for city markers, the ellipse equation. elements_in() compares the bounding
+    boxes of every element at once.
+    """
+    def __init__(self, elements: Sequence[dict], element_map: dict, graph: Graph):
+        self.ids: List[str] = [element['id'] for element in elements]
+        self.bounds: np.ndarray = np.array([element_bounds(element) for element in elements], dtype=float).reshape(-1, 4)
+        # element index -> Node or Edge, for the elements drawing one
+        self.targets: Dict[int, Node | Edge] = {}
+        cities = element_map.get('cities', {})
+        routes = element_map.get('routes', {})
+        for index, element_id in enumerate(self.ids):
+            if element_id in cities:
+                self.targets[index] = graph.nodes[cities[element_id]]
+            elif element_id in routes:
+                self.targets[index] = graph.edge_list[routes[element_id]]
+        self.shapes: Dict[int, tuple] = {index: element_shape(elements[index]) for index in self.targets}
+
+        bounds = self.bounds[list(self.targets)] if self.targets else np.zeros((0, 4))
+        extents = np.maximum(bounds[:, 2] - bounds[:, 0], bounds[:, 3] - bounds[:, 1]) if len(bounds) else [1.0]
+        self.cell_size: float = max(float(np.median(extents)), 1e-6)
+        self.grid: Dict[Tuple[int, int], List[int]] = defaultdict(list)
+        for index in self.targets:  # in drawing order, so the last element of a cell is on top
+            x0, y0, x1, y1 = self.bounds[index]
+            for cx in range(self.cell(x0), self.cell(x1) + 1):
+                for cy in range(self.cell(y0), self.cell(y1) + 1):
+                    self.grid[cx, cy].append(index)
+
+    @classmethod
+    def load(cls, board: str, graph: Graph, static_dir: str = STATIC_DIR) -> BoardMap:
+        with open(os.path.join(static_dir, board, GEOMETRY_FILE)) as f:
+            elements = json.load(f)['elements']
+        with open(os.path.join(static_dir, board, BOARD_MAP_FILE)) as f:
+            element_map = json.load(f)
+        return cls(elements, element_map, graph)
+
+    def cell(self, value: float) -> int:
+        return math.floor(value / self.cell_size)
+
+    def hit_test(self, x: float, y: float) -> Node | Edge | None:
+        """The city or route drawn on top at a point, if any."""
+        for index in reversed(self.grid.get((self.cell(x), self.cell(y)), ())):
+            x0, y0, x1, y1 = self.bounds[index]
+            if x0 <= x <= x1 and y0 <= y <= y1 and shape_contains(self.shapes[index], x, y):
+                return self.targets[index]
+        return None
+
+    def elements_in(self, x0: float, y0: float, x1: float, y1: float) -> List[str]:
+        """Ids of the elements whose bounding boxes meet a rectangle, in drawing order."""
+        bounds = self.bounds
+        inside = (bounds[:, 0] <= x1) & (bounds[:, 2] >= x0) & (bounds[:, 1] <= y1) & (bounds[:, 3] >= y0)
+        return [self.ids[index] for index in np.flatnonzero(inside)]
+
+def element_bounds(element: dict) -> Tuple[float, float, float, float]:
+    if element['type'] == 'Ellipse':
+        (cx, cy), (rx, ry) = element['attributes']['centre'], element['attributes']['radius']
+        return cx - rx, cy - ry, cx + rx, cy + ry
+    points = [point for ring in element.get('bodies', []) + element.get('holes', []) for point in ring]
+    if not points:
+        return math.nan, math.nan, math.nan, math.nan  # never inside a rectangle
+    xs, ys = [x for x, _ in points], [y for _, y in points]
+    return min(xs), min(ys), max(xs), max(ys)
+
+def element_shape(element: dict) -> tuple:
+    if element['type'] == 'Ellipse':
+        (cx, cy), (rx, ry) = element['attributes']['centre'], element['attributes']['radius']
+        return 'ellipse', cx, cy, rx, ry
+    return 'polygon', [tuple(map(tuple, ring)) for ring in element['bodies']], [tuple(map(tuple, ring)) for ring in element['holes']]
+
+def shape_contains(shape: tuple, x: float, y: float) -> bool:
+    if shape[0] == 'ellipse':
+        _, cx, cy, rx, ry = shape
+        return rx > 0 and ry > 0 and ((x - cx) / rx) ** 2 + ((y - cy) / ry) ** 2 <= 1
+    _, bodies, holes = shape
+    return any(ring_contains(ring, x, y) for ring in bodies) and not any(ring_contains(ring, x, y) for ring in holes)
+
+def ring_contains(ring: Sequence[Tuple[float, float]], x: float, y: float) -> bool:
+    """Even-odd ray casting; the ring may or may not repeat its first vertex."""
+    inside = False
+    x1, y1 = ring[-1]
+    for x2, y2 in ring:
+        if (y1 > y) != (y2 > y) and x < x1 + (y - y1) * (x2 - x1) / (y2 - y1):
+            inside = not inside
+        x1, y1 = x2, y2
+    return inside
+
+# ----- inferring the map -----
+
+class Car:
+    __slots__ = ('ids', 'color', 'ends')
+
+    def __init__(self, element_id: str, color: CardColor | None, ends: Tuple[Tuple[float, float], Tuple[float, float]]):
+        self.ids: List[str] = [element_id]
+        self.color: CardColor | None = color
+        self.ends = ends
+
+def car_axis(points: Sequence[Tuple[float, float]]) -> Tuple[Tuple[float, float], Tuple[float, float]]:
+    """The two ends of a shape along its principal axis."""
+    n = len(points)
+    cx, cy = sum(x for x, _ in points) / n, sum(y for _, y in points) / n
+    sxx = sum((x - cx) ** 2 for x, _ in points)
+    syy = sum((y - cy) ** 2 for _, y in points)
+    sxy = sum((x - cx) * (y - cy) for x, y in points)
+    angle = 0.5 * math.atan2(2 * sxy, sxx - syy)
+    ux, uy = math.cos(angle), math.sin(angle)
+    along = [(x - cx) * ux + (y - cy) * uy for x, y in points]
+    low, high = min(along), max(along)
+    return (cx + ux * low, cy + uy * low), (cx + ux * high, cy + uy * high)
+
+def find_cars(elements: Sequence[dict]) -> List[Car]:
+    """Train car shapes; a shape drawn twice at the same place is one car."""
+    cars: Dict[tuple, Car] = {}
+    for element in elements:
+        fill = element['attributes'].get('fill')
+        if element['type'] != 'Path' or fill not in CAR_FILLS or not element['bodies']:
+            continue
+        points = [point for ring in element['bodies'] for point in ring[:-1]]
+        ends = car_axis(points)
+        if not CAR_LENGTH[0] < math.dist(*ends) < CAR_LENGTH[1]:
+            continue
+        key = (fill, *(round(value, 1) for end in sorted(ends) for value in end))
+        if key in cars:
+            cars[key].ids.append(element['id'])
+        else:
+            cars[key] = Car(element['id'], CAR_FILLS[fill], ends)
+    return list(cars.values())
+
+def outward(car: Car, end: int) -> Tuple[float, float]:
+    (x1, y1), (x2, y2) = car.ends[1 - end], car.ends[end]
+    length = math.hypot(x2 - x1, y2 - y1)
+    return (x2 - x1) / length, (y2 - y1) / length
+
+def chain_cars(cars: List[Car], centres: List[Tuple[float, float]], radii: List[float]) -> List[Tuple[int, int, List[Car]]]:
+    """Join cars end to end into routes between two cities: (city, city, cars).
+
+    Every car end goes to its nearest partner, closest pairs first: a city marker, or the end
+    of a car of the same color pointing back at it.
+    """
+    candidates = []
+    for i, car in enumerate(cars):
+        for end, point in enumerate(car.ends):
+            for city, (centre, radius) in enumerate(zip(centres, radii)):
+                gap = math.dist(point, centre) - radius
+                if gap < MAX_GAP:
+                    candidates.append((gap, (i, end), ('city', city)))
+    for i, car in enumerate(cars):
+        for j in range(i + 1, len(cars)):
+            other = cars[j]
+            if car.color != other.color:
+                continue
+            for end, point in enumerate(car.ends):
+                for other_end, other_point in enumerate(other.ends):
+                    gap = math.dist(point, other_point)
+                    if gap >= MAX_GAP:
+                        continue
+                    (ux, uy), (vx, vy) = outward(car, end), outward(other, other_end)
+                    if ux * vx + uy * vy > -math.cos(MAX_TURN):
+                        continue  # not facing each other
+                    candidates.append((gap, (i, end), (j, other_end)))
+    candidates.sort(key=lambda candidate: candidate[0])
+    links = {}
+    for _, a, b in candidates:
+        if a in links or (b[0] != 'city' and b in links):
+            continue
+        links[a] = b
+        if b[0] != 'city':
+            links[b] = a
+
+    chains = []
+    used = set()
+    for (i, end), partner in list(links.items()):
+        if partner[0] != 'city' or i in used:
+            continue
+        chain = [i]
+        current = (i, 1 - end)
+        while current in links and links[current][0] != 'city' and links[current][0] not in chain:
+            j, other_end = links[current]
+            chain.append(j)
+            current = (j, 1 - other_end)
+        if current in links and links[current][0] == 'city':
+            used.update(chain)
+            chains.append((partner[1], links[current][1], [cars[k] for k in chain]))
+    return chains
+
+def route_label(length: int, color: CardColor | None) -> tuple:
+    return length, color.value if color is not None else None
+
+def name_cities(chains: List[Tuple[int, int, List[Car]]], city_count: int, graph: Graph) -> Dict[int, int] | None:
+    """City marker -> Node.index, such that (nearly) every chain is a route of the graph
+    between the same cities, of the same length and color. Backtracking search, extending
+    the assignment along chains."""
+    labels: Counter = Counter()
+    for edge in graph.edge_list:
+        a, b = sorted((edge.node1.index, edge.node2.index))
+        labels[a, b, route_label(edge.length, edge.color if isinstance(edge, ColoredEdge) else None)] += 1
+    graph_neighbours = [
+        {edge.node1.index if edge.node2 is node else edge.node2.index for edge in node.edges}
+        for node in graph.node_list
+    ]
+    chains_at = defaultdict(list)
+    neighbours = defaultdict(set)
+    for index, (a, b, cars) in enumerate(chains):
+        chains_at[a].append(index)
+        chains_at[b].append(index)
+        neighbours[a].add(b)
+        neighbours[b].add(a)
+    order = [max(range(city_count), key=lambda city: len(chains_at[city]))]
+    while len(order) < city_count:
+        placed = set(order)
+        order.append(max((city for city in range(city_count) if city not in placed),
+                         key=lambda city: (len(neighbours[city] & placed), len(chains_at[city]))))
+
+    assignment: Dict[int, int] = {}
+    taken = set()
+
+    def mismatches(city: int) -> int:
+        count = 0
+        for index in chains_at[city]:
+            a, b, cars = chains[index]
+            if a in assignment and b in assignment:
+                x, y = sorted((assignment[a], assignment[b]))
+                count += labels[x, y, route_label(len(cars), cars[0].color)] == 0
+        return count
+
+    def place(position: int, budget: int) -> bool:
+        if position == len(order):
+            return True
+        city = order[position]
+        images = [assignment[other] for other in neighbours[city] if other in assignment]
+        if images:
+            # graph neighbours of the cities already placed next to this one, most shared first
+            candidates = [node for node, _ in Counter(n for image in images for n in graph_neighbours[image]).most_common()]
+        else:
+            candidates = range(len(graph.node_list))
+        for node in candidates:
+            if node in taken:
+                continue
+            assignment[city] = node
+            taken.add(node)
+            cost = mismatches(city)
+            if cost <= budget and place(position + 1, budget - cost):
+                return True
+            del assignment[city]
+            taken.discard(node)
+        return False
+
+    return assignment if place(0, MAX_MISMATCHES) else None
+
+def build_board_map(board: str, static_dir: str = STATIC_DIR) -> Tuple[dict, List[str]]:
+    """The element map of a board, and the chains or routes it could not match."""
+    with open(os.path.join(static_dir, board, GEOMETRY_FILE)) as f:
+        elements = json.load(f)['elements']
+    graph = parse_graph(os.path.join(static_dir, board, 'cities.txt'), os.path.join(static_dir, board, 'connections.txt'))
+    markers = [element for element in elements if element['type'] == 'Ellipse']
+    centres = [tuple(element['attributes']['centre']) for element in markers]
+    radii = [max(element['attributes']['radius']) for element in markers]
+    chains = chain_cars(find_cars(elements), centres, radii)
+    names = name_cities(chains, len(markers), graph)
+    if names is None:
+        raise ValueError(f"Could not match the routes drawn on {board} to its connections")
+
+    cities = {marker['id']: graph.node_list[names[i]].name for i, marker in enumerate(markers) if i in names}
+    # Remaining routes by cities and label; the two routes of a double route differ in color,
+    # or are interchangeable when they do not
+    free: Dict[tuple, List[int]] = defaultdict(list)
+    for edge in graph.edge_list:
+        a, b = sorted((edge.node1.index, edge.node2.index))
+        free[a, b, route_label(edge.length, edge.color if isinstance(edge, ColoredEdge) else None)].append(edge.index)
+    routes = {}
+    problems = []
+    for a, b, cars in chains:
+        x, y = sorted((names[a], names[b]))
+        label = route_label(len(cars), cars[0].color)
+        if not free[x, y, label]:
+            problems.append(f"{len(cars)} {label[1] or 'grey'} cars ({cars[0].ids[0]}...) between "
+                            f"{graph.node_list[x].name} and {graph.node_list[y].name} match no route")
+            continue
+        edge_index = free[x, y, label].pop(0)
+        for car in cars:
+            for element_id in car.ids:
+                routes[element_id] = edge_index
+    problems.extend(
+        f"route {graph.edge_list[index].node1.name} - {graph.edge_list[index].node2.name} not found"
+        for indices in free.values() for index in indices
+    )
+    return {'cities': cities, 'routes': routes}, problems
+
+if __name__ == '__main__':
+    board = sys.argv[1] if len(sys.argv) > 1 else 'europe'
+    element_map, problems = build_board_map(board)
+    with open(os.path.join(STATIC_DIR, board, BOARD_MAP_FILE), 'w') as f:
+        json.dump(element_map, f, indent=1, sort_keys=True)
+    print(f"{len(element_map['cities'])} cities, {len(set(element_map['routes'].values()))} routes")
+    for problem in problems:
+        print(problem)
+    sys.exit(1 if problems else 0)
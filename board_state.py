@@ -1,12 +1,9 @@
 from __future__ import annotations
-from typing import Dict, Set, TYPE_CHECKING
+from typing import Dict, Iterator, List, Tuple
+from array import array
 from enum import Enum
-import random
 import warnings
 
-if TYPE_CHECKING:
-    from game_setup import Player, Station
-
 class CardColor(Enum):
     RED = 'red'
     ORANGE = 'orange'
@@ -19,9 +16,6 @@ class CardColor(Enum):
     JOKER = 'joker'
     def __repr__(self):
         return self.name
-    @classmethod
-    def random(cls):
-        return random.choices(list(cls), weights=(6,6,6,6,6,6,6,6,7), k=1)[0]
 
 EDGE_SCORES: Dict[int, int] = {
     1: 1,
@@ -32,57 +26,161 @@ EDGE_SCORES: Dict[int, int] = {
     8: 21
 }
 
+# Nodes and edges describe the board only and are shared by every game on it.
+# Stations and claimed routes are per-game state kept in GameState, indexed by
+# Node.index and Edge.index.
+
+CARD_COLOR_INDEX: Dict[CardColor, int] = {color: i for i, color in enumerate(CardColor)}
+
 class Node:
+    __slots__ = ('name', 'index', 'edges')
+
     def __init__(self, name):
         self.name: str = name
-        self.edges: Set[Edge] = set()
-        self.occupied_by: Station | None = None
+        self.index: int = -1
+        self.edges: List[Edge] = []
 
 class Edge:
+    __slots__ = ('node1', 'node2', 'length', 'score', 'tunnel', 'index')
+
     def __init__(self, node1: Node, node2: Node, length: int, /, tunnel: bool = False):
         self.node1: Node = node1
         self.node2: Node = node2
         self.length: int = length
         self.score: int = EDGE_SCORES[length]
         self.tunnel: bool = tunnel
-        self.occupied_by: Player | None = None
+        self.index: int = -1
 
 class ColoredEdge(Edge):
+    __slots__ = ('color',)
+
     def __init__(self, node1: Node, node2: Node, length: int, color: CardColor, /, tunnel = False):
         super().__init__(node1, node2, length, tunnel=tunnel)
         self.color: CardColor = color
 
 class FerryEdge(Edge):
+    __slots__ = ('joker_cost',)
+
     def __init__(self, node1: Node, node2: Node, length: int, joker_cost: int):
         super().__init__(node1, node2, length, tunnel = False)
         self.joker_cost: int = joker_cost
 
 class Graph:
+    """Board graph with integer node and edge ids.
+
+    Node and Edge objects are kept as a name-based façade. Hot paths can instead use the
+    integer ids: adjacency is stored in CSR form (the neighbours of node i are
+    adj_nodes[adj_offsets[i]:adj_offsets[i + 1]], reached through adj_edges at the same
+    positions) and edge attributes in parallel arrays indexed by Edge.index. The arrays are
+    rebuilt lazily after the graph changes.
+    """
     def __init__(self):
-        self.nodes = {}
-        self.edges = {}
+        self.nodes: Dict[str, Node] = {}
+        self.node_list: List[Node] = []  # by Node.index
+        # "node1 node2" -> edge, kept for name-based callers. Like get_edge, it gives the first
+        # (lowest index) route of a double route; get_edges has both.
+        self.edges: Dict[str, Edge] = {}
+        self.edge_list: List[Edge] = []  # by Edge.index, including both routes of a double route
+        self.frozen: bool = False
+        self._edges_by_names: Dict[Tuple[str, str], Edge] = {}  # both orders, first route of a double route
+        self._edges_by_ids: Dict[Tuple[int, int], List[int]] = {}  # both orders, every route
+        self._arrays_built: bool = False
+
+    def freeze(self) -> None:
+        """Mark the graph as shared between games; it can no longer be modified."""
+        self._build_arrays()
+        self.frozen = True
 
     def add_node(self, name: str) -> Node:
-        if name not in self.nodes:
-            self.nodes[name] = Node(name)
-        return self.nodes[name]
+        node = self.nodes.get(name)
+        if node is None:
+            if self.frozen:
+                raise RuntimeError("Cannot add a node to a frozen graph.")
+            node = Node(name)
+            node.index = len(self.node_list)
+            self.nodes[name] = node
+            self.node_list.append(node)
+            self._arrays_built = False
+        return node
 
     def add_edge(self, node1_name: str, node2_name: str, /, edge: Edge) -> None:
+        if self.frozen:
+            raise RuntimeError("Cannot add an edge to a frozen graph.")
         node1 = self.add_node(node1_name)
         node2 = self.add_node(node2_name)
         # Replace placeholder nodes in the edge with the real graph nodes
         edge.node1 = node1
         edge.node2 = node2
-        node1.edges.add(edge)
-        node2.edges.add(edge)
-        self.edges[f"{node1_name} {node2_name}"] = edge
+        edge.index = len(self.edge_list)
+        node1.edges.append(edge)
+        node2.edges.append(edge)
+        self.edge_list.append(edge)
+        self.edges.setdefault(f"{node1_name} {node2_name}", edge)
+        self._edges_by_names.setdefault((node1_name, node2_name), edge)
+        self._edges_by_names.setdefault((node2_name, node1_name), edge)
+        self._edges_by_ids.setdefault((node1.index, node2.index), []).append(edge.index)
+        if node1 is not node2:
+            self._edges_by_ids.setdefault((node2.index, node1.index), []).append(edge.index)
+        self._arrays_built = False
 
     def get_edge(self, node1_name: str, node2_name: str) -> Edge:
-        return self.edges.get(f"{node1_name} {node2_name}") or self.edges.get(f"{node2_name} {node1_name}")
+        return self._edges_by_names.get((node1_name, node2_name))
+
+    def get_edges(self, node1_name: str, node2_name: str) -> List[Edge]:
+        """Every route between two cities, e.g. both routes of a double route."""
+        node1 = self.nodes.get(node1_name)
+        node2 = self.nodes.get(node2_name)
+        if node1 is None or node2 is None:
+            return []
+        return [self.edge_list[i] for i in self._edges_by_ids.get((node1.index, node2.index), ())]
 
     def get_node(self, name: str) -> Node:
         return self.nodes.get(name)
 
+    # ----- integer id API -----
+
+    def edge_ids_between(self, node1_id: int, node2_id: int) -> List[int]:
+        return self._edges_by_ids.get((node1_id, node2_id), [])
+
+    def neighbours(self, node_id: int) -> Iterator[Tuple[int, int]]:
+        """(neighbour id, edge id) pairs of a node."""
+        self._build_arrays()
+        start, end = self.adj_offsets[node_id], self.adj_offsets[node_id + 1]
+        return zip(self.adj_nodes[start:end], self.adj_edges[start:end])
+
+    def _build_arrays(self) -> None:
+        if self._arrays_built:
+            return
+        n_nodes, edges = len(self.node_list), self.edge_list
+        self.edge_node1 = array('i', [edge.node1.index for edge in edges])
+        self.edge_node2 = array('i', [edge.node2.index for edge in edges])
+        self.edge_length = array('b', [edge.length for edge in edges])
+        self.edge_score = array('b', [edge.score for edge in edges])
+        self.edge_tunnel = array('b', [edge.tunnel for edge in edges])
+        # index into CardColor, -1 for grey routes and ferries
+        self.edge_color = array('b', [CARD_COLOR_INDEX[edge.color] if isinstance(edge, ColoredEdge) else -1 for edge in edges])
+        self.edge_joker_cost = array('b', [edge.joker_cost if isinstance(edge, FerryEdge) else 0 for edge in edges])
+
+        degree = [0] * (n_nodes + 1)
+        for edge in edges:
+            degree[edge.node1.index + 1] += 1
+            degree[edge.node2.index + 1] += 1
+        for i in range(n_nodes):
+            degree[i + 1] += degree[i]
+        self.adj_offsets = array('i', degree)
+        fill = list(degree[:-1])
+        adj_nodes = [0] * degree[-1]
+        adj_edges = [0] * degree[-1]
+        for edge in edges:
+            u, v = edge.node1.index, edge.node2.index
+            adj_nodes[fill[u]], adj_edges[fill[u]] = v, edge.index
+            fill[u] += 1
+            adj_nodes[fill[v]], adj_edges[fill[v]] = u, edge.index
+            fill[v] += 1
+        self.adj_nodes = array('i', adj_nodes)
+        self.adj_edges = array('i', adj_edges)
+        self._arrays_built = True
+
 def parse_graph(cities_file: str, connections_file: str) -> Graph:
     with open(cities_file, "r") as f:
         cities = f.read().splitlines()
@@ -114,8 +212,9 @@ def parse_graph(cities_file: str, connections_file: str) -> Graph:
     graph = Graph()
     for city in cities:
         graph.add_node(city)
+    known_cities = set(cities)
     for city1, city2, edge in edges_list:
-        if city1 not in cities or city2 not in cities:
+        if city1 not in known_cities or city2 not in known_cities:
             warnings.warn(f"One of the cities {city1} or {city2} is not in the list of cities.")
         graph.add_edge(city1, city2, edge)
 
@@ -0,0 +1,159 @@
+from __future__ import annotations
+
+import random
+from typing import Dict, List, Type
+
+import numpy as np
+
+from board_state import CardColor, ColoredEdge, Edge, FerryEdge
+from game_engine import DECK, MIN_PLAYERS_FOR_DOUBLE_ROUTES, Action
+from game_setup import GameState, Player
+from legal_moves import claimable_routes
+
+class Bot:
+    """A policy choosing the next command for one seat. Bots only read the game state;
+    the caller applies what they return through GameEngine."""
+    name = 'bot'
+
+    def __init__(self, seed: int | None = None):
+        self.rng: random.Random = random.Random(seed)
+
+    def choose(self, game_state: GameState, player_name: str) -> dict | None:
+        """The next command, or None if the bot cannot move (see fallback)."""
+        raise NotImplementedError
+
+    def observe(self, command: dict) -> None:
+        """Called with every command applied in the game, by any player."""
+
+    def fallback(self, game_state: GameState, player_name: str) -> dict | None:
+        """A legal command on the bot's turn: keeping a ticket, a blind draw, a face-up card
+        or a ticket draw, the first that is possible. None once the bot cannot move at all,
+        with no cards and no tickets left to draw, as there is no passing."""
+        player = game_state.players[player_name]
+        if player.offered_tickets:
+            return {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': [0]}
+        if len(game_state.train_cards) + game_state.train_cards.discard_size > 0:
+            return {'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': [DECK, DECK]}
+        for i, card in enumerate(game_state.face_up_cards):
+            if card is not None:
+                # with nothing to refill from, a second blind pick just ends the turn
+                cards = [i] if card == CardColor.JOKER else [i, DECK]
+                return {'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': cards}
+        if game_state.available_tickets:
+            return {'player': player_name, 'action': Action.DRAW_TICKETS.value}
+        return None
+
+def payment(player: Player, edge: Edge, grey_color: CardColor | None = None) -> List[str] | None:
+    """Cards paying for a route, spending as few jokers as possible, or None if the hand can't.
+    Grey routes are paid in grey_color, by default the color the player holds most of."""
+    jokers = player.cards[CardColor.JOKER]
+    needed_jokers = edge.joker_cost if isinstance(edge, FerryEdge) else 0
+    if jokers < needed_jokers:
+        return None
+    if isinstance(edge, ColoredEdge):
+        color = edge.color
+    else:
+        color = grey_color or most_held_color(player)
+    colored = min(player.cards[color], edge.length - needed_jokers)
+    if colored + jokers < edge.length:
+        return None
+    return [color.value] * colored + [CardColor.JOKER.value] * (edge.length - colored)
+
+def most_held_color(player: Player) -> CardColor:
+    return max((color for color in player.cards if color != CardColor.JOKER), key=player.cards.__getitem__)
+
+def claimable(game_state: GameState, player_name: str, edge: Edge) -> bool:
+    """Whether the route is free for this player under the double route rules."""
+    if game_state.edge_owners[edge.index] is not None:
+        return False
+    player = game_state.players[player_name]
+    if player.trains_left < edge.length:
+        return False
+    for other in game_state.graph.edge_ids_between(edge.node1.index, edge.node2.index):
+        owner = game_state.edge_owners[other]
+        if owner == player_name or (owner is not None and len(game_state.players) < MIN_PLAYERS_FOR_DOUBLE_ROUTES):
+            return False
+    return True
+
+def claim_command(player_name: str, edge: Edge, cards: List[str]) -> dict:
+    return {'player': player_name, 'action': Action.CLAIM_ROUTE.value, 'route': edge.index, 'cards': cards}
+
+class RandomBot(Bot):
+    """Claims a random affordable route, otherwise draws blind."""
+    name = 'random'
+
+    def choose(self, game_state: GameState, player_name: str) -> dict | None:
+        player = game_state.players[player_name]
+        if player.offered_tickets:
+            return {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': [0]}
+        grey_color = most_held_color(player)
+        options = [claim_command(player_name, edge, payment(player, edge, grey_color))
+                   for edge in claimable_routes(game_state, player_name)]
+        if options:
+            return self.rng.choice(options)
+        return self.fallback(game_state, player_name)
+
+class GreedyBot(Bot):
+    """Builds the cheapest open path of its tickets, longest route first, and collects the
+    colors those routes need. With every ticket done it draws more while it has trains to
+    spare, then just claims the longest routes it can afford."""
+    name = 'greedy'
+    MIN_TRAINS_FOR_TICKETS = 15
+
+    def choose(self, game_state: GameState, player_name: str) -> dict | None:
+        player = game_state.players[player_name]
+        if player.offered_tickets:
+            return self.keep_tickets(game_state, player_name, player)
+        targets = self.target_routes(game_state, player_name, player)
+        if not targets and player.trains_left >= self.MIN_TRAINS_FOR_TICKETS and game_state.available_tickets:
+            return {'player': player_name, 'action': Action.DRAW_TICKETS.value}
+        if not targets:
+            targets = claimable_routes(game_state, player_name, affordable=False)
+        grey_color = most_held_color(player)
+        for edge in sorted(targets, key=lambda edge: -edge.length):
+            cards = payment(player, edge, grey_color)
+            if cards is not None:
+                return claim_command(player_name, edge, cards)
+        return self.draw_cards(game_state, player_name, targets)
+
+    def target_routes(self, game_state: GameState, player_name: str, player: Player) -> List[Edge]:
+        tables = game_state.open_route_tables()
+        graph = game_state.graph
+        targets: Dict[int, Edge] = {}
+        networks = player.ticket_progress.networks
+        roots = np.array([networks.find(node) for node in range(len(graph.node_list))])
+        for ticket in player.ticket_progress.pending:
+            # Connect the two networks the ticket's cities are in, the player's own routes being free
+            sources = np.flatnonzero(roots == roots[ticket.city1.index])
+            destinations = np.flatnonzero(roots == roots[ticket.city2.index])
+            costs = tables.trains[np.ix_(sources, destinations)]
+            a, b = np.unravel_index(np.argmin(costs), costs.shape)
+            path = tables.path(int(sources[a]), int(destinations[b]))
+            if path is None:
+                continue
+            for a, b in zip(path, path[1:]):
+                for index in graph.edge_ids_between(a, b):
+                    edge = graph.edge_list[index]
+                    if claimable(game_state, player_name, edge):
+                        targets[index] = edge
+                        break
+        return list(targets.values())
+
+    def keep_tickets(self, game_state: GameState, player_name: str, player: Player) -> dict:
+        tables = game_state.open_route_tables()
+        costs = [tables.trains[ticket.city1.index, ticket.city2.index] for ticket in player.offered_tickets]
+        keep = [i for i, cost in enumerate(costs) if cost <= player.trains_left // 2]
+        if not keep:
+            keep = [min(range(len(costs)), key=costs.__getitem__)]
+        return {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': keep}
+
+    def draw_cards(self, game_state: GameState, player_name: str, targets: List[Edge]) -> dict | None:
+        # At most one face-up card: the row is refilled after it, so a second slot picked now
+        # may hold something else, a joker even, by the time it is taken
+        wanted = {edge.color for edge in targets if isinstance(edge, ColoredEdge)}
+        for i, card in enumerate(game_state.face_up_cards):
+            if card in wanted:
+                return {'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': [i, DECK]}
+        return self.fallback(game_state, player_name)
+
+BOTS: Dict[str, Type[Bot]] = {bot.name: bot for bot in (RandomBot, GreedyBot)}
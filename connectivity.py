@@ -0,0 +1,98 @@
+from __future__ import annotations
+
+from array import array
+from typing import Iterable, List, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from board_state import Edge
+    from game_setup import Ticket
+
+class UnionFind:
+    """Disjoint sets over node ids 0..n-1, union by size with path halving."""
+    def __init__(self, n: int):
+        self.parent: array = array('i', range(n))
+        self.size: array = array('i', [1]) * n
+
+    def find(self, x: int) -> int:
+        parent = self.parent
+        while parent[x] != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+
+    def union(self, a: int, b: int) -> bool:
+        """Join the sets of a and b. Returns False if they already were one set."""
+        a, b = self.find(a), self.find(b)
+        if a == b:
+            return False
+        if self.size[a] < self.size[b]:
+            a, b = b, a
+        self.parent[b] = a
+        self.size[a] += self.size[b]
+        return True
+
+    def connected(self, a: int, b: int) -> bool:
+        return self.find(a) == self.find(b)
+
+    def copy(self) -> UnionFind:
+        uf = UnionFind.__new__(UnionFind)
+        uf.parent = array('i', self.parent)
+        uf.size = array('i', self.size)
+        return uf
+
+class TicketProgress:
+    """Which of a player's tickets their claimed routes already complete.
+
+    Routes are added one at a time as they are claimed; a ticket only needs rechecking when
+    a claim joins two previously separate networks, so queries and the running tally of
+    completed and pending (failed, if the game ended now) points are O(α(n)).
+    """
+    def __init__(self, node_count: int):
+        self.networks: UnionFind = UnionFind(node_count)
+        self.completed: List[Ticket] = []
+        self.pending: List[Ticket] = []
+        self.completed_points: int = 0
+        self.pending_points: int = 0
+
+    def is_complete(self, ticket: Ticket) -> bool:
+        return self.networks.connected(ticket.city1.index, ticket.city2.index)
+
+    def add_route(self, edge: Edge) -> bool:
+        """Record a claimed route. Returns True if it completed a ticket."""
+        if not self.networks.union(edge.node1.index, edge.node2.index) or not self.pending:
+            return False
+        return self._recheck()
+
+    def add_tickets(self, tickets: Iterable[Ticket]) -> None:
+        for ticket in tickets:
+            if self.is_complete(ticket):
+                self.completed.append(ticket)
+                self.completed_points += ticket.points
+            else:
+                self.pending.append(ticket)
+                self.pending_points += ticket.points
+
+    def _recheck(self) -> bool:
+        still_pending = []
+        for ticket in self.pending:
+            if self.is_complete(ticket):
+                self.completed.append(ticket)
+                self.completed_points += ticket.points
+                self.pending_points -= ticket.points
+            else:
+                still_pending.append(ticket)
+        changed = len(still_pending) != len(self.pending)
+        self.pending = still_pending
+        return changed
+
+    def copy(self) -> TicketProgress:
+        progress = TicketProgress.__new__(TicketProgress)
+        progress.networks = self.networks.copy()
+        progress.completed = self.completed.copy()
+        progress.pending = self.pending.copy()
+        progress.completed_points = self.completed_points
+        progress.pending_points = self.pending_points
+        return progress
+
+    def jsonify(self) -> dict:
+        return {'completed': self.completed_points, 'pending': self.pending_points}
@@ -0,0 +1,105 @@
+from __future__ import annotations
+
+import random
+from array import array
+from typing import Dict, Iterable, List
+
+from board_state import CARD_COLOR_INDEX, CardColor
+
+COLORS = tuple(CardColor)
+CARDS_PER_COLOR = 12
+JOKERS = 14  # 8 colors of 12 plus 14 jokers: the 110 train cards
+FACE_UP_CARDS = 5
+MAX_FACE_UP_JOKERS = 2  # a third face-up joker discards the whole row
+MAX_FACE_UP_REDEALS = 3  # stop redealing when the cards left are mostly jokers
+
+class TrainCardDeck:
+    """The train cards not in anybody's hand or face up.
+
+    The draw pile is a shuffled buffer of color indices drawn from the end, so a draw is
+    O(1). Discarded cards are only counted per color, and shuffled back in as a new draw
+    pile when the old one runs out. All shuffling uses the game's generator.
+    """
+    def __init__(self, rng: random.Random, draw_pile: Iterable[int] = (), discard: Iterable[int] | None = None):
+        self.rng: random.Random = rng
+        self.draw_pile: array = array('b', draw_pile)
+        self.discard_counts: array = array('H', discard if discard is not None else [0] * len(COLORS))
+
+    @classmethod
+    def full(cls, rng: random.Random) -> TrainCardDeck:
+        deck = cls(rng)
+        deck.draw_pile = array('b', [CARD_COLOR_INDEX[CardColor.JOKER]] * JOKERS)
+        for color in COLORS:
+            if color != CardColor.JOKER:
+                deck.draw_pile.extend([CARD_COLOR_INDEX[color]] * CARDS_PER_COLOR)
+        deck.shuffle()
+        return deck
+
+    def __len__(self) -> int:
+        return len(self.draw_pile)
+
+    @property
+    def discard_size(self) -> int:
+        return sum(self.discard_counts)
+
+    def shuffle(self) -> None:
+        pile = self.draw_pile.tolist()
+        self.rng.shuffle(pile)
+        self.draw_pile = array('b', pile)
+
+    def reshuffle(self) -> None:
+        """Turn the discard pile into the draw pile, under whatever is left of it."""
+        pile = []
+        for index, count in enumerate(self.discard_counts):
+            pile.extend([index] * count)
+        self.rng.shuffle(pile)
+        self.draw_pile = array('b', pile) + self.draw_pile
+        self.discard_counts = array('H', [0] * len(COLORS))
+
+    def draw(self, count: int = 1) -> List[CardColor]:
+        """Draw up to count cards, fewer only if the draw and discard piles run out together."""
+        if len(self.draw_pile) < count:
+            self.reshuffle()
+        count = min(count, len(self.draw_pile))
+        if count == 0:
+            return []
+        drawn = [COLORS[index] for index in self.draw_pile[-count:]]
+        del self.draw_pile[-count:]
+        return drawn
+
+    def discard(self, cards: Dict[CardColor, int]) -> None:
+        for color, count in cards.items():
+            self.discard_counts[CARD_COLOR_INDEX[color]] += count
+
+    def fill_face_up(self, face_up: List[CardColor | None]) -> None:
+        """Refill empty face-up slots (None), then redeal the row while it shows three or more
+        jokers. Slots stay empty once both piles are used up."""
+        for redeal in range(MAX_FACE_UP_REDEALS + 1):
+            for slot, card in enumerate(face_up):
+                if card is None:
+                    drawn = self.draw()
+                    face_up[slot] = drawn[0] if drawn else None
+            if face_up.count(CardColor.JOKER) <= MAX_FACE_UP_JOKERS or redeal == MAX_FACE_UP_REDEALS:
+                return
+            self.discard({card: face_up.count(card) for card in set(face_up) if card is not None})
+            face_up[:] = [None] * len(face_up)
+
+    def copy(self) -> TrainCardDeck:
+        deck = TrainCardDeck.__new__(TrainCardDeck)
+        deck.rng = self.rng
+        deck.draw_pile = array('b', self.draw_pile)
+        deck.discard_counts = array('H', self.discard_counts)
+        return deck
+
+    def jsonify(self) -> dict:
+        return {
+            'draw_pile': [COLORS[index].name for index in self.draw_pile],
+            'discard': {color.name: count for color, count in zip(COLORS, self.discard_counts) if count},
+        }
+
+    @classmethod
+    def from_json(cls, data: dict, rng: random.Random) -> TrainCardDeck:
+        discard = [0] * len(COLORS)
+        for name, count in data.get('discard', {}).items():
+            discard[CARD_COLOR_INDEX[CardColor[name]]] = count
+        return cls(rng, (CARD_COLOR_INDEX[CardColor[name]] for name in data['draw_pile']), discard)
@@ -0,0 +1,373 @@
+from __future__ import annotations
+
+from enum import Enum
+from typing import Callable, Dict, Iterable, List, Tuple
+
+from board_state import CardColor, ColoredEdge, Edge, FerryEdge
+from game_setup import GameState, Player, escape_pointer
+
+TICKETS_OFFERED = 3
+FINAL_ROUND_TRAINS = 2  # the final round starts once a player is down to this many trains
+STATION_POINTS = 4  # per station left unbuilt at the end of the game
+LONGEST_PATH_BONUS = 10  # European Express bonus, shared by everybody tied for the longest path
+MIN_PLAYERS_FOR_DOUBLE_ROUTES = 4  # with fewer players only one route of a double route can be used
+DECK = 'deck'  # DRAW_CARDS pick for a blind draw instead of a face-up index
+
+class Action(Enum):
+    DRAW_CARDS = 'DRAW_CARDS'
+    CLAIM_ROUTE = 'CLAIM_ROUTE'
+    DRAW_TICKETS = 'DRAW_TICKETS'
+    KEEP_TICKETS = 'KEEP_TICKETS'
+    BUILD_STATION = 'BUILD_STATION'
+
+class CommandError(Exception):
+    pass
+
+class GameEngine:
+    """Applies player commands to a GameState without ever blocking.
+
+    A command is a dict with the acting 'player' and an 'action', plus arguments:
+        DRAW_CARDS     cards: two picks, each a face-up index (0-4) or 'deck'. A face-up
+                       joker can only be taken as the single pick of the turn.
+        CLAIM_ROUTE    route: edge index, or city1 and city2; cards: card colors to pay with
+        DRAW_TICKETS   offers up to three tickets, the turn ends with KEEP_TICKETS
+        KEEP_TICKETS   keep: indices of the offered tickets to keep, at least one
+        BUILD_STATION  city; cards: 1, 2 or 3 cards of one color for the 1st, 2nd or 3rd station
+
+    apply() validates a command before touching the state, so a rejected command changes
+    nothing. Changes are marked on the game state and left uncommitted for the caller to
+    publish. Tunnels are charged like ordinary routes.
+    """
+    def __init__(self, game_state: GameState):
+        self.game_state: GameState = game_state
+        self.handlers: Dict[Action, Callable[[str, Player, dict, List[dict]], None]] = {
+            Action.DRAW_CARDS: self.draw_cards,
+            Action.CLAIM_ROUTE: self.claim_route,
+            Action.DRAW_TICKETS: self.draw_tickets,
+            Action.KEEP_TICKETS: self.keep_tickets,
+            Action.BUILD_STATION: self.build_station,
+        }
+
+    def apply(self, command: dict) -> Tuple[List[dict], str | None]:
+        """Apply one command. Returns (events, None), or ([], error message) if it was rejected."""
+        events: List[dict] = []
+        try:
+            player_name, player, action = self.check_turn(command)
+            self.handlers[action](player_name, player, command, events)
+        except CommandError as e:
+            return [], str(e)
+        return events, None
+
+    def apply_all(self, commands: Iterable[dict]) -> Tuple[List[dict], str | None]:
+        """Apply commands in order, stopping at the first rejected one."""
+        events: List[dict] = []
+        for command in commands:
+            new_events, error = self.apply(command)
+            events.extend(new_events)
+            if error is not None:
+                return events, error
+        return events, None
+
+    # ----- validation -----
+
+    def check_turn(self, command: dict) -> Tuple[str, Player, Action]:
+        game_state = self.game_state
+        if game_state.game_over:
+            raise CommandError("The game is over.")
+        player_name = command.get('player')
+        player = game_state.players.get(player_name)
+        if player is None:
+            raise CommandError("You are not playing in this game.")
+        if player_name != game_state.current_player_turn:
+            raise CommandError("It is not your turn.")
+        try:
+            action = Action(str(command.get('action', '')).upper())
+        except ValueError:
+            raise CommandError(f"Unknown action {command.get('action')!r}.")
+        if player.offered_tickets and action != Action.KEEP_TICKETS:
+            raise CommandError("Choose which of the drawn tickets to keep first.")
+        return player_name, player, action
+
+    @staticmethod
+    def parse_cards(cards) -> Dict[CardColor, int]:
+        counts: Dict[CardColor, int] = {}
+        if not isinstance(cards, list):
+            raise CommandError("Cards must be a list of card colors.")
+        for card in cards:
+            try:
+                color = CardColor(str(card).lower())
+            except ValueError:
+                raise CommandError(f"Unknown card color {card!r}.")
+            counts[color] = counts.get(color, 0) + 1
+        return counts
+
+    @staticmethod
+    def check_hand(player: Player, counts: Dict[CardColor, int]) -> None:
+        for color, count in counts.items():
+            if player.cards[color] < count:
+                raise CommandError(f"You do not have enough {color.name} cards.")
+
+    def find_route(self, command: dict) -> Edge:
+        graph = self.game_state.graph
+        if 'route' in command:
+            index = command['route']
+            if not isinstance(index, int) or not 0 <= index < len(graph.edge_list):
+                raise CommandError("Invalid route.")
+            return graph.edge_list[index]
+        edge = graph.get_edge(command.get('city1'), command.get('city2'))
+        if edge is None:
+            raise CommandError("Invalid route.")
+        # Of a double route, take the first one still free
+        for other in graph.get_edges(edge.node1.name, edge.node2.name):
+            if self.game_state.edge_owners[other.index] is None:
+                return other
+        return edge
+
+    @staticmethod
+    def check_payment(edge: Edge, counts: Dict[CardColor, int]) -> None:
+        if sum(counts.values()) != edge.length:
+            raise CommandError(f"This route takes exactly {edge.length} cards.")
+        colors = [color for color in counts if color != CardColor.JOKER]
+        if len(colors) > 1:
+            raise CommandError("All cards but jokers must be of one color.")
+        if isinstance(edge, ColoredEdge) and colors and colors[0] != edge.color:
+            raise CommandError(f"This route must be paid with {edge.color.name} cards.")
+        if isinstance(edge, FerryEdge) and counts.get(CardColor.JOKER, 0) < edge.joker_cost:
+            raise CommandError(f"This ferry takes at least {edge.joker_cost} jokers.")
+
+    # ----- actions -----
+
+    def draw_cards(self, player_name: str, player: Player, command: dict, events: List[dict]) -> None:
+        game_state = self.game_state
+        picks = command.get('cards')
+        if not isinstance(picks, list) or not 1 <= len(picks) <= 2:
+            raise CommandError("Pick one or two cards.")
+        face_up = list(game_state.face_up_cards)
+        for pick in picks:
+            if pick == DECK:
+                continue
+            if not isinstance(pick, int) or not 0 <= pick < len(face_up):
+                raise CommandError("Invalid card pick.")
+            if face_up[pick] is None:
+                raise CommandError("There is no face-up card there.")
+            if face_up[pick] == CardColor.JOKER and len(picks) > 1:
+                raise CommandError("A face-up joker is the only card you can take this turn.")
+        if len(picks) == 1 and not (picks[0] != DECK and face_up[picks[0]] == CardColor.JOKER):
+            raise CommandError("Pick two cards.")
+
+        # Draw from copies first: a second pick from a refilled slot may turn out to be a joker
+        deck = game_state.train_cards.copy()
+        taken = []
+        drawn = []
+        from_deck = 0
+        for pick in picks:
+            if pick == DECK:
+                card = deck.draw()
+                if not card:
+                    if drawn:
+                        break  # nothing left to draw, the turn ends with one card
+                    raise CommandError("There are no cards left to draw.")
+                drawn.extend(card)
+                from_deck += 1
+            else:
+                card = face_up[pick]
+                if card is None:
+                    raise CommandError("There is no face-up card there.")
+                if card == CardColor.JOKER and drawn:
+                    raise CommandError("A face-up joker cannot be your second card.")
+                drawn.append(card)
+                taken.append(card.name)
+                face_up[pick] = None
+                deck.fill_face_up(face_up)
+        for card in drawn:
+            player.cards[card] += 1
+        game_state.train_cards = deck
+        game_state.mark_changed('/train_cards')
+        if taken:
+            game_state.face_up_cards = face_up
+            game_state.mark_changed('/face_up_cards')
+        self.mark_player(player_name, 'cards')
+        events.append({'type': 'cards_drawn', 'player': player_name, 'face_up': taken, 'from_deck': from_deck})
+        self.end_turn(player_name, player, events)
+
+    def claim_route(self, player_name: str, player: Player, command: dict, events: List[dict]) -> None:
+        game_state = self.game_state
+        edge = self.find_route(command)
+        if game_state.edge_owners[edge.index] is not None:
+            raise CommandError("This route is already claimed.")
+        for other in game_state.graph.get_edges(edge.node1.name, edge.node2.name):
+            owner = game_state.edge_owners[other.index]
+            if owner == player_name:
+                raise CommandError("You already own a route between these cities.")
+            if owner is not None and len(game_state.players) < MIN_PLAYERS_FOR_DOUBLE_ROUTES:
+                raise CommandError("Only one route of a double route can be used with fewer than 4 players.")
+        if player.trains_left < edge.length:
+            raise CommandError("You do not have enough trains left.")
+        counts = self.parse_cards(command.get('cards'))
+        self.check_payment(edge, counts)
+        self.check_hand(player, counts)
+
+        for color, count in counts.items():
+            player.cards[color] -= count
+        game_state.discard_cards(counts)
+        player.trains_left -= edge.length
+        player.score += edge.score
+        game_state.set_edge_owner(edge, player_name)
+        self.mark_player(player_name, 'cards', 'trains_left', 'score')
+        events.append({
+            'type': 'route_claimed', 'player': player_name, 'route': edge.index,
+            'cards': {color.name: count for color, count in counts.items()}
+        })
+        self.end_turn(player_name, player, events)
+
+    def draw_tickets(self, player_name: str, player: Player, command: dict, events: List[dict]) -> None:
+        game_state = self.game_state
+        if not game_state.available_tickets:
+            raise CommandError("There are no tickets left.")
+        count = min(TICKETS_OFFERED, len(game_state.available_tickets))
+        player.offered_tickets = game_state.available_tickets[:count]
+        del game_state.available_tickets[:count]
+        self.mark_player(player_name, 'offered_tickets')
+        game_state.mark_changed('/available_tickets')
+        events.append({'type': 'tickets_offered', 'player': player_name, 'count': count})
+
+    def keep_tickets(self, player_name: str, player: Player, command: dict, events: List[dict]) -> None:
+        game_state = self.game_state
+        if not player.offered_tickets:
+            raise CommandError("You have no tickets to choose from.")
+        keep = command.get('keep')
+        if not isinstance(keep, list) or not keep:
+            raise CommandError("Keep at least one ticket.")
+        if any(not isinstance(i, int) or not 0 <= i < len(player.offered_tickets) for i in keep) or len(set(keep)) != len(keep):
+            raise CommandError("Invalid ticket choice.")
+
+        kept = set(keep)
+        game_state.give_tickets(player_name, [ticket for i, ticket in enumerate(player.offered_tickets) if i in kept])
+        # Returned tickets go to the bottom of the deck
+        game_state.available_tickets.extend(ticket for i, ticket in enumerate(player.offered_tickets) if i not in kept)
+        returned = len(player.offered_tickets) - len(kept)
+        player.offered_tickets = []
+        self.mark_player(player_name, 'offered_tickets')
+        if returned:
+            game_state.mark_changed('/available_tickets')
+        events.append({'type': 'tickets_kept', 'player': player_name, 'count': len(kept)})
+        self.end_turn(player_name, player, events)
+
+    def build_station(self, player_name: str, player: Player, command: dict, events: List[dict]) -> None:
+        game_state = self.game_state
+        node = game_state.graph.get_node(command.get('city'))
+        if node is None:
+            raise CommandError("Invalid city.")
+        if game_state.station_owners[node.index] is not None:
+            raise CommandError("There already is a station in this city.")
+        if player.stations_left <= 0:
+            raise CommandError("You have no stations left.")
+        counts = self.parse_cards(command.get('cards'))
+        cost = 4 - player.stations_left
+        if sum(counts.values()) != cost:
+            raise CommandError(f"This station takes exactly {cost} cards.")
+        if len([color for color in counts if color != CardColor.JOKER]) > 1:
+            raise CommandError("All cards but jokers must be of one color.")
+        self.check_hand(player, counts)
+
+        for color, count in counts.items():
+            player.cards[color] -= count
+        game_state.discard_cards(counts)
+        player.stations_left -= 1
+        game_state.station_owners[node.index] = player_name
+        self.mark_player(player_name, 'cards', 'stations_left')
+        game_state.mark_changed(f"/stations/{node.index}")
+        events.append({'type': 'station_built', 'player': player_name, 'city': node.name})
+        self.end_turn(player_name, player, events)
+
+    # ----- turns -----
+
+    def mark_player(self, player_name: str, *fields: str) -> None:
+        prefix = f"/players/{escape_pointer(player_name)}"
+        self.game_state.mark_changed(*(f"{prefix}/{field}" for field in fields))
+
+    def end_turn(self, player_name: str, player: Player, events: List[dict]) -> None:
+        game_state = self.game_state
+        if game_state.final_turns is None:
+            if player.trains_left <= FINAL_ROUND_TRAINS:
+                # Everybody, this player included, gets one last turn
+                game_state.final_turns = len(game_state.players)
+                game_state.mark_changed('/final_turns')
+                events.append({'type': 'final_round', 'player': player_name})
+        else:
+            game_state.final_turns -= 1
+            game_state.mark_changed('/final_turns')
+            if game_state.final_turns == 0:
+                self.finish_game(events)
+                return
+        game_state.advance_turn()
+        events.append({'type': 'turn_started', 'player': game_state.current_player_turn})
+
+    def finish_game(self, events: List[dict]) -> None:
+        game_state = self.game_state
+        for player_name, player in game_state.players.items():
+            progress = player.ticket_progress
+            player.score += progress.completed_points - progress.pending_points
+            player.score += player.stations_left * STATION_POINTS
+            self.mark_player(player_name, 'score')
+        longest_paths = {player_name: game_state.longest_path(player_name) for player_name in game_state.players}
+        longest = max(longest_paths.values(), default=0)
+        for player_name, length in longest_paths.items():
+            if length == longest and longest > 0:
+                game_state.players[player_name].score += LONGEST_PATH_BONUS
+        game_state.game_over = True
+        game_state.mark_changed('/game_over')
+        events.append({
+            'type': 'game_over',
+            'scores': {player_name: player.score for player_name, player in game_state.players.items()},
+            'longest_paths': longest_paths,
+        })
+
+# ============================== HEADLESS DRIVER ==============================
+
+def parse_command(player_name: str, line: str) -> dict:
+    """Turn a console line into a command, e.g. "DRAW_CARDS 1 deck", "CLAIM_ROUTE Paris Wien red red joker",
+    "DRAW_TICKETS", "KEEP_TICKETS 1 3", "BUILD_STATION Berlin blue". Card and ticket numbers are 1-based."""
+    words = line.split()
+    if not words:
+        return {'player': player_name, 'action': ''}
+    action, args = words[0].upper(), words[1:]
+    command = {'player': player_name, 'action': action}
+    def number(word):
+        return int(word) - 1 if word.isdigit() else word
+    if action == Action.DRAW_CARDS.value:
+        command['cards'] = [DECK if word.lower() == DECK else number(word) for word in args]
+    elif action == Action.CLAIM_ROUTE.value:
+        command['city1'], command['city2'] = (args + [None, None])[:2]
+        command['cards'] = args[2:]
+    elif action == Action.KEEP_TICKETS.value:
+        command['keep'] = [number(word) for word in args]
+    elif action == Action.BUILD_STATION.value:
+        command['city'] = args[0] if args else None
+        command['cards'] = args[1:]
+    return command
+
+def run_headless(game_state: GameState, read: Callable[[], str] = input, write: Callable[[str], None] = print) -> None:
+    """Play a game from the console; a thin loop over GameEngine."""
+    engine = GameEngine(game_state)
+    write(f"Initial face-up cards: {game_state.value_at(['face_up_cards'])}")
+    while not game_state.game_over:
+        player_name = game_state.current_player_turn
+        player = game_state.players[player_name]
+        write(f"Player {player_name}, it's your turn! Choose an action: DRAW_CARDS, CLAIM_ROUTE, DRAW_TICKETS, BUILD_STATION.")
+        write(f"Your cards: {player.cards}")
+        write(f"Face-up cards to choose: {game_state.face_up_cards}")
+        if player.offered_tickets:
+            write(f"Offered tickets: {player.offered_tickets}")
+        events, error = engine.apply(parse_command(player_name, read()))
+        if error is not None:
+            write(error)
+            continue
+        game_state.commit()
+        for event in events:
+            write(str(event))
+
+if __name__ == "__main__":
+    from game_setup import PlayerColor, board_files, setup_game
+    game_state = setup_game(*board_files('europe'), [("Bartek", PlayerColor.RED), ("Alicja", PlayerColor.BLUE)])
+    run_headless(game_state)
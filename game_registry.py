@@ -0,0 +1,177 @@
+from __future__ import annotations
+
+import threading
+from collections import OrderedDict
+from contextlib import contextmanager
+from typing import Dict, Iterator, List, Tuple
+
+from game_setup import GameState
+from game_store import GameStore
+
+class GameRegistry:
+    """In-process store of running games keyed by lobby id.
+
+    Games stay resident in least-recently-used order. When the number of resident games or
+    their estimated size goes over the cap, the coldest ones are flushed to Redis through
+    the GameStore and rebuilt from there the next time they are requested.
+    The size of a game is estimated from the bytes written the last time it was saved whole.
+    Finished games are released as they end and kept in Redis only, until they expire.
+
+    lock only guards the registry itself and is never held over Redis round trips. Code
+    reading or changing a game holds that game with locked(), as do loading, saving and
+    spilling it, so games do not wait on each other, and a held game is never evicted.
+    """
+    def __init__(self, store: GameStore, max_games: int | None = 500, max_bytes: int | None = None):
+        self.store: GameStore = store
+        self.max_games: int | None = max_games
+        self.max_bytes: int | None = max_bytes
+        # lobby_id -> (lobby, game_state, estimated size), most recently used last
+        self.games: OrderedDict[str, Tuple[dict, GameState, int]] = OrderedDict()
+        self.resident_bytes: int = 0
+        self.lock = threading.RLock()
+        # lobby_id -> [lock, threads holding or waiting for it], for the games in use
+        self.game_locks: Dict[str, List] = {}
+
+    def __len__(self) -> int:
+        return len(self.games)
+
+    def __contains__(self, lobby_id: str) -> bool:
+        return lobby_id in self.games
+
+    @contextmanager
+    def locked(self, lobby_id: str) -> Iterator[None]:
+        """Hold one game while reading or changing it."""
+        with self.lock:
+            entry = self._hold(lobby_id)
+        try:
+            with entry[0]:
+                yield
+        finally:
+            with self.lock:
+                self._let_go(lobby_id, entry)
+
+    def put(self, lobby_id: str, lobby: dict, game_state: GameState) -> None:
+        """Register a game and write it through to Redis."""
+        with self.locked(lobby_id):
+            size = self.store.save(lobby_id, lobby, game_state)
+            with self.lock:
+                self._drop(lobby_id)
+                self._insert(lobby_id, lobby, game_state, size)
+            self._evict()
+
+    def get(self, lobby_id: str) -> GameState | None:
+        entry = self.get_entry(lobby_id)
+        return entry[1] if entry is not None else None
+
+    def get_entry(self, lobby_id: str) -> Tuple[dict, GameState] | None:
+        with self.locked(lobby_id):
+            with self.lock:
+                entry = self.games.get(lobby_id)
+                if entry is not None:
+                    self.games.move_to_end(lobby_id)
+                    return entry[0], entry[1]
+            loaded = self.store.load(lobby_id)
+            if loaded is None:
+                return None
+            lobby, game_state = loaded
+            if game_state.game_over:
+                # Finished games are only looked at, they are not kept resident again
+                self.store.forget(lobby_id)
+                return lobby, game_state
+            # Rough size estimate until the game is next saved whole
+            size = len(game_state.players) * 512 + len(game_state.available_tickets) * 48
+            with self.lock:
+                self._insert(lobby_id, lobby, game_state, size)
+            self._evict()
+            return lobby, game_state
+
+    def read(self, lobby_id: str) -> Tuple[dict, GameState] | None:
+        """A game as this process holds it, or as stored in Redis if it is not resident here,
+        without taking it over. For requests that may reach any process."""
+        with self.lock:
+            entry = self.games.get(lobby_id)
+            if entry is not None:
+                return entry[0], entry[1]
+        return self.store.read(lobby_id)
+
+    def mark_dirty(self, lobby_id: str) -> None:
+        """Schedule the committed changes of a resident game to be written to Redis. Call with
+        the game held."""
+        with self.lock:
+            entry = self.games.get(lobby_id)
+        if entry is not None:
+            self.store.mark_dirty(lobby_id, entry[0], entry[1])
+
+    def release(self, lobby_id: str) -> None:
+        """Write a game out to Redis and drop it from memory, e.g. for another process to take
+        it over."""
+        with self.locked(lobby_id):
+            self._spill(lobby_id)
+
+    def stats(self) -> Dict[str, int]:
+        return {'games': len(self.games), 'bytes': self.resident_bytes}
+
+    def _hold(self, lobby_id: str) -> List:
+        entry = self.game_locks.setdefault(lobby_id, [threading.RLock(), 0])
+        entry[1] += 1
+        return entry
+
+    def _let_go(self, lobby_id: str, entry: List) -> None:
+        entry[1] -= 1
+        if not entry[1]:
+            del self.game_locks[lobby_id]
+
+    def _insert(self, lobby_id: str, lobby: dict, game_state: GameState, size: int) -> None:
+        self.games[lobby_id] = (lobby, game_state, size)
+        self.resident_bytes += size
+
+    def _drop(self, lobby_id: str) -> None:
+        entry = self.games.pop(lobby_id, None)
+        if entry is not None:
+            self.resident_bytes -= entry[2]
+
+    def _over_cap(self) -> bool:
+        if self.max_games is not None and len(self.games) > self.max_games:
+            return True
+        return self.max_bytes is not None and self.resident_bytes > self.max_bytes
+
+    def _victim(self) -> str | None:
+        if not self._over_cap():
+            return None
+        # The most recently used game is never evicted, even if it alone is over the cap
+        for lobby_id in list(self.games)[:-1]:
+            if lobby_id not in self.game_locks:
+                return lobby_id
+        return None
+
+    def _evict(self) -> None:
+        """Spill the coldest games not in use until back under the cap. Victims are picked
+        and held under lock, then written out with only themselves held."""
+        while True:
+            with self.lock:
+                lobby_id = self._victim()
+                if lobby_id is None:
+                    return
+                entry = self._hold(lobby_id)
+                # Nobody held or waited for it, so this does not block
+                entry[0].acquire()
+            try:
+                self._spill(lobby_id)
+            finally:
+                entry[0].release()
+                with self.lock:
+                    self._let_go(lobby_id, entry)
+
+    def _spill(self, lobby_id: str) -> None:
+        """Call with the game held. It stays resident until flushed, for read() to find."""
+        with self.lock:
+            entry = self.games.get(lobby_id)
+        if entry is None:
+            return
+        lobby, game_state, _ = entry
+        game_state.commit()
+        self.store.mark_dirty(lobby_id, lobby, game_state)
+        self.store.flush(lobby_id)
+        self.store.forget(lobby_id)
+        with self.lock:
+            self._drop(lobby_id)
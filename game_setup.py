@@ -2,10 +2,15 @@ from __future__ import annotations
 
 import json
 
-from pydantic.fields import defaultdict
-from typing import List, Tuple, TYPE_CHECKING
+from collections import defaultdict, deque
+from typing import Deque, Dict, Iterable, List, Tuple, TYPE_CHECKING
 from enum import Enum
 from board_state import Graph, Node, Edge, ColoredEdge, FerryEdge, CardColor, parse_graph
+from connectivity import TicketProgress
+from decks import FACE_UP_CARDS, TrainCardDeck
+from longest_path import longest_path
+from route_index import OpenRouteIndex, RouteIndex
+from route_tables import OpenRouteTables, RouteTables
 import random
 import warnings
 
@@ -19,6 +24,8 @@ class PlayerColor(Enum):
     YELLOW = 'yellow'
     BLACK = 'black'
 
+CHANGE_LOG_SIZE = 64  # versions a client may lag behind before it needs a full snapshot
+
 class Ticket:
     def __init__(self, city1: Node, city2: Node, points: int):
         self.city1: Node = city1
@@ -36,7 +43,7 @@ class Ticket:
         }
 
 class Player:
-    def __init__(self, color: PlayerColor):
+    def __init__(self, color: PlayerColor, node_count: int = 0):
         self.color: PlayerColor = color
         self.cards: Dict[CardColor, int] = {
             CardColor.RED: 0,
@@ -50,12 +57,23 @@ class Player:
             CardColor.JOKER: 0
         }
         self.trains_left: int = 45
+        self.stations_left: int = 3
         self.tickets: List[Ticket] = []
+        self.offered_tickets: List[Ticket] = []  # drawn with DRAW_TICKETS, not yet kept or returned
         self.score: int = 0
+        self.ticket_progress: TicketProgress = TicketProgress(node_count)  # over the board's node ids
+
+    def clone(self) -> Player:
+        player = self.__class__.__new__(self.__class__)
+        player.__dict__.update(self.__dict__)
+        player.cards = self.cards.copy()
+        player.tickets = self.tickets.copy()
+        player.offered_tickets = self.offered_tickets.copy()
+        player.ticket_progress = self.ticket_progress.copy()
+        return player
 
     def check_can_claim_route(self, edge: Edge) -> bool:
-        if edge.occupied_by is not None:
-            return False
+        # Whether the route is still free is per-game state, see GameState.can_claim_route
         if self.trains_left < edge.length:
             return False
         if isinstance(edge, ColoredEdge):
@@ -77,9 +95,26 @@ class Player:
         return True
 
 class AIPlayer(Player):
-    def __init__(self, color: PlayerColor):
-        super().__init__(color)
-        # TODO: Additional AI-specific attributes to be added here
+    """A seat played by the server. Its search (see mcts.py) is created on first use, lives
+    only in the process hosting the game, and is not part of the game state."""
+    def __init__(self, color: PlayerColor, node_count: int = 0):
+        super().__init__(color, node_count)
+        self.bot = None
+
+    def clone(self) -> AIPlayer:
+        player = super().clone()
+        player.bot = None
+        return player
+
+    def choose_command(self, game_state: GameState, player_name: str) -> dict | None:
+        if self.bot is None:
+            from mcts import MCTSBot
+            self.bot = MCTSBot()
+        return self.bot.choose(game_state, player_name)
+
+    def observe(self, command: dict) -> None:
+        if self.bot is not None:
+            self.bot.observe(command)
 
 class Station:
     def __init__(self, connection: Tuple[Node, Edge], player: Player):
@@ -87,48 +122,246 @@ class Station:
         self.edge: Edge = connection[1]
         self.player: Player = player
 
+# Serializers for the fields of a player in GameState.to_dict, also used to build patches
+PLAYER_FIELDS = {
+    'color': lambda player: player.color.value,                                 # public
+    'ai': lambda player: isinstance(player, AIPlayer),                          # public
+    'cards': lambda player: {card_color.name: count for card_color, count in player.cards.items()},  # player specific private
+    'trains_left': lambda player: player.trains_left,                           # public
+    'stations_left': lambda player: player.stations_left,                       # public
+    'tickets': lambda player: [ticket.jsonify() for ticket in player.tickets],  # player specific private
+    'offered_tickets': lambda player: [ticket.jsonify() for ticket in player.offered_tickets],  # player specific private
+    'score': lambda player: player.score,                                       # public
+    'ticket_points': lambda player: player.ticket_progress.jsonify(),          # player specific private
+}
+
+def escape_pointer(token: str) -> str:
+    return token.replace('~', '~0').replace('/', '~1')
+
+def unescape_pointer(token: str) -> str:
+    return token.replace('~1', '/').replace('~0', '~')
+
+def read_tickets(tickets_file: str, graph: Graph) -> Tuple[List[Ticket], List[Ticket]]:
+    """Parse a tickets file into (regular tickets, long tickets)."""
+    tickets_list = []
+    long_tickets = []
+    with open(tickets_file, 'r') as f:
+        tickets = f.read().splitlines()
+    for line in tickets:
+        parts = line.split(' ')
+        if len(parts) == 4 and parts[3] == 'LONG':
+            city1_name, city2_name, points_str, _ = parts
+            points = int(points_str)
+            city1 = graph.get_node(city1_name)
+            city2 = graph.get_node(city2_name)
+            if city1 is None or city2 is None:
+                warnings.warn(f"Ticket cities {city1_name} or {city2_name} not found in graph. Skipping ticket.")
+                continue
+            ticket = Ticket(city1, city2, points)
+            long_tickets.append(ticket)
+        else:
+            city1_name, city2_name, points_str = parts
+            points = int(points_str)
+            city1 = graph.get_node(city1_name)
+            city2 = graph.get_node(city2_name)
+            if city1 is None or city2 is None:
+                warnings.warn(f"Ticket cities {city1_name} or {city2_name} not found in graph. Skipping ticket.")
+                continue
+            ticket = Ticket(city1, city2, points)
+            tickets_list.append(ticket)
+    return tickets_list, long_tickets
+
+def board_files(board_type: str) -> Tuple[str, str, str]:
+    return (
+        f"static/{board_type}/cities.txt",
+        f"static/{board_type}/connections.txt",
+        f"static/{board_type}/tickets.txt"
+    )
+
+class BoardTemplate:
+    """The parts of a board that never change during a game: its graph and ticket pool.
+
+    A template is parsed once per set of board files and shared, read-only, by every game
+    played on that board. Games keep only their own overlay on top of it (claimed routes,
+    stations, decks, players).
+    """
+    _cache: Dict[Tuple[str, str, str], BoardTemplate] = {}
+
+    def __init__(self, graph: Graph, tickets: List[Ticket], long_tickets: List[Ticket],
+                 files: Tuple[str, str, str] | None = None):
+        graph.freeze()
+        self.graph: Graph = graph
+        self.tickets: Tuple[Ticket, ...] = tuple(tickets)
+        self.long_tickets: Tuple[Ticket, ...] = tuple(long_tickets)
+        self.files: Tuple[str, str, str] | None = files  # (cities, connections, tickets) it was parsed from
+        self._route_tables: RouteTables | None = None
+        self._route_index: RouteIndex | None = None
+
+    @classmethod
+    def parse(cls, cities_file: str, connections_file: str, tickets_file: str) -> BoardTemplate:
+        graph = parse_graph(cities_file, connections_file)
+        tickets, long_tickets = read_tickets(tickets_file, graph)
+        return cls(graph, tickets, long_tickets, (cities_file, connections_file, tickets_file))
+
+    def route_tables(self) -> RouteTables:
+        """All-pairs route costs over the whole board, cached on disk next to the board files."""
+        if self._route_tables is None:
+            if self.files is None:
+                self._route_tables = RouteTables.compute(self.graph)
+            else:
+                self._route_tables = RouteTables.load(self.graph, *self.files[:2])
+        return self._route_tables
+
+    def route_index(self) -> RouteIndex:
+        if self._route_index is None:
+            self._route_index = RouteIndex(self.graph)
+        return self._route_index
+
+    @classmethod
+    def load(cls, cities_file: str, connections_file: str, tickets_file: str) -> BoardTemplate:
+        """Cached version of parse."""
+        key = (cities_file, connections_file, tickets_file)
+        template = cls._cache.get(key)
+        if template is None:
+            template = cls._cache[key] = cls.parse(*key)
+        return template
+
+    @classmethod
+    def for_board(cls, board_type: str) -> BoardTemplate:
+        return cls.load(*board_files(board_type))
+
+EMPTY_BOARD = BoardTemplate(Graph(), [], [])
+
 class GameState:
-    def __init__(self):
-        self.graph: Graph = Graph()
+    def __init__(self, template: BoardTemplate = EMPTY_BOARD, seed: int | None = None):
+        self.template: BoardTemplate = template
+        # Every shuffle of the game draws from its own generator, so a seed replays the game
+        self.seed: int = seed if seed is not None else random.randrange(2 ** 32)
+        self.rng: random.Random = random.Random(self.seed)
+        self.graph: Graph = template.graph
         self.players: Dict[str, Player] = {} # Holds player order as well
-        self.available_tickets: List[Ticket] = []
-        self.long_tickets: List[Ticket] = []
-        self.face_up_cards: List[CardColor] = [CardColor.random() for _ in range(5)] # 5 Initial face-up cards
+        # Per-game overlay on the shared board
+        self.edge_owners: List[str | None] = [None] * len(template.graph.edge_list) # player name by Edge.index
+        self.station_owners: List[str | None] = [None] * len(template.graph.nodes) # player name by Node.index
+        self.available_tickets: List[Ticket] = list(template.tickets)
+        self.long_tickets: List[Ticket] = list(template.long_tickets)
+        self.train_cards: TrainCardDeck = TrainCardDeck.full(self.rng)
+        self.face_up_cards: List[CardColor | None] = [None] * FACE_UP_CARDS # None once both piles run out
+        self.train_cards.fill_face_up(self.face_up_cards)
         self.current_player_turn: str | None = None
+        self.final_turns: int | None = None # turns left once a player is down to their last trains
+        self.game_over: bool = False
+        self._open_routes: OpenRouteTables | None = None # built on first use, then kept up to date
+        self._open_route_index: OpenRouteIndex | None = None # likewise
+        # Every committed change bumps the version; the log keeps the JSON Pointer paths
+        # (into to_dict()) changed by each recent version so clients can catch up with a patch
+        self.version: int = 0
+        self.change_log: Deque[Tuple[int, List[str]]] = deque(maxlen=CHANGE_LOG_SIZE)
+        self.pending_changes: Dict[str, None] = {}
 
     def parse_tickets(self, tickets_file: str):
-        with open(tickets_file, 'r') as f:
-            tickets = f.read().splitlines()
-        for line in tickets:
-            parts = line.split(' ')
-            if len(parts) == 4 and parts[3] == 'LONG':
-                city1_name, city2_name, points_str, _ = parts
-                points = int(points_str)
-                city1 = self.graph.get_node(city1_name)
-                city2 = self.graph.get_node(city2_name)
-                if city1 is None or city2 is None:
-                    warnings.warn(f"Ticket cities {city1_name} or {city2_name} not found in graph. Skipping ticket.")
-                    continue
-                ticket = Ticket(city1, city2, points)
-                self.long_tickets.append(ticket)
-            else:
-                city1_name, city2_name, points_str = parts
-                points = int(points_str)
-                city1 = self.graph.get_node(city1_name)
-                city2 = self.graph.get_node(city2_name)
-                if city1 is None or city2 is None:
-                    warnings.warn(f"Ticket cities {city1_name} or {city2_name} not found in graph. Skipping ticket.")
-                    continue
-                ticket = Ticket(city1, city2, points)
-                self.available_tickets.append(ticket)
-
-    def add_player(self, player_name: str, color: PlayerColor):
+        tickets, long_tickets = read_tickets(tickets_file, self.graph)
+        self.available_tickets.extend(tickets)
+        self.long_tickets.extend(long_tickets)
+
+    # ----- versioning -----
+
+    def mark_changed(self, *paths: str) -> None:
+        for path in paths:
+            self.pending_changes[path] = None
+
+    def mark_player_changed(self, player: Player, *fields: str) -> None:
+        prefix = f"/players/{escape_pointer(self.player_name(player))}"
+        self.mark_changed(*(f"{prefix}/{field}" for field in fields))
+
+    def commit(self) -> int:
+        """Close the current set of changes as a new version."""
+        if self.pending_changes:
+            self.version += 1
+            self.change_log.append((self.version, list(self.pending_changes)))
+            self.pending_changes = {}
+        return self.version
+
+    def discard_changes(self) -> None:
+        """Forget uncommitted changes, e.g. once a freshly dealt game is the baseline snapshot."""
+        self.pending_changes = {}
+
+    def changed_paths_since(self, version: int) -> List[str] | None:
+        """Paths changed after version, or None if the log no longer reaches back that far."""
+        if version == self.version:
+            return []
+        if version > self.version or not self.change_log or self.change_log[0][0] > version + 1:
+            return None
+        paths: Dict[str, None] = {}
+        for log_version, log_paths in self.change_log:
+            if log_version > version:
+                paths.update(dict.fromkeys(log_paths))
+        return list(paths)
+
+    def value_at(self, parts: List[str]):
+        """Serialize one field of to_dict() without building the whole document."""
+        field = parts[0]
+        if field == 'players':
+            player = self.players[parts[1]]
+            if len(parts) == 2:
+                return {name: serializer(player) for name, serializer in PLAYER_FIELDS.items()}
+            return PLAYER_FIELDS[parts[2]](player)
+        if field == 'graph':  # /graph/edges/<index>/occupied_by
+            return self.edge_owners[int(parts[2])]
+        if field == 'stations':
+            return self.station_owners[int(parts[1])] if len(parts) == 2 else list(self.station_owners)
+        if field == 'available_tickets':
+            return [ticket.jsonify() for ticket in self.available_tickets]
+        if field == 'long_tickets':
+            return [ticket.jsonify() for ticket in self.long_tickets]
+        if field == 'train_cards':
+            return self.train_cards.jsonify()
+        if field == 'seed':
+            return self.seed
+        if field == 'face_up_cards':
+            return [card.name if card is not None else None for card in self.face_up_cards]
+        if field == 'current_player_turn':
+            return self.current_player_turn
+        if field == 'final_turns':
+            return self.final_turns
+        if field == 'game_over':
+            return self.game_over
+        raise KeyError(f"Unknown game state path {'/'.join(parts)}")
+
+    def route_owner(self, edge: Edge) -> str | None:
+        return self.edge_owners[edge.index]
+
+    def open_route_tables(self) -> OpenRouteTables:
+        """Route costs avoiding every claimed route, updated as routes are claimed."""
+        if self._open_routes is None:
+            self._open_routes = OpenRouteTables(self.graph, self.template.route_tables())
+            for index, owner in enumerate(self.edge_owners):
+                if owner is not None:
+                    self._open_routes.claim(index)
+        return self._open_routes
+
+    def open_route_index(self) -> OpenRouteIndex:
+        """The board's routes by color and length, without the claimed ones."""
+        if self._open_route_index is None:
+            claimed = [owner is not None for owner in self.edge_owners]
+            self._open_route_index = OpenRouteIndex(self.template.route_index(), claimed)
+        return self._open_route_index
+
+    def longest_path(self, player_name: str) -> int:
+        """Length in trains of the player's longest continuous path."""
+        return longest_path(self.graph, (index for index, owner in enumerate(self.edge_owners) if owner == player_name))
+
+    def can_claim_route(self, player_name: str, edge: Edge) -> bool:
+        return self.edge_owners[edge.index] is None and self.players[player_name].check_can_claim_route(edge)
+
+    def add_player(self, player_name: str, color: PlayerColor, ai: bool = False):
         if player_name in self.players:
             warnings.warn("Player name already exists.")
         elif color in [p.color for p in self.players.values()]:
             warnings.warn("Player color already taken.")
         else:
-            self.players[player_name] = Player(color)
+            self.players[player_name] = (AIPlayer if ai else Player)(color, len(self.graph.node_list))
+            self.mark_changed(f"/players/{escape_pointer(player_name)}")
 
     def advance_turn(self):
         if not self.players:
@@ -140,119 +373,37 @@ class GameState:
             current_index = player_names.index(self.current_player_turn)
             next_index = (current_index + 1) % len(player_names)
             self.current_player_turn = player_names[next_index]
+        self.mark_changed('/current_player_turn')
 
-    def prompt_player_action(self, player_name: str) -> str:
-        return f"Player {player_name}, it's your turn! Choose an action: DRAW_CARDS, CLAIM_ROUTE, DRAW_TICKETS."
-
-    def draw_cards(self, player: Player) -> None:
-        for _ in range(2):
-            while True:
-                print("Pick a card to draw (1-5 for face-up cards, 6 for random): ")
-                choice = input().strip()
-                if choice in ['1', '2', '3', '4', '5', '6']:
-                    break
-                else:
-                    print("Invalid choice. Please try again.")
-            choice = int(choice) - 1
-            if choice == 5:
-                drawn_card = CardColor.random()
-                player.cards[drawn_card] += 1
-                print(f"You drew a random card: {drawn_card.name}")
-            else:
-                drawn_card = self.face_up_cards[choice]
-                player.cards[drawn_card] += 1
-                print(f"You drew a face-up card: {drawn_card.name}")
-                # Replace the drawn face-up card with a new random card
-                self.face_up_cards[choice] = CardColor.random()
-
-    def draw_tickets(self, player: Player):
-        tickets = random.sample(self.available_tickets, 3)
-        print("You have drawn the following tickets:")
-        for idx, ticket in enumerate(tickets):
-            print(f"{idx + 1}: {ticket}")
-        print("Select tickets to keep (e.g., 1 3 to keep tickets 1 and 3): ")
-        while True:
-            choices = input().strip().split()
-            if all(choice in ['1', '2', '3'] for choice in choices):
-                break
-            else:
-                print("Invalid choices. Please try again.")
-        for choice in choices:
-            index = int(choice) - 1
-            if 0 <= index < len(tickets):
-                player.tickets.append(tickets[index])
-                self.available_tickets.remove(tickets[index])
+    def set_edge_owner(self, edge: Edge, player_name: str) -> None:
+        self.edge_owners[edge.index] = player_name
+        self.mark_changed(f"/graph/edges/{edge.index}/occupied_by")
+        if self._open_routes is not None:
+            self._open_routes.claim(edge.index)
+        if self._open_route_index is not None:
+            self._open_route_index.claim(edge.index)
+        if self.players[player_name].ticket_progress.add_route(edge):
+            self.mark_changed(f"/players/{escape_pointer(player_name)}/ticket_points")
+
+    def give_tickets(self, player_name: str, tickets: List[Ticket]) -> None:
+        player = self.players[player_name]
+        player.tickets.extend(tickets)
+        player.ticket_progress.add_tickets(tickets)
+        prefix = f"/players/{escape_pointer(player_name)}"
+        self.mark_changed(f"{prefix}/tickets", f"{prefix}/ticket_points")
 
     def get_initial_tickets(self, player: Player):
-        short_tickets = random.sample(self.available_tickets, 3)
-        long_ticket = random.sample(self.long_tickets, 1)
-        tickets = short_tickets + long_ticket
-        player.tickets = player.tickets + tickets
-        for ticket in short_tickets:
-            self.available_tickets.remove(ticket)
-        self.long_tickets.remove(long_ticket[0])
+        """Deal 3 tickets and a long one off the top of the (shuffled) ticket decks."""
+        tickets = self.available_tickets[:3] + self.long_tickets[:1]
+        del self.available_tickets[:3]
+        del self.long_tickets[:1]
+        self.give_tickets(self.player_name(player), tickets)
+        self.mark_changed('/available_tickets', '/long_tickets')
         return [ticket.jsonify() for ticket in tickets]
 
-    def claim_route(self, player: Player):
-        while True:
-            print("Enter the two cities of the route you want to claim (e.g., CityA CityB): ")
-            route_input = input().strip().split()
-            if len(route_input) == 2:
-                city1_name, city2_name = route_input
-                edge = self.graph.get_edge(city1_name, city2_name)
-                if not edge:
-                    print("Invalid route. Please try again.")
-                elif not player.check_can_claim_route(edge):
-                    print("You cannot claim this route. Please try again.")
-                else:
-                    break
-            else:
-                print("Invalid input format. Please try again.")
-        print("Select cards to use for claiming the route (e.g., red red joker):")
-        while True:
-            selected_cards = input().strip().split()
-            selected_cards = [CardColor(card.lower()) for card in selected_cards]
-            selected_cards_counts = defaultdict(int)
-            for card in selected_cards:
-                selected_cards_counts[card] += 1
-
-            for card, count in selected_cards_counts.items():
-                if player.cards[card] < count:
-                    print(f"You do not have enough {card.name} cards. Please try again.")
-                    break
-            else:
-                break
-        # Deduct cards and update game state
-        for card in selected_cards:
-            player.cards[card] -= 1
-        edge.occupied_by = player
-
-    def build_station(self, player: Player):
-        pass
-
-    def begin_game(self):
-        print("Game has begun!")
-        print("Initial face-up cards: ", [card.name for card in self.face_up_cards])
-        while any(player.trains_left > 2 for player in self.players.values()):
-            print(self.prompt_player_action(self.current_player_turn))
-            while True:
-                turn = input().strip().upper()
-                player = self.players[self.current_player_turn]
-                print(f"Your cards: {player.cards}")
-                print(f"Face-up cards to choose: {self.face_up_cards}")
-                if turn == "DRAW_CARDS":
-                    self.draw_cards(player)
-                    break
-                elif turn == "CLAIM_ROUTE":
-                    self.claim_route(player)
-                    break
-                elif turn == "DRAW_TICKETS":
-                    self.draw_tickets(player)
-                    break
-                else:
-                    print("Invalid action. Please try again.")
-            self.advance_turn()
-        print("Game over! Calculating final scores...")
+    def discard_cards(self, cards: Dict[CardColor, int]) -> None:
+        self.train_cards.discard(cards)
+        self.mark_changed('/train_cards')
 
     def to_dict(self):
         available_tickets = [ticket.jsonify() for ticket in self.available_tickets]
@@ -268,59 +419,120 @@ class GameState:
                         'length': edge.length,
                         'color': edge.color.name if isinstance(edge, ColoredEdge) else None,
                         'joker_cost': edge.joker_cost if isinstance(edge, FerryEdge) else None,
-                        'tunnel': edge.tunnel
+                        'tunnel': edge.tunnel,
+                        'occupied_by': owner
                     }
-                    for edge in self.graph.edges.values()
+                    for edge, owner in zip(self.graph.edge_list, self.edge_owners)
                 ]
             },
+            'stations': list(self.station_owners),
             'players': {
-                player_name: {
-                    # public
-                    'color': player.color.value,
-                    # player specific private
-                    'cards': {card_color.name: count for card_color, count in player.cards.items()},
-                    # public
-                    'trains_left': player.trains_left,
-                    # player specific private
-                    'tickets': [ticket.jsonify() for ticket in player.tickets],
-                    # public
-                    'score': player.score
-                }
+                player_name: {name: serializer(player) for name, serializer in PLAYER_FIELDS.items()}
                 for player_name, player in self.players.items()
             },
             # private
             'available_tickets': available_tickets,
             'long_tickets': long_tickets,
+            'train_cards': self.train_cards.jsonify(),
+            'seed': self.seed,
             # public
-            'face_up_cards': [card.name for card in self.face_up_cards],
-            'current_player_turn': self.current_player_turn
+            'face_up_cards': self.value_at(['face_up_cards']),
+            'current_player_turn': self.current_player_turn,
+            'final_turns': self.final_turns,
+            'game_over': self.game_over,
+            'version': self.version
         }
         return data
 
-def setup_game(cities_file: str, connections_file: str, tickets_file: str, player_info: List[Tuple[str, PlayerColor]]) -> GameState:
-    game_state = GameState()
-    game_state.graph = parse_graph(cities_file, connections_file)
-    game_state.parse_tickets(tickets_file)
+    def clone(self) -> GameState:
+        """Copy the per-game overlay; the board template stays shared."""
+        game_state = GameState.__new__(GameState)
+        game_state.template = self.template
+        game_state.graph = self.graph
+        game_state.players = {player_name: player.clone() for player_name, player in self.players.items()}
+        game_state.edge_owners = self.edge_owners.copy()
+        game_state.station_owners = self.station_owners.copy()
+        game_state.available_tickets = self.available_tickets.copy()
+        game_state.long_tickets = self.long_tickets.copy()
+        game_state.seed = self.seed
+        game_state.rng = random.Random()
+        game_state.rng.setstate(self.rng.getstate())
+        game_state.train_cards = self.train_cards.copy()
+        game_state.train_cards.rng = game_state.rng
+        game_state.face_up_cards = self.face_up_cards.copy()
+        game_state._open_routes = self._open_routes.copy() if self._open_routes is not None else None
+        game_state._open_route_index = self._open_route_index.copy() if self._open_route_index is not None else None
+        game_state.current_player_turn = self.current_player_turn
+        game_state.final_turns = self.final_turns
+        game_state.game_over = self.game_over
+        game_state.version = self.version
+        game_state.change_log = self.change_log.copy()
+        game_state.pending_changes = self.pending_changes.copy()
+        return game_state
+
+    def player_name(self, player: Player | None) -> str | None:
+        if player is None:
+            return None
+        for player_name, p in self.players.items():
+            if p is player:
+                return player_name
+        return None
+
+    @classmethod
+    def from_dict(cls, data: dict, template: BoardTemplate) -> GameState:
+        """Rebuild a game played on template from to_dict() output."""
+        game_state = cls(template, data.get('seed'))
+        def ticket(ticket_data):
+            return Ticket(game_state.graph.get_node(ticket_data['from']), game_state.graph.get_node(ticket_data['to']), ticket_data['points'])
+        for player_name, player_data in data['players'].items():
+            player_class = AIPlayer if player_data.get('ai') else Player
+            player = player_class(PlayerColor(player_data['color']), len(template.graph.node_list))
+            player.cards = {CardColor[card]: count for card, count in player_data['cards'].items()}
+            player.trains_left = player_data['trains_left']
+            player.stations_left = player_data.get('stations_left', player.stations_left)
+            player.tickets = [ticket(t) for t in player_data['tickets']]
+            player.offered_tickets = [ticket(t) for t in player_data.get('offered_tickets', [])]
+            player.score = player_data['score']
+            game_state.players[player_name] = player
+        game_state.edge_owners = [edge_data.get('occupied_by') for edge_data in data['graph']['edges']]
+        # Ticket progress is derived: replay the claimed routes, then file the tickets
+        for edge, owner in zip(game_state.graph.edge_list, game_state.edge_owners):
+            if owner is not None:
+                game_state.players[owner].ticket_progress.add_route(edge)
+        for player in game_state.players.values():
+            player.ticket_progress.add_tickets(player.tickets)
+        game_state.station_owners = data.get('stations') or game_state.station_owners
+        game_state.available_tickets = [ticket(t) for t in data['available_tickets']]
+        game_state.long_tickets = [ticket(t) for t in data['long_tickets']]
+        game_state.face_up_cards = [CardColor[card] if card is not None else None for card in data['face_up_cards']]
+        game_state.current_player_turn = data['current_player_turn']
+        game_state.final_turns = data.get('final_turns')
+        game_state.game_over = data.get('game_over', False)
+        # The change log is not persisted, clients that are behind get a snapshot
+        game_state.version = data.get('version', 0)
+        # The generator's state is not persisted either: shuffles after a reload are seeded
+        # from the game's seed and version instead, which is just as reproducible
+        game_state.rng = random.Random(f"{game_state.seed}/{game_state.version}")
+        if 'train_cards' in data:
+            game_state.train_cards = TrainCardDeck.from_json(data['train_cards'], game_state.rng)
+        else:
+            game_state.train_cards.rng = game_state.rng
+        game_state.discard_changes()
+        return game_state
+
+def setup_game(cities_file: str, connections_file: str, tickets_file: str, player_info: List[Tuple[str, PlayerColor]],
+               ai_players: Iterable[str] = (), seed: int | None = None) -> GameState:
+    game_state = GameState(BoardTemplate.load(cities_file, connections_file, tickets_file), seed)
+    game_state.rng.shuffle(game_state.available_tickets)
+    game_state.rng.shuffle(game_state.long_tickets)
+    ai_players = set(ai_players)
     for player_name, color in player_info:
-        game_state.add_player(player_name, color)
+        game_state.add_player(player_name, color, ai=player_name in ai_players)
         player = game_state.players[player_name]
-        for _ in range(4):
-            card = CardColor.random()
+        for card in game_state.train_cards.draw(4):
             player.cards[card] += 1
         game_state.get_initial_tickets(player)
     if player_info:
         game_state.current_player_turn = player_info[0][0]
+    game_state.discard_changes()
     return game_state
-
-#
-# if __name__ == "__main__":
-#     # Example setup
-#     cities_file = "static/europe/cities.txt"
-#     connections_file = "static/europe/connections.txt"
-#     tickets_file = "static/europe/tickets.txt"
-#     player_info = [("Bartek", PlayerColor.RED)]#, ("Alicja", PlayerColor.BLUE)]
-#     game_state = setup_game(cities_file, connections_file, tickets_file, player_info)
-#     print("Game setup complete. Players:")
-#     for player_name, player in game_state.players.items():
-#         print(f"{player_name} ({player.color.name}) - Cards: {player.cards}, Trains left: {player.trains_left}")
-#     game_state.begin_game()
\ No newline at end of file
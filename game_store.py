@@ -0,0 +1,293 @@
+from __future__ import annotations
+
+import json
+import threading
+import time
+from typing import Dict, List, Tuple
+
+import redis
+
+from game_setup import BoardTemplate, GameState, PLAYER_FIELDS, unescape_pointer
+from metrics import SERIALIZE_SECONDS, measured
+
+GAME_TTL = 86400  # seconds, games expire from Redis after 24 hours
+FLUSH_DELAY = 0.05  # seconds, changes to any game within this window go out in one round trip
+POOL_TIMEOUT = 5  # seconds to wait for a free Redis connection before giving up
+TTL_REFRESH_INTERVAL = GAME_TTL / 4  # seconds between pushing back the expiry of every tracked game
+
+# Redis layout of a game, every value a JSON document:
+#   game:{lobby_id}                    hash: lobby, players (seat order), face_up_cards,
+#                                      current_player_turn, final_turns, game_over, version,
+#                                      edge:{index} per claimed route, station:{index} per station
+#   game:{lobby_id}:player:{player_id} hash: one field per entry of PLAYER_FIELDS
+#   game:{lobby_id}:decks              hash: available_tickets, long_tickets, train_cards, seed
+PUBLIC_KEY = "game:{lobby_id}"
+PLAYER_KEY = "game:{lobby_id}:player:{player_id}"
+DECKS_KEY = "game:{lobby_id}:decks"
+DECK_FIELDS = ('available_tickets', 'long_tickets', 'train_cards', 'seed')
+
+def create_connection_pool(host: str = 'localhost', port: int = 6379, db: int = 0, max_connections: int = 64,
+                           timeout: float = POOL_TIMEOUT) -> redis.ConnectionPool:
+    """A bounded pool: once max_connections are in use, callers wait for one to be returned."""
+    return redis.BlockingConnectionPool(host=host, port=port, db=db, max_connections=max_connections, timeout=timeout)
+
+class PendingWrites:
+    """Redis commands recorded for a later pipeline, in order."""
+    def __init__(self):
+        self.commands: List[Tuple[str, tuple, dict]] = []
+
+    def delete(self, *args, **kwargs) -> None:
+        self.commands.append(('delete', args, kwargs))
+
+    def hset(self, *args, **kwargs) -> None:
+        self.commands.append(('hset', args, kwargs))
+
+    def hdel(self, *args, **kwargs) -> None:
+        self.commands.append(('hdel', args, kwargs))
+
+    def expire(self, *args, **kwargs) -> None:
+        self.commands.append(('expire', args, kwargs))
+
+    def replay(self, pipe) -> None:
+        for name, args, kwargs in self.commands:
+            getattr(pipe, name)(*args, **kwargs)
+
+class GameStore:
+    """Persists games to Redis as hashes and writes only the fields that changed.
+
+    Changes are not written immediately: mark_dirty() records the writes for what changed and
+    a timer sends every recorded write FLUSH_DELAY seconds later in a single pipeline, so a
+    burst of mutations (to one game or many) costs one round trip. What changed is read from
+    the game's change log, relative to the last version recorded, while the caller still
+    holds the game, so a flush never sees a game half way through a change.
+    """
+    def __init__(self, redis_client, ttl: int = GAME_TTL, flush_delay: float | None = FLUSH_DELAY):
+        self.redis_client = redis_client
+        self.ttl: int = ttl
+        self.flush_delay: float | None = flush_delay  # None to only flush explicitly
+        # lobby_id -> (version recorded, player ids recorded, when its keys last had their expiry set)
+        self.persisted: Dict[str, Tuple[int, List[str], float]] = {}
+        self.dirty: Dict[str, PendingWrites] = {}
+        self.lock = threading.RLock()
+        # Held while writes go out, so that they reach Redis in the order they were recorded
+        self.write_lock = threading.Lock()
+        self.timer: threading.Timer | None = None
+        self.ttls_refreshed_at: float = time.monotonic()
+
+    # ----- keys -----
+
+    def keys(self, lobby_id: str, player_ids) -> List[str]:
+        return [
+            PUBLIC_KEY.format(lobby_id=lobby_id),
+            DECKS_KEY.format(lobby_id=lobby_id),
+            *(PLAYER_KEY.format(lobby_id=lobby_id, player_id=player_id) for player_id in player_ids)
+        ]
+
+    # ----- writing -----
+
+    def save(self, lobby_id: str, lobby: dict, game_state: GameState) -> int:
+        """Write a whole game, replacing whatever was stored. Returns the number of bytes written.
+        Call with the game held."""
+        with self.write_lock:
+            with self.lock:
+                self.dirty.pop(lobby_id, None)
+                pipe = self.redis_client.pipeline(transaction=False)
+                written = self._write_full(pipe, lobby_id, lobby, game_state)
+            pipe.execute()
+            return written
+
+    def mark_dirty(self, lobby_id: str, lobby: dict, game_state: GameState) -> None:
+        """Record the writes for a game's committed changes, to go out with the next flush.
+        Call with the game held."""
+        with self.lock:
+            pending = self.dirty.setdefault(lobby_id, PendingWrites())
+            self._write_changes(pending, lobby_id, lobby, game_state)
+            if self.flush_delay is not None and self.timer is None:
+                self.timer = threading.Timer(self.flush_delay, self.flush)
+                self.timer.daemon = True
+                self.timer.start()
+
+    def flush(self, lobby_id: str | None = None) -> None:
+        """Send the recorded writes of one game, or of every game, in one pipeline. Flushing
+        every game also pushes back the expiry of all tracked games now and then."""
+        with self.write_lock:
+            with self.lock:
+                if lobby_id is None:
+                    dirty, self.dirty = self.dirty, {}
+                    if self.timer is not None:
+                        self.timer.cancel()
+                        self.timer = None
+                elif lobby_id in self.dirty:
+                    dirty = {lobby_id: self.dirty.pop(lobby_id)}
+                else:
+                    return
+                refresh = lobby_id is None and time.monotonic() - self.ttls_refreshed_at >= TTL_REFRESH_INTERVAL
+                if not dirty and not refresh:
+                    return
+                pipe = self.redis_client.pipeline(transaction=False)
+                if refresh:
+                    self.refresh_ttls(pipe, list(self.persisted))
+            for pending in dirty.values():
+                pending.replay(pipe)
+            pipe.execute()
+
+    @measured(SERIALIZE_SECONDS, 'store_full')
+    def _write_full(self, pipe, lobby_id: str, lobby: dict, game_state: GameState) -> int:
+        player_ids = list(game_state.players)
+        previous = self.persisted.get(lobby_id, (0, []))[1]
+        pipe.delete(*self.keys(lobby_id, set(previous) | set(player_ids)))
+        public = {
+            'lobby': lobby,
+            'players': player_ids,
+            'face_up_cards': game_state.value_at(['face_up_cards']),
+            'current_player_turn': game_state.current_player_turn,
+            'final_turns': game_state.final_turns,
+            'game_over': game_state.game_over,
+            'version': game_state.version,
+        }
+        for index, owner in enumerate(game_state.edge_owners):
+            if owner is not None:
+                public[f"edge:{index}"] = owner
+        for index, owner in enumerate(game_state.station_owners):
+            if owner is not None:
+                public[f"station:{index}"] = owner
+        mappings = {PUBLIC_KEY.format(lobby_id=lobby_id): public}
+        mappings[DECKS_KEY.format(lobby_id=lobby_id)] = {field: game_state.value_at([field]) for field in DECK_FIELDS}
+        for player_id, player in game_state.players.items():
+            mappings[PLAYER_KEY.format(lobby_id=lobby_id, player_id=player_id)] = {
+                field: serializer(player) for field, serializer in PLAYER_FIELDS.items()
+            }
+        written = 0
+        for key, mapping in mappings.items():
+            encoded = {field: json.dumps(value) for field, value in mapping.items()}
+            written += sum(len(field) + len(value) for field, value in encoded.items())
+            pipe.hset(key, mapping=encoded)
+            pipe.expire(key, self.ttl)
+        self.persisted[lobby_id] = (game_state.version, player_ids, time.monotonic())
+        return written
+
+    @measured(SERIALIZE_SECONDS, 'store_changes')
+    def _write_changes(self, pipe, lobby_id: str, lobby: dict, game_state: GameState) -> None:
+        version, _, expiry_set_at = self.persisted.get(lobby_id, (None, [], 0.0))
+        paths = game_state.changed_paths_since(version) if version is not None else None
+        if paths is None or time.monotonic() - expiry_set_at > self.ttl / 2:
+            # Nothing written yet, too far behind the change log, or the keys may have expired
+            self._write_full(pipe, lobby_id, lobby, game_state)
+            return
+        if not paths:
+            return
+        public_key = PUBLIC_KEY.format(lobby_id=lobby_id)
+        updates: Dict[str, Dict[str, object]] = {public_key: {'version': game_state.version}}
+        removed: List[str] = []
+        for path in paths:
+            parts = [unescape_pointer(part) for part in path.split('/')[1:]]
+            field = parts[0]
+            if field == 'players':
+                player_key = PLAYER_KEY.format(lobby_id=lobby_id, player_id=parts[1])
+                player = game_state.players[parts[1]]
+                fields = PLAYER_FIELDS if len(parts) == 2 else {parts[2]: PLAYER_FIELDS[parts[2]]}
+                updates.setdefault(player_key, {}).update({name: serializer(player) for name, serializer in fields.items()})
+                if len(parts) == 2:
+                    updates[public_key]['players'] = list(game_state.players)
+            elif field == 'graph':
+                owner = game_state.edge_owners[int(parts[2])]
+                if owner is None:
+                    removed.append(f"edge:{parts[2]}")
+                else:
+                    updates[public_key][f"edge:{parts[2]}"] = owner
+            elif field == 'stations':
+                owner = game_state.station_owners[int(parts[1])]
+                if owner is None:
+                    removed.append(f"station:{parts[1]}")
+                else:
+                    updates[public_key][f"station:{parts[1]}"] = owner
+            elif field in DECK_FIELDS:
+                updates.setdefault(DECKS_KEY.format(lobby_id=lobby_id), {})[field] = game_state.value_at([field])
+            else:
+                updates[public_key][field] = game_state.value_at(parts)
+        for key, mapping in updates.items():
+            pipe.hset(key, mapping={field: json.dumps(value) for field, value in mapping.items()})
+        if removed:
+            pipe.hdel(public_key, *removed)
+        player_ids = list(game_state.players)
+        for key in self.keys(lobby_id, player_ids):
+            pipe.expire(key, self.ttl)
+        self.persisted[lobby_id] = (game_state.version, player_ids, time.monotonic())
+
+    def refresh_ttls(self, pipe, lobby_ids) -> None:
+        """Push back the expiry of every key of the given games, so that games held in memory
+        do not expire from Redis while nothing changes in them."""
+        with self.lock:
+            now = time.monotonic()
+            for lobby_id in lobby_ids:
+                version, player_ids, _ = self.persisted[lobby_id]
+                for key in self.keys(lobby_id, player_ids):
+                    pipe.expire(key, self.ttl)
+                self.persisted[lobby_id] = (version, player_ids, now)
+            self.ttls_refreshed_at = now
+
+    # ----- reading -----
+
+    def load(self, lobby_id: str) -> Tuple[dict, GameState] | None:
+        """Read a game to take it over: its changes are then tracked for writing."""
+        self.flush(lobby_id)
+        loaded = self.read(lobby_id)
+        if loaded is not None:
+            with self.lock:
+                # The keys' expiry is not known, so the first change rewrites the game whole
+                self.persisted[lobby_id] = (loaded[1].version, list(loaded[1].players), 0.0)
+        return loaded
+
+    def read(self, lobby_id: str) -> Tuple[dict, GameState] | None:
+        """Read a game as stored, without tracking it."""
+        public_key = PUBLIC_KEY.format(lobby_id=lobby_id)
+        pipe = self.redis_client.pipeline(transaction=False)
+        pipe.hgetall(public_key)
+        pipe.hgetall(DECKS_KEY.format(lobby_id=lobby_id))
+        public, decks = pipe.execute()
+        if not public:
+            return None
+        public = {field.decode(): json.loads(value) for field, value in public.items()}
+        decks = {field.decode(): json.loads(value) for field, value in decks.items()}
+        player_ids = public['players']
+        pipe = self.redis_client.pipeline(transaction=False)
+        for player_id in player_ids:
+            pipe.hgetall(PLAYER_KEY.format(lobby_id=lobby_id, player_id=player_id))
+        players = {
+            player_id: {field.decode(): json.loads(value) for field, value in player.items()}
+            for player_id, player in zip(player_ids, pipe.execute())
+        }
+
+        lobby = public['lobby']
+        template = BoardTemplate.for_board(lobby['board'])
+        data = {
+            'graph': {'edges': [
+                {'occupied_by': public.get(f"edge:{index}")}
+                for index in range(len(template.graph.edge_list))
+            ]},
+            'stations': [public.get(f"station:{index}") for index in range(len(template.graph.node_list))],
+            'players': players,
+            'available_tickets': decks.get('available_tickets', []),
+            'long_tickets': decks.get('long_tickets', []),
+            **{field: decks[field] for field in ('train_cards', 'seed') if field in decks},
+            'face_up_cards': public['face_up_cards'],
+            'current_player_turn': public['current_player_turn'],
+            'final_turns': public.get('final_turns'),
+            'game_over': public.get('game_over', False),
+            'version': public['version'],
+        }
+        return lobby, GameState.from_dict(data, template)
+
+    def delete(self, lobby_id: str) -> None:
+        with self.write_lock:
+            with self.lock:
+                self.dirty.pop(lobby_id, None)
+                self.persisted.pop(lobby_id, None)
+            stored_players = self.redis_client.hget(PUBLIC_KEY.format(lobby_id=lobby_id), 'players')
+            player_ids = json.loads(stored_players) if stored_players else []
+            self.redis_client.delete(*self.keys(lobby_id, player_ids))
+
+    def forget(self, lobby_id: str) -> None:
+        """Stop tracking a game that was flushed and dropped from memory."""
+        with self.lock:
+            self.persisted.pop(lobby_id, None)
@@ -0,0 +1,244 @@
+from __future__ import annotations
+
+import json
+from typing import Dict, List, Tuple
+from weakref import WeakKeyDictionary
+
+from board_state import ColoredEdge, FerryEdge
+from game_setup import GameState, PLAYER_FIELDS, escape_pointer, unescape_pointer
+from metrics import SERIALIZE_SECONDS, measured
+
+# What everybody at the table may see of a player. Hand and ticket contents are private,
+# only their sizes are public.
+PUBLIC_PLAYER_FIELDS = {
+    'color': PLAYER_FIELDS['color'],
+    'ai': PLAYER_FIELDS['ai'],
+    'trains_left': PLAYER_FIELDS['trains_left'],
+    'stations_left': PLAYER_FIELDS['stations_left'],
+    'score': PLAYER_FIELDS['score'],
+    'card_count': lambda player: sum(player.cards.values()),
+    'ticket_count': lambda player: len(player.tickets),
+}
+PRIVATE_PLAYER_FIELDS = {
+    'cards': PLAYER_FIELDS['cards'],
+    'tickets': PLAYER_FIELDS['tickets'],
+    'offered_tickets': PLAYER_FIELDS['offered_tickets'],
+    'ticket_points': PLAYER_FIELDS['ticket_points'],
+}
+
+def split_pointer(path: str) -> List[str]:
+    return [unescape_pointer(part) for part in path.split('/')[1:]]
+
+def get_pointer(doc, parts: List[str]):
+    for part in parts:
+        doc = doc[int(part)] if isinstance(doc, list) else doc[part]
+    return doc
+
+def set_pointer(doc, parts: List[str], value):
+    """Copy-on-write update: returns a new document sharing every untouched subtree with doc."""
+    if not parts:
+        return value
+    key = int(parts[0]) if isinstance(doc, list) else parts[0]
+    copy = doc.copy()
+    copy[key] = set_pointer(doc[key], parts[1:], value)
+    return copy
+
+class GameViews:
+    """Memoized projections of a GameState: one public view shared by everybody and one
+    private view per player (their cards and tickets). Server-private data such as the
+    order of the decks and the game's seed is never part of either.
+
+    Views are refreshed at most once per state version, and only the fields whose
+    GameState paths changed since the last refresh are recomputed. Views are never
+    mutated in place, so a document handed out for one version stays valid.
+    """
+    def __init__(self, game_state: GameState):
+        self.game_state: GameState = game_state
+        self.version: int | None = None
+        self.public: dict | None = None
+        self.private: Dict[str, dict] = {}
+        # Version at which each private view last changed. Private patches start from it, so a
+        # client that only hears about its own changes is never behind.
+        self.private_versions: Dict[str, int] = {}
+        self.encoded: Dict[str | None, bytes] = {}  # None for the public view, player name otherwise
+
+    # ----- projection of changed paths -----
+
+    def project(self, path: str) -> Tuple[List[str], str | None, List[str]]:
+        """Map a GameState path to (public view paths, player, that player's private view paths)."""
+        parts = split_pointer(path)
+        field = parts[0]
+        if field == 'players':
+            player_name = escape_pointer(parts[1])
+            if len(parts) == 2:
+                return [path], parts[1], ['']
+            public = {
+                'cards': [f"/players/{player_name}/card_count"],
+                'tickets': [f"/players/{player_name}/ticket_count"],
+                'offered_tickets': [],
+                'ticket_points': [],
+            }.get(parts[2], [path])
+            private = [f"/{parts[2]}"] if parts[2] in PRIVATE_PLAYER_FIELDS else []
+            return public, parts[1], private
+        if field == 'available_tickets':
+            return ['/ticket_deck_size'], None, []
+        if field == 'long_tickets':
+            return ['/long_ticket_deck_size'], None, []
+        if field == 'train_cards':
+            return ['/card_deck_size', '/discard_size'], None, []
+        return [path], None, []
+
+    def public_value(self, parts: List[str]):
+        game_state = self.game_state
+        field = parts[0]
+        if field == 'players':
+            player = game_state.players[parts[1]]
+            if len(parts) == 2:
+                return {name: serializer(player) for name, serializer in PUBLIC_PLAYER_FIELDS.items()}
+            return PUBLIC_PLAYER_FIELDS[parts[2]](player)
+        if field == 'ticket_deck_size':
+            return len(game_state.available_tickets)
+        if field == 'long_ticket_deck_size':
+            return len(game_state.long_tickets)
+        if field == 'card_deck_size':
+            return len(game_state.train_cards)
+        if field == 'discard_size':
+            return game_state.train_cards.discard_size
+        return game_state.value_at(parts)
+
+    # ----- building -----
+
+    def build_public(self) -> dict:
+        game_state = self.game_state
+        return {
+            'graph': {
+                'nodes': list(game_state.graph.nodes.keys()),
+                'edges': [
+                    {
+                        'node1': edge.node1.name,
+                        'node2': edge.node2.name,
+                        'length': edge.length,
+                        'color': edge.color.name if isinstance(edge, ColoredEdge) else None,
+                        'joker_cost': edge.joker_cost if isinstance(edge, FerryEdge) else None,
+                        'tunnel': edge.tunnel,
+                        'occupied_by': owner
+                    }
+                    for edge, owner in zip(game_state.graph.edge_list, game_state.edge_owners)
+                ]
+            },
+            'stations': list(game_state.station_owners),
+            'players': {
+                player_name: {name: serializer(player) for name, serializer in PUBLIC_PLAYER_FIELDS.items()}
+                for player_name, player in game_state.players.items()
+            },
+            'ticket_deck_size': len(game_state.available_tickets),
+            'long_ticket_deck_size': len(game_state.long_tickets),
+            'card_deck_size': len(game_state.train_cards),
+            'discard_size': game_state.train_cards.discard_size,
+            'face_up_cards': game_state.value_at(['face_up_cards']),
+            'current_player_turn': game_state.current_player_turn,
+            'final_turns': game_state.final_turns,
+            'game_over': game_state.game_over,
+        }
+
+    def build_private(self, player_name: str) -> dict:
+        player = self.game_state.players[player_name]
+        return {name: serializer(player) for name, serializer in PRIVATE_PLAYER_FIELDS.items()}
+
+    @measured(SERIALIZE_SECONDS, 'views')
+    def refresh(self) -> None:
+        game_state = self.game_state
+        if self.version == game_state.version:
+            return
+        paths = None if self.version is None else game_state.changed_paths_since(self.version)
+        if paths is None:
+            self.public = self.build_public()
+            self.private = {player_name: self.build_private(player_name) for player_name in game_state.players}
+            self.private_versions = dict.fromkeys(game_state.players, game_state.version)
+            self.encoded = {}
+        else:
+            for path in paths:
+                public_paths, player_name, private_paths = self.project(path)
+                for public_path in public_paths:
+                    parts = split_pointer(public_path)
+                    self.public = set_pointer(self.public, parts, self.public_value(parts))
+                    self.encoded.pop(None, None)
+                if private_paths:
+                    if private_paths == [''] or player_name not in self.private:
+                        self.private[player_name] = self.build_private(player_name)
+                    else:
+                        for private_path in private_paths:
+                            field = private_path[1:]
+                            self.private[player_name] = set_pointer(
+                                self.private[player_name], [field], PRIVATE_PLAYER_FIELDS[field](game_state.players[player_name])
+                            )
+                    self.private_versions[player_name] = game_state.version
+                    self.encoded.pop(player_name, None)
+        self.version = game_state.version
+
+    # ----- access -----
+
+    def public_view(self) -> dict:
+        self.refresh()
+        return self.public
+
+    def private_view(self, player_name: str) -> dict | None:
+        self.refresh()
+        return self.private.get(player_name)
+
+    def private_version(self, player_name: str) -> int:
+        self.refresh()
+        return self.private_versions.get(player_name, self.game_state.version)
+
+    def encoded_view(self, player_name: str | None = None) -> bytes | None:
+        """JSON encoding of the public view (player_name None) or a private view, cached per version."""
+        self.refresh()
+        if player_name not in self.encoded:
+            view = self.public if player_name is None else self.private.get(player_name)
+            if view is None:
+                return None
+            self.encoded[player_name] = json.dumps(view, separators=(',', ':')).encode('utf-8')
+        return self.encoded[player_name]
+
+    def public_patch(self, since: int) -> List[dict] | None:
+        """JSON Patch for the public view since a version, or None if a snapshot is needed."""
+        paths = self.game_state.changed_paths_since(since)
+        if paths is None:
+            return None
+        self.refresh()
+        public_paths: Dict[str, None] = {}
+        for path in paths:
+            public_paths.update(dict.fromkeys(self.project(path)[0]))
+        return [self._op(path, self.public) for path in public_paths]
+
+    def private_patches(self, since: int) -> Dict[str, List[dict]] | None:
+        """Per-player JSON Patches for the private views since a version, only for players whose view changed."""
+        paths = self.game_state.changed_paths_since(since)
+        if paths is None:
+            return None
+        self.refresh()
+        changed: Dict[str, Dict[str, None]] = {}
+        for path in paths:
+            _, player_name, private_paths = self.project(path)
+            if private_paths:
+                changed.setdefault(player_name, {}).update(dict.fromkeys(private_paths))
+        return {
+            player_name: [self._op(path, self.private[player_name]) for path in private_paths]
+            for player_name, private_paths in changed.items()
+        }
+
+    @staticmethod
+    def _op(path: str, view: dict) -> dict:
+        if path == '':
+            return {'op': 'replace', 'path': '', 'value': view}
+        parts = split_pointer(path)
+        op = 'add' if parts[0] == 'players' and len(parts) == 2 else 'replace'
+        return {'op': op, 'path': path, 'value': get_pointer(view, parts)}
+
+_views: WeakKeyDictionary[GameState, GameViews] = WeakKeyDictionary()
+
+def get_views(game_state: GameState) -> GameViews:
+    views = _views.get(game_state)
+    if views is None:
+        views = _views[game_state] = GameViews(game_state)
+    return views
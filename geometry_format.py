@@ -0,0 +1,233 @@
+from __future__ import annotations
+
+import json
+import struct
+import sys
+from array import array
+from typing import Dict, List, Sequence, Tuple
+
+# Binary board geometry, one self-contained file per level of detail.
+#
+# Layout (little-endian, every section 4-byte aligned):
+#   b'TTRG', uint32 version, uint32 header length, JSON header (padded)
+#   uint8   element_type[n]          0 = Path, 1 = Ellipse
+#   uint16  fill[n], stroke[n]       indices into header['palette']
+#   float32 stroke_width[n]
+#   float32 ellipses[4 * n_ellipses] cx, cy, rx, ry in element order
+#   uint32  element_rings[n + 1]     ring range of each element
+#   uint32  element_bodies[n]        leading rings of an element that are bodies, the rest are holes
+#   uint32  ring_offsets[n_rings + 1] vertex range of each ring
+#   int16   coords[2 * n_vertices]   quantized x, y; first vertex of a ring absolute, the rest deltas
+#
+# Quantized coordinates are (x - origin_x) * scale, so that the whole board fits in
+# [0, QUANT_MAX] and every delta fits in an int16.
+
+MAGIC = b'TTRG'
+VERSION = 1
+QUANT_MAX = 32767
+ELEMENT_TYPES = ['Path', 'Ellipse']
+LOD_TOLERANCES = (0.0, 0.25, 1.0)  # in board units, level 0 is only quantized
+
+def _pad(buf: bytearray) -> None:
+    buf.extend(b'\0' * (-len(buf) % 4))
+
+def _write(buf: bytearray, typecode: str, values) -> None:
+    arr = array(typecode, values)
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    buf.extend(arr.tobytes())
+    _pad(buf)
+
+def _read(data: bytes, pos: int, typecode: str, count: int) -> Tuple[array, int]:
+    arr = array(typecode)
+    end = pos + arr.itemsize * count
+    arr.frombytes(data[pos:end])
+    if sys.byteorder != 'little':
+        arr.byteswap()
+    return arr, end + (-end % 4)
+
+def _perpendicular_distance(point, start, end) -> float:
+    (x, y), (x1, y1), (x2, y2) = point, start, end
+    dx, dy = x2 - x1, y2 - y1
+    if dx == 0 and dy == 0:
+        return ((x - x1) ** 2 + (y - y1) ** 2) ** 0.5
+    return abs(dy * x - dx * y + x2 * y1 - y2 * x1) / (dx * dx + dy * dy) ** 0.5
+
+def douglas_peucker(points: Sequence, tolerance: float) -> List:
+    """Simplify an open polyline, keeping both endpoints."""
+    if len(points) < 3 or tolerance <= 0:
+        return list(points)
+    keep = [False] * len(points)
+    keep[0] = keep[-1] = True
+    stack = [(0, len(points) - 1)]
+    while stack:
+        first, last = stack.pop()
+        max_dist, index = 0.0, first
+        for i in range(first + 1, last):
+            dist = _perpendicular_distance(points[i], points[first], points[last])
+            if dist > max_dist:
+                max_dist, index = dist, i
+        if max_dist > tolerance:
+            keep[index] = True
+            stack.append((first, index))
+            stack.append((index, last))
+    return [p for p, k in zip(points, keep) if k]
+
+def simplify_ring(ring: Sequence, tolerance: float) -> List:
+    """Simplify a closed ring (first == last vertex). Rings that would collapse are kept as they are."""
+    if tolerance <= 0 or len(ring) <= 4:
+        return list(ring)
+    # Split at the vertex farthest from the start so both halves have distinct endpoints
+    x0, y0 = ring[0]
+    split = max(range(1, len(ring) - 1), key=lambda i: (ring[i][0] - x0) ** 2 + (ring[i][1] - y0) ** 2)
+    simplified = douglas_peucker(ring[:split + 1], tolerance)[:-1] + douglas_peucker(ring[split:], tolerance)
+    return simplified if len(simplified) >= 4 else list(ring)
+
+def encode_geometry(elements: List[Dict], bbox: Sequence[float], tolerance: float = 0.0) -> bytes:
+    """Encode the output of svg_parser.extract_svg_elements at one level of detail."""
+    origin_x, origin_y = bbox[0], bbox[1]
+    extent = max(bbox[2] - bbox[0], bbox[3] - bbox[1]) or 1.0
+    scale = QUANT_MAX / extent
+
+    palette: List[str] = []
+    palette_index: Dict[str, int] = {}
+    def colour(value) -> int:
+        value = str(value)
+        if value not in palette_index:
+            palette_index[value] = len(palette)
+            palette.append(value)
+        return palette_index[value]
+
+    def quantize(x, y) -> Tuple[int, int]:
+        qx = min(max(round((x - origin_x) * scale), 0), QUANT_MAX)
+        qy = min(max(round((y - origin_y) * scale), 0), QUANT_MAX)
+        return qx, qy
+
+    types, fills, strokes, widths, ellipses = [], [], [], [], []
+    element_rings, element_bodies, ring_offsets, coords = [0], [], [0], []
+    n_vertices = 0
+    for element in elements:
+        attributes = element['attributes']
+        types.append(ELEMENT_TYPES.index(element['type']))
+        fills.append(colour(attributes['fill']))
+        strokes.append(colour(attributes['stroke']))
+        widths.append(attributes['stroke_width'])
+        if element['type'] == 'Ellipse':
+            ellipses.extend((*attributes['centre'], *attributes['radius']))
+        n_bodies = 0
+        for is_hole, rings in ((False, element['bodies']), (True, element['holes'])):
+            for ring in rings:
+                quantized = []
+                for x, y in simplify_ring(ring, tolerance):
+                    q = quantize(x, y)
+                    if not quantized or quantized[-1] != q:
+                        quantized.append(q)
+                if len(quantized) < 4:
+                    continue
+                prev_x, prev_y = 0, 0
+                for qx, qy in quantized:
+                    coords.append(qx - prev_x)
+                    coords.append(qy - prev_y)
+                    prev_x, prev_y = qx, qy
+                n_vertices += len(quantized)
+                ring_offsets.append(n_vertices)
+                if not is_hole:
+                    n_bodies += 1
+        element_rings.append(len(ring_offsets) - 1)
+        element_bodies.append(n_bodies)
+
+    header = json.dumps({
+        'bbox': list(bbox),
+        'origin': [origin_x, origin_y],
+        'scale': scale,
+        'tolerance': tolerance,
+        'ids': [element['id'] for element in elements],
+        'palette': palette,
+        'counts': {
+            'elements': len(elements),
+            'ellipses': len(ellipses) // 4,
+            'rings': len(ring_offsets) - 1,
+            'vertices': n_vertices,
+        },
+    }, separators=(',', ':')).encode('utf-8')
+
+    buf = bytearray(MAGIC)
+    buf.extend(struct.pack('<II', VERSION, len(header)))
+    buf.extend(header)
+    _pad(buf)
+    _write(buf, 'B', types)
+    _write(buf, 'H', fills)
+    _write(buf, 'H', strokes)
+    _write(buf, 'f', widths)
+    _write(buf, 'f', ellipses)
+    _write(buf, 'I', element_rings)
+    _write(buf, 'I', element_bodies)
+    _write(buf, 'I', ring_offsets)
+    _write(buf, 'h', coords)
+    return bytes(buf)
+
+def read_header(data: bytes) -> Dict:
+    if data[:4] != MAGIC:
+        raise ValueError("Not a board geometry file.")
+    version, header_len = struct.unpack_from('<II', data, 4)
+    if version != VERSION:
+        raise ValueError(f"Unsupported board geometry version {version}.")
+    return json.loads(data[12:12 + header_len])
+
+def decode_geometry(data: bytes) -> Tuple[List[Dict], List[float]]:
+    """Inverse of encode_geometry, returning the same structure as svg_parser.extract_svg_elements."""
+    header = read_header(data)
+    counts = header['counts']
+    n = counts['elements']
+    pos = struct.unpack_from('<I', data, 8)[0] + 12
+    pos += -pos % 4
+    types, pos = _read(data, pos, 'B', n)
+    fills, pos = _read(data, pos, 'H', n)
+    strokes, pos = _read(data, pos, 'H', n)
+    widths, pos = _read(data, pos, 'f', n)
+    ellipses, pos = _read(data, pos, 'f', 4 * counts['ellipses'])
+    element_rings, pos = _read(data, pos, 'I', n + 1)
+    element_bodies, pos = _read(data, pos, 'I', n)
+    ring_offsets, pos = _read(data, pos, 'I', counts['rings'] + 1)
+    coords, pos = _read(data, pos, 'h', 2 * counts['vertices'])
+
+    origin_x, origin_y = header['origin']
+    scale = header['scale']
+    palette = header['palette']
+    elements = []
+    ellipse_index = 0
+    for i in range(n):
+        rings = []
+        for r in range(element_rings[i], element_rings[i + 1]):
+            ring, qx, qy = [], 0, 0
+            for v in range(ring_offsets[r], ring_offsets[r + 1]):
+                qx += coords[2 * v]
+                qy += coords[2 * v + 1]
+                ring.append((origin_x + qx / scale, origin_y + qy / scale))
+            rings.append(ring)
+        attributes = {
+            'fill': palette[fills[i]],
+            'stroke': palette[strokes[i]],
+            'stroke_width': widths[i],
+        }
+        if ELEMENT_TYPES[types[i]] == 'Ellipse':
+            cx, cy, rx, ry = ellipses[4 * ellipse_index:4 * ellipse_index + 4]
+            attributes['centre'] = (cx, cy)
+            attributes['radius'] = (rx, ry)
+            ellipse_index += 1
+        elements.append({
+            'type': ELEMENT_TYPES[types[i]],
+            'id': header['ids'][i],
+            'bodies': rings[:element_bodies[i]],
+            'holes': rings[element_bodies[i]:],
+            'attributes': attributes,
+        })
+    return elements, header['bbox']
+
+def select_lod(tolerances: Sequence[float], pixels_per_unit: float, max_error_px: float = 0.5) -> int:
+    """Coarsest level whose simplification error stays under max_error_px on screen."""
+    best = 0
+    for lod, tolerance in enumerate(tolerances):
+        if tolerance * pixels_per_unit <= max_error_px:
+            best = lod
+    return best
@@ -0,0 +1,145 @@
+from __future__ import annotations
+
+import hashlib
+import json
+import math
+import os
+from typing import Dict, Iterator, List, Sequence, Tuple
+
+from geometry_format import encode_geometry, simplify_ring
+
+# Board geometry cut into a quadtree of tiles. Zoom level z splits the board's bounding
+# square into 2^z x 2^z tiles, each encoded like a level of detail (see geometry_format.py)
+# with only the elements that reach it, their rings clipped to the tile and simplified for
+# the level. Tiles overlap by TILE_BUFFER of their size so that the cut edges fall outside
+# the tile: clients should clip drawing to the tile's own bounds.
+#
+# Written to <board>/tiles/<z>/<x>/<y>.bin, tiles without any element are left out, and
+# <board>/tiles/index.json describes the pyramid.
+
+TILE_DIR = 'tiles'
+TILE_INDEX = 'index.json'
+TILE_ZOOMS = 4  # levels 0-3: 1, 4, 16 and 64 tiles
+TILE_PIXELS = 256  # size a tile is meant to be drawn at
+TILE_BUFFER = 1 / 64
+MAX_ERROR_PX = 0.5  # simplification error allowed at TILE_PIXELS
+
+def tile_extent(bbox: Sequence[float], z: int) -> float:
+    return max(bbox[2] - bbox[0], bbox[3] - bbox[1]) / 2 ** z
+
+def tile_tolerance(bbox: Sequence[float], z: int) -> float:
+    return tile_extent(bbox, z) / TILE_PIXELS * MAX_ERROR_PX
+
+def tile_bounds(bbox: Sequence[float], z: int, x: int, y: int, buffer: float = 0.0) -> Tuple[float, float, float, float]:
+    extent = tile_extent(bbox, z)
+    margin = extent * buffer
+    x0, y0 = bbox[0] + x * extent, bbox[1] + y * extent
+    return x0 - margin, y0 - margin, x0 + extent + margin, y0 + extent + margin
+
+def clip_ring(ring: Sequence[Tuple[float, float]], bounds: Sequence[float]) -> List[Tuple[float, float]]:
+    """Sutherland-Hodgman clipping of a closed ring to a rectangle, returned closed. Concave
+    rings stay one ring and may run along the rectangle's edge between their parts."""
+    x0, y0, x1, y1 = bounds
+    points = list(ring[:-1]) if len(ring) > 1 and ring[0] == ring[-1] else list(ring)
+    for axis, limit, keep_below in ((0, x0, False), (0, x1, True), (1, y0, False), (1, y1, True)):
+        if not points:
+            break
+        inside = (lambda p: p[axis] <= limit) if keep_below else (lambda p: p[axis] >= limit)
+        clipped = []
+        previous = points[-1]
+        for point in points:
+            if inside(point) != inside(previous):
+                t = (limit - previous[axis]) / (point[axis] - previous[axis])
+                crossing = (previous[0] + t * (point[0] - previous[0]), previous[1] + t * (point[1] - previous[1]))
+                clipped.append((limit, crossing[1]) if axis == 0 else (crossing[0], limit))
+            if inside(point):
+                clipped.append(point)
+            previous = point
+        points = clipped
+    if len(points) < 3:
+        return []
+    return points + [points[0]]
+
+def ring_bounds(rings: Sequence[Sequence[Tuple[float, float]]]) -> Tuple[float, float, float, float] | None:
+    xs = [x for ring in rings for x, _ in ring]
+    ys = [y for ring in rings for _, y in ring]
+    if not xs:
+        return None
+    return min(xs), min(ys), max(xs), max(ys)
+
+def element_bounds(element: Dict) -> Tuple[float, float, float, float] | None:
+    if element['type'] == 'Ellipse':
+        (cx, cy), (rx, ry) = element['attributes']['centre'], element['attributes']['radius']
+        return cx - rx, cy - ry, cx + rx, cy + ry
+    return ring_bounds(element['bodies'] + element['holes'])
+
+def cut_tiles(elements: List[Dict], bbox: Sequence[float], zooms: int = TILE_ZOOMS) -> Iterator[Tuple[int, int, int, bytes]]:
+    """Encoded tiles as (z, x, y, data), leaving out empty ones."""
+    for z in range(zooms):
+        tolerance = tile_tolerance(bbox, z)
+        count = 2 ** z
+        extent = tile_extent(bbox, z)
+        margin = extent * TILE_BUFFER
+        tiles: Dict[Tuple[int, int], List[Dict]] = {}
+        for element in elements:
+            bounds = element_bounds(element)
+            if bounds is None or max(bounds[2] - bounds[0], bounds[3] - bounds[1]) < tolerance:
+                continue  # smaller than a pixel at this level
+            bodies = [simplify_ring(ring, tolerance) for ring in element['bodies']]
+            holes = [simplify_ring(ring, tolerance) for ring in element['holes']]
+            first_x = max(math.floor((bounds[0] - margin - bbox[0]) / extent), 0)
+            last_x = min(math.floor((bounds[2] + margin - bbox[0]) / extent), count - 1)
+            first_y = max(math.floor((bounds[1] - margin - bbox[1]) / extent), 0)
+            last_y = min(math.floor((bounds[3] + margin - bbox[1]) / extent), count - 1)
+            for x in range(first_x, last_x + 1):
+                for y in range(first_y, last_y + 1):
+                    clip = tile_bounds(bbox, z, x, y, TILE_BUFFER)
+                    if element['type'] == 'Ellipse':
+                        clipped = element  # drawn whole, clients clip it like the rest
+                    else:
+                        clipped_bodies = [ring for ring in (clip_ring(body, clip) for body in bodies) if ring]
+                        clipped_holes = [ring for ring in (clip_ring(hole, clip) for hole in holes) if ring]
+                        if not clipped_bodies and not clipped_holes:
+                            continue  # some land masses are parsed as holes alone
+                        clipped = dict(element, bodies=clipped_bodies, holes=clipped_holes)
+                    tiles.setdefault((x, y), []).append(clipped)
+        for (x, y), tile_elements in sorted(tiles.items()):
+            # already simplified before clipping, so that neighbouring tiles agree at the seams
+            yield z, x, y, encode_geometry(tile_elements, tile_bounds(bbox, z, x, y, TILE_BUFFER), 0.0)
+
+def write_geometry_tiles(elements: List[Dict], bbox: Sequence[float], out_dir: str, zooms: int = TILE_ZOOMS) -> dict:
+    """Write the tiles and their index; returns the index."""
+    digest = hashlib.sha1()
+    tiles = 0
+    for z, x, y, data in cut_tiles(elements, bbox, zooms):
+        os.makedirs(os.path.join(out_dir, str(z), str(x)), exist_ok=True)
+        with open(os.path.join(out_dir, str(z), str(x), f'{y}.bin'), 'wb') as f:
+            f.write(data)
+        digest.update(data)
+        tiles += 1
+    index = {
+        'bbox': list(bbox),
+        'extent': tile_extent(bbox, 0),
+        'zooms': zooms,
+        'tile_pixels': TILE_PIXELS,
+        'buffer': TILE_BUFFER,
+        'tolerances': [tile_tolerance(bbox, z) for z in range(zooms)],
+        'tiles': tiles,
+        'version': digest.hexdigest()[:16],
+    }
+    with open(os.path.join(out_dir, TILE_INDEX), 'w') as f:
+        json.dump(index, f, indent=1)
+    return index
+
+def select_zoom(index: dict, pixels_per_unit: float) -> int:
+    """Shallowest zoom level whose tiles are at most TILE_PIXELS wide on screen, so that
+    their simplification error stays under MAX_ERROR_PX. Past the deepest level, the deepest.
+
+    >>> index = {'extent': 1024, 'zooms': 4, 'tile_pixels': 256}
+    >>> select_zoom(index, 0.25), select_zoom(index, 0.3), select_zoom(index, 0.5), select_zoom(index, 100)
+    (0, 1, 1, 3)
+    """
+    for z in range(index['zooms']):
+        if index['extent'] / 2 ** z * pixels_per_unit <= index['tile_pixels']:
+            return z
+    return index['zooms'] - 1
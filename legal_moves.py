@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from itertools import combinations
+from typing import List
+
+from board_state import CardColor, ColoredEdge, Edge, FerryEdge
+from decks import COLORS
+from game_engine import DECK, MIN_PLAYERS_FOR_DOUBLE_ROUTES, Action
+from game_setup import GameState, Player
+
+def claimable_routes(game_state: GameState, player_name: str, affordable: bool = True) -> List[Edge]:
+    """Routes the player may claim now, by edge index: free, not blocked by the double route
+    rules, no longer than their trains and, if affordable, payable from their hand.
+
+    Reads the game's open route index instead of checking every route of the board."""
+    player = game_state.players[player_name]
+    routes = game_state.open_route_index()
+    if affordable:
+        candidates = routes.affordable([player.cards[color] for color in COLORS], player.trains_left)
+    else:
+        candidates = routes.within_trains(player.trains_left)
+    siblings = routes.index.siblings
+    owners = game_state.edge_owners
+    shared = len(game_state.players) >= MIN_PLAYERS_FOR_DOUBLE_ROUTES
+    edges = game_state.graph.edge_list
+    claimable = []
+    for index in sorted(candidates):
+        if siblings[index] and any(
+            owners[other] == player_name or (owners[other] is not None and not shared) for other in siblings[index]
+        ):
+            continue
+        claimable.append(edges[index])
+    return claimable
+
+def payments(player: Player, edge: Edge) -> List[List[str]]:
+    """Every distinct way the player's hand can pay for a route, as card colors: each color the
+    route takes, with each number of jokers from the fewest needed up to all of them. Tunnels
+    are charged like ordinary routes (see GameEngine), so they pay like one."""
+    jokers = player.cards[CardColor.JOKER]
+    length = edge.length
+    min_jokers = edge.joker_cost if isinstance(edge, FerryEdge) else 0
+    if isinstance(edge, ColoredEdge):
+        colors = [edge.color]
+    else:
+        colors = [color for color in COLORS if color != CardColor.JOKER and player.cards[color]]
+    options = []
+    for color in colors:
+        # at least one card of the color; paying with jokers only is added once below
+        for joker_count in range(max(min_jokers, length - player.cards[color]), min(jokers, length - 1) + 1):
+            options.append([color.value] * (length - joker_count) + [CardColor.JOKER.value] * joker_count)
+    if jokers >= length:
+        options.append([CardColor.JOKER.value] * length)
+    return options
+
+def draw_picks(game_state: GameState) -> List[list]:
+    """Distinct DRAW_CARDS picks: a face-up joker alone, a face-up card of each color with a
+    blind card, drawn before or after it, and two blind cards. Taking a face-up card refills
+    the row from the deck, possibly redealing all of it, so no pick takes two face-up cards:
+    the second could turn out to be a joker or another card."""
+    face_up = game_state.face_up_cards
+    can_draw = len(game_state.train_cards) + game_state.train_cards.discard_size > 0
+    picks: List[list] = []
+    seen = set()
+    for slot, card in enumerate(face_up):
+        if card is None or card in seen:
+            continue
+        seen.add(card)
+        if card == CardColor.JOKER:
+            picks.append([slot])
+            continue
+        # with nothing left to draw, the blind pick after the face-up card just ends the turn
+        picks.append([slot, DECK])
+        if can_draw:
+            picks.append([DECK, slot])
+    if can_draw:
+        picks.append([DECK, DECK])
+    return picks
+
+def legal_commands(game_state: GameState, player_name: str) -> List[dict]:
+    """Every command GameEngine accepts from the player now, stations aside: each claimable
+    route with each of its payments, each distinct card draw and a ticket draw, or, while the
+    player holds offered tickets, each choice of them to keep. Empty when it is not their turn."""
+    player = game_state.players.get(player_name)
+    if game_state.game_over or player is None or player_name != game_state.current_player_turn:
+        return []
+    if player.offered_tickets:
+        offered = range(len(player.offered_tickets))
+        return [
+            {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': list(keep)}
+            for size in range(1, len(offered) + 1) for keep in combinations(offered, size)
+        ]
+    commands = [
+        {'player': player_name, 'action': Action.CLAIM_ROUTE.value, 'route': edge.index, 'cards': cards}
+        for edge in claimable_routes(game_state, player_name) for cards in payments(player, edge)
+    ]
+    commands.extend({'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': cards}
+                    for cards in draw_picks(game_state))
+    if game_state.available_tickets:
+        commands.append({'player': player_name, 'action': Action.DRAW_TICKETS.value})
+    return commands
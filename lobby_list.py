@@ -0,0 +1,191 @@
+from __future__ import annotations
+
+import json
+import threading
+from typing import Callable, Dict, List, NamedTuple, Tuple
+
+from lobby_store import LobbyStore
+
+LOBBY_LIST_ROOM = 'lobby_list'
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 200
+FLUSH_LOCK_TIMEOUT = 5  # seconds a crashed process can hold up lobby list updates
+
+# Redis layout of the published lobby list, shared by every server process:
+#   lobby_list:pending     set: ids of lobbies changed since the last flush
+#   lobby_list:entries     hash: lobby id -> published summary (JSON), open lobbies only
+#   lobby_list:version     string: bumped by every flush that changed something
+#   lobby_list:rooms       hash: subscriber room -> number of subscribers, rooms without any are deleted
+#   lobby_list:flush_lock  lock held while flushing, so deltas go out in version order
+PENDING_KEY = "lobby_list:pending"
+ENTRIES_KEY = "lobby_list:entries"
+VERSION_KEY = "lobby_list:version"
+ROOMS_KEY = "lobby_list:rooms"
+FLUSH_LOCK_KEY = "lobby_list:flush_lock"
+
+# KEYS: subscriber rooms. ARGV: room. A room is dropped along with its last subscriber.
+LEAVE_ROOM_SCRIPT = """
+if redis.call('HINCRBY', KEYS[1], ARGV[1], -1) <= 0 then
+    redis.call('HDEL', KEYS[1], ARGV[1])
+end
+"""
+
+def lobby_summary(lobby: dict) -> dict:
+    """What the lobby browser shows of a lobby."""
+    return {
+        'id': lobby['id'],
+        'name': lobby['name'],
+        'host': lobby['players'][0]['username'] if lobby['players'] else 'Unknown',
+        'player_count': len(lobby['players']),
+        'board': lobby['board'],
+        'started': lobby['started'],
+        'created_at': lobby['created_at'],
+    }
+
+class LobbyFilter(NamedTuple):
+    board: str | None = None
+    min_free_seats: int = 0
+
+    def matches(self, summary: dict, max_players: int) -> bool:
+        return (self.board is None or summary['board'] == self.board) and \
+            max_players - summary['player_count'] >= self.min_free_seats
+
+    @property
+    def room(self) -> str:
+        """Subscribers with the same filter share a Socket.IO room."""
+        if self == LobbyFilter():
+            return LOBBY_LIST_ROOM
+        return f"{LOBBY_LIST_ROOM}:{self.board or '*'}:{self.min_free_seats}"
+
+    @classmethod
+    def from_room(cls, room: str) -> LobbyFilter:
+        if room == LOBBY_LIST_ROOM:
+            return cls()
+        board, min_free_seats = room[len(LOBBY_LIST_ROOM) + 1:].rsplit(':', 1)
+        return cls(None if board == '*' else board, int(min_free_seats))
+
+class LobbyListFeed:
+    """The list of open lobbies as the lobby browser sees it, published as deltas.
+
+    Any process can queue a changed lobby with touch(). flush() then publishes everything
+    queued by every process at once: to each subscriber room, the add/update/remove changes
+    its filter sees. A lobby that changed several times in between yields one change, or
+    none if it ended up as it was. Pages of the published list are cached per process
+    until the list version moves on.
+    """
+    def __init__(self, lobby_store: LobbyStore):
+        self.lobby_store: LobbyStore = lobby_store
+        self.redis_client = lobby_store.redis_client
+        self.max_players: int = lobby_store.max_players
+        self.subscriptions: Dict[str, LobbyFilter] = {}  # this process's sockets by id
+        self.scheduled: bool = False  # a flush is due from this process
+        self.version: int | None = None  # of the cached list
+        self.listed: List[dict] = []
+        self.pages: Dict[Tuple[LobbyFilter, int, int], dict] = {}
+        self.lock = threading.Lock()
+        self.leave_room_script = self.redis_client.register_script(LEAVE_ROOM_SCRIPT)
+
+    def touch(self, lobby_id: str) -> bool:
+        """Queue a lobby that changed or is gone. Returns True if this process has no flush
+        due yet, i.e. one needs to be scheduled."""
+        self.redis_client.sadd(PENDING_KEY, lobby_id)
+        with self.lock:
+            first = not self.scheduled
+            self.scheduled = True
+            return first
+
+    def flush(self, publish: Callable[[str, dict], None]) -> int:
+        """Publish queued changes, calling publish(room, delta) for each room they concern.
+        Returns the list version."""
+        with self.lock:
+            self.scheduled = False
+        with self.redis_client.lock(FLUSH_LOCK_KEY, timeout=FLUSH_LOCK_TIMEOUT):
+            pipe = self.redis_client.pipeline()
+            pipe.smembers(PENDING_KEY)
+            pipe.delete(PENDING_KEY)
+            pipe.get(VERSION_KEY)
+            lobby_ids, _, version = pipe.execute()
+            version = int(version or 0)
+            lobby_ids = [lobby_id.decode() for lobby_id in lobby_ids]
+            if not lobby_ids:
+                return version
+            published = self.redis_client.hmget(ENTRIES_KEY, lobby_ids)
+            changed = []
+            for lobby_id, lobby, old in zip(lobby_ids, self.lobby_store.get_many(lobby_ids), published):
+                summary = lobby_summary(lobby) if lobby is not None and not lobby['started'] else None
+                old = json.loads(old) if old else None
+                if summary != old:
+                    changed.append((lobby_id, old, summary))
+            if not changed:
+                return version
+            pipe = self.redis_client.pipeline()
+            for lobby_id, _, summary in changed:
+                if summary is None:
+                    pipe.hdel(ENTRIES_KEY, lobby_id)
+                else:
+                    pipe.hset(ENTRIES_KEY, lobby_id, json.dumps(summary))
+            pipe.incr(VERSION_KEY)
+            version = pipe.execute()[-1]
+            # Deltas go out while the lock is held, so they can never overtake each other
+            for room, subscribers in self.redis_client.hgetall(ROOMS_KEY).items():
+                if int(subscribers) <= 0:
+                    continue
+                room = room.decode()
+                lobby_filter = LobbyFilter.from_room(room)
+                changes = []
+                for lobby_id, old, summary in changed:
+                    was_listed = old is not None and lobby_filter.matches(old, self.max_players)
+                    listed = summary is not None and lobby_filter.matches(summary, self.max_players)
+                    if listed:
+                        changes.append({'op': 'update' if was_listed else 'add', 'id': lobby_id, 'lobby': summary})
+                    elif was_listed:
+                        changes.append({'op': 'remove', 'id': lobby_id})
+                if changes:
+                    publish(room, {'version': version, 'changes': changes})
+            return version
+
+    def page(self, lobby_filter: LobbyFilter = LobbyFilter(), offset: int = 0, limit: int = PAGE_SIZE) -> dict:
+        offset = max(offset, 0)
+        limit = min(max(limit, 1), MAX_PAGE_SIZE)
+        key = (lobby_filter, offset, limit)
+        version = int(self.redis_client.get(VERSION_KEY) or 0)
+        with self.lock:
+            if version != self.version:
+                # Read the entries and the version they belong to together
+                pipe = self.redis_client.pipeline()
+                pipe.hvals(ENTRIES_KEY)
+                pipe.get(VERSION_KEY)
+                entries, version = pipe.execute()
+                self.version = int(version or 0)
+                self.listed = sorted((json.loads(entry) for entry in entries), key=lambda summary: summary['created_at'])
+                self.pages.clear()
+            page = self.pages.get(key)
+            if page is None:
+                listed = [summary for summary in self.listed if lobby_filter.matches(summary, self.max_players)]
+                page = self.pages[key] = {
+                    'lobbies': listed[offset:offset + limit],
+                    'total': len(listed),
+                    'offset': offset,
+                    'version': self.version,
+                }
+            return page
+
+    def subscribe(self, sid: str, lobby_filter: LobbyFilter) -> Tuple[str | None, str]:
+        """Returns the room to leave, if any, and the room to join."""
+        with self.lock:
+            old = self.subscriptions.get(sid)
+            self.subscriptions[sid] = lobby_filter
+        if old == lobby_filter:
+            return None, lobby_filter.room
+        pipe = self.redis_client.pipeline(transaction=False)
+        if old is not None:
+            self.leave_room_script(keys=[ROOMS_KEY], args=[old.room], client=pipe)
+        pipe.hincrby(ROOMS_KEY, lobby_filter.room, 1)
+        pipe.execute()
+        return (old.room if old is not None else None), lobby_filter.room
+
+    def unsubscribe(self, sid: str) -> None:
+        with self.lock:
+            old = self.subscriptions.pop(sid, None)
+        if old is not None:
+            self.leave_room_script(keys=[ROOMS_KEY], args=[old.room])
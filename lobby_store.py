@@ -0,0 +1,208 @@
+from __future__ import annotations
+
+import json
+from typing import List, Tuple
+
+import redis
+
+LOBBY_TTL = 86400  # seconds, lobbies nobody touched for a day expire
+
+# Redis layout of the lobbies, shared by every server process:
+#   lobby:{lobby_id}         string: the lobby as a JSON document
+#   player_lobby:{player_id} string: id of the lobby the player is in
+#   lobbies:open             sorted set: ids of lobbies not started yet, by creation time
+LOBBY_KEY = "lobby:{lobby_id}"
+PLAYER_LOBBY_KEY = "player_lobby:{player_id}"
+OPEN_LOBBIES_KEY = "lobbies:open"
+
+# Each script checks and updates a lobby and the membership keys in one step, so two
+# processes can never both seat a player in the last free seat.
+
+# KEYS: lobby, creator's membership, open lobbies. ARGV: lobby JSON, lobby id, creation time, ttl
+CREATE_SCRIPT = """
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return redis.error_reply('You are already in a lobby')
+end
+redis.call('SET', KEYS[1], ARGV[1], 'EX', ARGV[4])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[4])
+redis.call('ZADD', KEYS[3], ARGV[3], ARGV[2])
+return ARGV[1]
+"""
+
+# KEYS: lobby, player's membership. ARGV: player JSON, lobby id, max players, ttl
+JOIN_SCRIPT = """
+local encoded = redis.call('GET', KEYS[1])
+if not encoded then
+    return redis.error_reply('Lobby not found')
+end
+local lobby = cjson.decode(encoded)
+if #lobby.players >= tonumber(ARGV[3]) then
+    return redis.error_reply('Lobby is full')
+end
+if lobby.started then
+    return redis.error_reply('Game already started')
+end
+if redis.call('EXISTS', KEYS[2]) == 1 then
+    return redis.error_reply('You are already in a lobby')
+end
+table.insert(lobby.players, cjson.decode(ARGV[1]))
+encoded = cjson.encode(lobby)
+redis.call('SET', KEYS[1], encoded, 'EX', ARGV[4])
+redis.call('SET', KEYS[2], ARGV[2], 'EX', ARGV[4])
+return encoded
+"""
+
+# KEYS: player's membership, lobby, open lobbies. ARGV: player id, lobby id, ttl
+# Returns {lobby JSON or '' if it was deleted, 1 if the host changed}, or nil if the player
+# is no longer in that lobby.
+LEAVE_SCRIPT = """
+if redis.call('GET', KEYS[1]) ~= ARGV[2] then
+    return nil
+end
+redis.call('DEL', KEYS[1])
+local encoded = redis.call('GET', KEYS[2])
+if not encoded then
+    return {'', 0}
+end
+local lobby = cjson.decode(encoded)
+local players = {}
+local humans = 0
+for _, player in ipairs(lobby.players) do
+    if player.id ~= ARGV[1] then
+        table.insert(players, player)
+        if not player.bot then
+            humans = humans + 1
+        end
+    end
+end
+if humans == 0 then
+    redis.call('DEL', KEYS[2])
+    redis.call('ZREM', KEYS[3], ARGV[2])
+    return {'', 0}
+end
+lobby.players = players
+local host_changed = 0
+if lobby.host == ARGV[1] then
+    lobby.host = players[1].id
+    host_changed = 1
+end
+encoded = cjson.encode(lobby)
+redis.call('SET', KEYS[2], encoded, 'EX', ARGV[3])
+return {encoded, host_changed}
+"""
+
+# KEYS: lobby, open lobbies. ARGV: player id, lobby id, bots asked for (-1 for the default),
+# min players, max players, ttl
+START_SCRIPT = """
+local encoded = redis.call('GET', KEYS[1])
+if not encoded then
+    return redis.error_reply('Lobby not found')
+end
+local lobby = cjson.decode(encoded)
+if lobby.host ~= ARGV[1] then
+    return redis.error_reply('Only the host can start the game')
+end
+if lobby.started then
+    return redis.error_reply('Game already started')
+end
+local humans = #lobby.players
+local bots = tonumber(ARGV[3])
+if bots < 0 then
+    bots = math.max(tonumber(ARGV[4]) - humans, 0)
+end
+bots = math.min(bots, tonumber(ARGV[5]) - humans)
+for i = 1, bots do
+    table.insert(lobby.players, {id = 'bot-' .. i, username = 'Bot ' .. i, bot = true})
+end
+lobby.started = true
+encoded = cjson.encode(lobby)
+redis.call('SET', KEYS[1], encoded, 'EX', ARGV[6])
+redis.call('ZREM', KEYS[2], ARGV[2])
+return encoded
+"""
+
+class LobbyError(Exception):
+    pass
+
+class LobbyStore:
+    """Lobbies and who is in which, kept in Redis so that every server process sees the same
+    ones. Changes go through Lua scripts and are atomic; a refused change raises LobbyError
+    with a message for the player."""
+    def __init__(self, redis_client, max_players: int, min_players: int = 0, ttl: int = LOBBY_TTL):
+        self.redis_client = redis_client
+        self.max_players: int = max_players
+        self.min_players: int = min_players
+        self.ttl: int = ttl
+        self.create_script = redis_client.register_script(CREATE_SCRIPT)
+        self.join_script = redis_client.register_script(JOIN_SCRIPT)
+        self.leave_script = redis_client.register_script(LEAVE_SCRIPT)
+        self.start_script = redis_client.register_script(START_SCRIPT)
+
+    def run(self, script, keys: List[str], args: list):
+        try:
+            return script(keys=keys, args=args)
+        except redis.ResponseError as e:
+            raise LobbyError(str(e)) from None
+
+    def create(self, lobby: dict, created: float) -> dict:
+        """Store a new lobby with its host as the only player."""
+        lobby_id = lobby['id']
+        self.run(self.create_script, [
+            LOBBY_KEY.format(lobby_id=lobby_id),
+            PLAYER_LOBBY_KEY.format(player_id=lobby['host']),
+            OPEN_LOBBIES_KEY,
+        ], [json.dumps(lobby), lobby_id, created, self.ttl])
+        return lobby
+
+    def get(self, lobby_id: str) -> dict | None:
+        encoded = self.redis_client.get(LOBBY_KEY.format(lobby_id=lobby_id))
+        return json.loads(encoded) if encoded else None
+
+    def get_many(self, lobby_ids: List[str]) -> List[dict | None]:
+        if not lobby_ids:
+            return []
+        encoded = self.redis_client.mget([LOBBY_KEY.format(lobby_id=lobby_id) for lobby_id in lobby_ids])
+        return [json.loads(lobby) if lobby else None for lobby in encoded]
+
+    def lobby_of(self, player_id: str) -> str | None:
+        lobby_id = self.redis_client.get(PLAYER_LOBBY_KEY.format(player_id=player_id))
+        return lobby_id.decode() if lobby_id else None
+
+    def join(self, lobby_id: str, player: dict) -> dict:
+        encoded = self.run(self.join_script, [
+            LOBBY_KEY.format(lobby_id=lobby_id),
+            PLAYER_LOBBY_KEY.format(player_id=player['id']),
+        ], [json.dumps(player), lobby_id, self.max_players, self.ttl])
+        return json.loads(encoded)
+
+    def leave(self, player_id: str) -> Tuple[str, dict | None, bool] | None:
+        """Take a player out of their lobby. Returns the lobby id, the lobby (None if no human
+        is left and it was deleted) and whether the host changed, or None if the player was
+        in no lobby."""
+        lobby_id = self.lobby_of(player_id)
+        if lobby_id is None:
+            return None
+        result = self.run(self.leave_script, [
+            PLAYER_LOBBY_KEY.format(player_id=player_id),
+            LOBBY_KEY.format(lobby_id=lobby_id),
+            OPEN_LOBBIES_KEY,
+        ], [player_id, lobby_id, self.ttl])
+        if result is None:
+            return None  # left meanwhile, through another connection
+        encoded, host_changed = result
+        return lobby_id, json.loads(encoded) if encoded else None, bool(host_changed)
+
+    def start(self, lobby_id: str, player_id: str, bots: int | None = None) -> dict:
+        """Mark a lobby started, filling empty seats with bots: as many as asked for, or by
+        default enough for min_players."""
+        encoded = self.run(self.start_script, [LOBBY_KEY.format(lobby_id=lobby_id), OPEN_LOBBIES_KEY],
+                           [player_id, lobby_id, -1 if bots is None else bots,
+                            self.min_players, self.max_players, self.ttl])
+        return json.loads(encoded)
+
+    def open_count(self) -> int:
+        return self.redis_client.zcard(OPEN_LOBBIES_KEY)
+
+    def open_lobby_ids(self) -> List[str]:
+        """Lobbies not started yet, oldest first."""
+        return [lobby_id.decode() for lobby_id in self.redis_client.zrange(OPEN_LOBBIES_KEY, 0, -1)]
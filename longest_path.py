@@ -0,0 +1,126 @@
+from __future__ import annotations
+
+from typing import Dict, Iterable, List, Tuple
+
+from board_state import Graph
+
+def longest_path(graph: Graph, edge_ids: Iterable[int]) -> int:
+    """Length in trains of the longest continuous path over the given routes.
+
+    A path may pass through a city several times but use each route once, so this is a
+    longest trail search, NP-hard in general. The routes are split into connected
+    components, each solved by a depth-first search over (city, bitmask of used routes)
+    states with memoization. Only cities of odd degree are tried as starting points: a
+    longest trail starting at an even-degree city leaves a route at that city unused, and
+    prepending it would make the trail longer. A component without odd-degree cities has an
+    Euler circuit, and one with them has its degree-2 chains merged into single links first.
+    """
+    graph._build_arrays()
+    node1, node2, lengths = graph.edge_node1, graph.edge_node2, graph.edge_length
+    edge_ids = list(dict.fromkeys(edge_ids))
+    # Group routes into components by city, with a small union-find keyed by city id
+    parent: Dict[int, int] = {}
+    def find(x: int) -> int:
+        while parent.setdefault(x, x) != x:
+            parent[x] = parent[parent[x]]
+            x = parent[x]
+        return x
+    for edge in edge_ids:
+        a, b = find(node1[edge]), find(node2[edge])
+        if a != b:
+            parent[a] = b
+    components: Dict[int, List[int]] = {}
+    for edge in edge_ids:
+        components.setdefault(find(node1[edge]), []).append(edge)
+    best = 0
+    for component in components.values():
+        total = sum(lengths[edge] for edge in component)
+        if total > best:
+            best = max(best, _longest_trail(component, node1, node2, lengths))
+    return best
+
+def _contract(edges: List[Tuple[int, int, int]]) -> List[Tuple[int, int, int]]:
+    """Merge chains of routes through degree-2 cities into single (a, b, length) links."""
+    incident: Dict[int, List[int]] = {}
+    for i, (a, b, _) in enumerate(edges):
+        incident.setdefault(a, []).append(i)
+        incident.setdefault(b, []).append(i)
+    def degree(node: int) -> int:
+        return len(incident[node])  # a loop is listed twice, counting 2
+    merged: List[Tuple[int, int, int]] = []
+    done = [False] * len(edges)
+    for i, (a, b, length) in enumerate(edges):
+        if done[i] or (degree(a) == 2 and degree(b) == 2):
+            continue
+        done[i] = True
+        if degree(a) == 2:
+            a, b = b, a
+        # a is a junction or dead end; walk through degree-2 cities from b
+        previous = i
+        while degree(b) == 2 and b != a:
+            following = incident[b][0] if incident[b][0] != previous else incident[b][1]
+            if done[following]:
+                break
+            done[following] = True
+            c, d, extra = edges[following]
+            b = d if c == b else c
+            length += extra
+            previous = following
+        merged.append((a, b, length))
+    # Whatever is left are cycles made only of degree-2 cities; those components are
+    # Eulerian and never reach this function
+    return merged
+
+def _longest_trail(edges: List[int], node1, node2, lengths) -> int:
+    links = [(node1[edge], node2[edge], lengths[edge]) for edge in edges]
+    total = sum(length for _, _, length in links)
+    degree: Dict[int, int] = {}
+    for a, b, _ in links:
+        degree[a] = degree.get(a, 0) + 1
+        degree[b] = degree.get(b, 0) + 1
+    starts = [node for node, d in degree.items() if d % 2]
+    if not starts:
+        # Every city has even degree: an Euler circuit uses every route
+        return total
+    # A longest trail ends at odd-degree cities, so it runs through degree-2 cities whole
+    links = _contract(links)
+    # Parallel links between the same two cities are interchangeable but for their length,
+    # and a path crossing between them k times is best off using the k longest. Grouping
+    # them and always taking the longest unused one keeps only one order per group.
+    groups: Dict[Tuple[int, int], List[int]] = {}
+    for a, b, length in links:
+        groups.setdefault((min(a, b), max(a, b)), []).append(length)
+    adjacency: Dict[int, List[Tuple[int, List[Tuple[int, int]]]]] = {}  # node -> [(neighbour, [(bit, length)])]
+    bit = 0
+    for (a, b), group_lengths in groups.items():
+        group = []
+        for length in sorted(group_lengths, reverse=True):
+            group.append((1 << bit, length))
+            bit += 1
+        adjacency.setdefault(a, []).append((b, group))
+        if a != b:
+            adjacency.setdefault(b, []).append((a, group))
+    memo: Dict[Tuple[int, int], int] = {}
+
+    def extend(node: int, used: int, remaining: int) -> int:
+        key = (node, used)
+        cached = memo.get(key)
+        if cached is not None:
+            return cached
+        result = 0
+        for neighbour, group in adjacency[node]:
+            for bit, length in group:
+                if not used & bit:
+                    result = max(result, length + extend(neighbour, used | bit, remaining - length))
+                    break
+            if result == remaining:  # uses every link left, nothing can do better
+                break
+        memo[key] = result
+        return result
+
+    best = 0
+    for start in starts:
+        best = max(best, extend(start, 0, total))
+        if best == total:
+            break
+    return best
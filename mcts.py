@@ -0,0 +1,302 @@
+from __future__ import annotations
+
+import math
+import random
+import time
+from array import array
+from concurrent.futures import ProcessPoolExecutor, TimeoutError as FutureTimeout
+from itertools import combinations
+from typing import Dict, List, Tuple
+
+import numpy as np
+
+from board_state import CARD_COLOR_INDEX, CardColor
+from bots import BOTS, Bot, claim_command, claimable, most_held_color, payment
+from connectivity import TicketProgress
+from decks import COLORS
+from game_engine import DECK, Action, GameEngine
+from game_setup import BoardTemplate, GameState, Player
+from legal_moves import claimable_routes
+from route_tables import EPSILON
+
+BUDGET = 0.4  # seconds of search per move, leaving headroom under a 500 ms response time
+WORKER_MARGIN = 0.8  # workers stop at this fraction of the budget so their results are in on time
+EXPLORATION = 0.7
+ROLLOUT_DEPTH = 16  # commands played out past the tree before the position is evaluated
+ROLLOUT_SAMPLE = 24  # routes looked at per playout move
+SCORE_SCALE = 30.0  # score margin worth most of a win
+MIN_TRAINS_FOR_TICKETS = 15
+
+_pools: Dict[int, ProcessPoolExecutor] = {}
+
+def worker_pool(workers: int) -> ProcessPoolExecutor:
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = _pools[workers] = ProcessPoolExecutor(max_workers=workers)
+    return pool
+
+def command_key(command: dict) -> Tuple:
+    """What identifies a move in the tree; claims are told apart by route only."""
+    action = command['action']
+    if action == Action.CLAIM_ROUTE.value:
+        return action, command['route']
+    if action == Action.DRAW_CARDS.value:
+        return action, tuple(command['cards'])
+    if action == Action.KEEP_TICKETS.value:
+        return action, tuple(command['keep'])
+    return (action,)
+
+def candidate_commands(game_state: GameState, player_name: str) -> List[dict]:
+    """The moves searched: every affordable claim (paid one way), distinct card draws and a
+    ticket draw. Stations are left out."""
+    player = game_state.players[player_name]
+    if player.offered_tickets:
+        offered = range(len(player.offered_tickets))
+        return [
+            {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': list(keep)}
+            for size in range(1, len(offered) + 1) for keep in combinations(offered, size)
+        ]
+    grey_color = most_held_color(player)
+    commands = [claim_command(player_name, edge, payment(player, edge, grey_color))
+                for edge in claimable_routes(game_state, player_name)]
+    can_draw = len(game_state.train_cards) + game_state.train_cards.discard_size > 0
+    draws = [[DECK, DECK]] if can_draw else []
+    seen = set()
+    for i, card in enumerate(game_state.face_up_cards):
+        if card is not None and card not in seen:
+            seen.add(card)
+            draws.append([i] if card == CardColor.JOKER else [i, DECK])
+    commands.extend({'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': cards} for cards in draws)
+    if game_state.available_tickets and player.trains_left >= MIN_TRAINS_FOR_TICKETS:
+        commands.append({'player': player_name, 'action': Action.DRAW_TICKETS.value})
+    return commands
+
+def rollout_command(game_state: GameState, player_name: str, rng: random.Random) -> dict:
+    """Cheap playout policy: among a random sample of routes, the longest affordable one on a
+    shortest path of a pending ticket, else the longest affordable one, else a blind draw."""
+    player = game_state.players[player_name]
+    if player.offered_tickets:
+        return {'player': player_name, 'action': Action.KEEP_TICKETS.value, 'keep': [0]}
+    edges = game_state.graph.edge_list
+    trains = game_state.template.route_tables().trains
+    tickets = [(ticket.city1.index, ticket.city2.index) for ticket in player.ticket_progress.pending]
+    grey_color = most_held_color(player)
+    best, best_rank = None, (False, 0)
+    for edge in rng.sample(edges, min(ROLLOUT_SAMPLE, len(edges))):
+        if not (claimable(game_state, player_name, edge) and payment(player, edge, grey_color) is not None):
+            continue
+        u, v = edge.node1.index, edge.node2.index
+        useful = any(
+            min(trains[a, u] + trains[v, b], trains[a, v] + trains[u, b]) + edge.length <= trains[a, b] + EPSILON
+            for a, b in tickets
+        )
+        rank = (useful, edge.length)
+        if rank > best_rank:
+            best, best_rank = edge, rank
+    if best is not None:
+        return claim_command(player_name, best, payment(player, best, grey_color))
+    return {'player': player_name, 'action': Action.DRAW_CARDS.value, 'cards': [DECK, DECK]}
+
+def ticket_estimate(game_state: GameState, player: Player) -> float:
+    """Completed tickets at full value, pending ones from minus their value, untouched, up to
+    plus it as the trains still missing between the two networks (on the open board, ignoring
+    claims) go down."""
+    estimate = float(player.ticket_progress.completed_points)
+    if not player.ticket_progress.pending:
+        return estimate
+    trains = game_state.template.route_tables().trains
+    networks = player.ticket_progress.networks
+    roots = np.array([networks.find(node) for node in range(len(trains))])
+    for ticket in player.ticket_progress.pending:
+        a, b = ticket.city1.index, ticket.city2.index
+        missing = trains[np.ix_(roots == roots[a], roots == roots[b])].min()
+        remaining = min(missing / max(trains[a, b], 1.0), 1.0)
+        estimate += ticket.points * (1.0 - 2.0 * remaining)
+    return estimate
+
+def evaluate(game_state: GameState) -> Dict[str, float]:
+    """Reward in [0, 1] per player from their estimated margin over the best opponent."""
+    if game_state.game_over:
+        estimates = {player_name: float(player.score) for player_name, player in game_state.players.items()}
+    else:
+        estimates = {
+            player_name: player.score + ticket_estimate(game_state, player)
+            for player_name, player in game_state.players.items()
+        }
+    rewards = {}
+    for player_name, estimate in estimates.items():
+        best_other = max((other for name, other in estimates.items() if name != player_name), default=0)
+        rewards[player_name] = 0.5 + 0.5 * math.tanh((estimate - best_other) / SCORE_SCALE)
+    return rewards
+
+def determinize(game_state: GameState, player_name: str, rng: random.Random) -> GameState:
+    """A copy of the game with everything player_name cannot see resampled: the other players'
+    cards and tickets, the order of both decks and the shuffles to come."""
+    state = game_state.clone()
+    state._open_routes = None
+    state.rng = state.train_cards.rng = random.Random(rng.random())
+    others = {name: player for name, player in state.players.items() if name != player_name}
+    # Cards: the draw pile and the opponents' hands are one unseen pool
+    pool = state.train_cards.draw_pile.tolist()
+    for player in others.values():
+        for color, count in player.cards.items():
+            pool.extend([CARD_COLOR_INDEX[color]] * count)
+    rng.shuffle(pool)
+    for player in others.values():
+        hand = sum(player.cards.values())
+        player.cards = dict.fromkeys(COLORS, 0)
+        for _ in range(hand):
+            player.cards[COLORS[pool.pop()]] += 1
+    state.train_cards.draw_pile = array('b', pool)
+    # Tickets: the ticket deck and the opponents' tickets
+    unseen = list(state.available_tickets)
+    for player in others.values():
+        unseen.extend(player.tickets)
+        unseen.extend(player.offered_tickets)
+    rng.shuffle(unseen)
+    node_count = len(state.graph.node_list)
+    for name, player in others.items():
+        player.tickets = [unseen.pop() for _ in player.tickets]
+        player.offered_tickets = [unseen.pop() for _ in player.offered_tickets]
+        progress = player.ticket_progress = TicketProgress(node_count)
+        for edge, owner in zip(state.graph.edge_list, state.edge_owners):
+            if owner == name:
+                progress.add_route(edge)
+        progress.add_tickets(player.tickets)
+    state.available_tickets = unseen
+    return state
+
+class Node:
+    """Open-loop tree node: a sequence of moves, whatever cards they turned up.
+
+    reward is summed from the point of view of the player who made the move leading here.
+    available counts how often the move was legal when its parent was visited (moves depend
+    on the determinization), and replaces the parent's visit count in UCB.
+    """
+    __slots__ = ('children', 'visits', 'reward', 'available', 'command')
+
+    def __init__(self, command: dict | None = None):
+        self.children: Dict[Tuple, Node] = {}
+        self.visits: int = 0
+        self.reward: float = 0.0
+        self.available: int = 0
+        self.command: dict | None = command
+
+class Search:
+    def __init__(self, rng: random.Random, root: Node | None = None):
+        self.rng: random.Random = rng
+        self.root: Node = root or Node()
+
+    def run(self, game_state: GameState, player_name: str, deadline: float) -> int:
+        iterations = 0
+        while time.perf_counter() < deadline:
+            self.iterate(determinize(game_state, player_name, self.rng))
+            iterations += 1
+        return iterations
+
+    def iterate(self, state: GameState) -> None:
+        engine = GameEngine(state)
+        node = self.root
+        path: List[Tuple[Node, str]] = []
+        # Selection and expansion
+        while not state.game_over:
+            mover = state.current_player_turn
+            commands = {command_key(command): command for command in candidate_commands(state, mover)}
+            untried = [key for key in commands if key not in node.children]
+            for key in commands:
+                if key in node.children:
+                    node.children[key].available += 1
+            if untried:
+                key = self.rng.choice(untried)
+                child = node.children[key] = Node(commands[key])
+                child.available = 1
+            else:
+                key = max(
+                    (key for key in commands),
+                    key=lambda key: self.ucb(node.children[key])
+                )
+                child = node.children[key]
+            _, error = engine.apply(commands[key])
+            state.discard_changes()
+            path.append((child, mover))
+            node = child
+            if error is not None or child.visits == 0:
+                break
+        # Playout
+        for _ in range(ROLLOUT_DEPTH):
+            if state.game_over:
+                break
+            mover = state.current_player_turn
+            engine.apply(rollout_command(state, mover, self.rng))
+            state.discard_changes()
+        rewards = evaluate(state)
+        for child, mover in path:
+            child.visits += 1
+            child.reward += rewards[mover]
+
+    @staticmethod
+    def ucb(node: Node) -> float:
+        if node.visits == 0:
+            return math.inf
+        return node.reward / node.visits + EXPLORATION * math.sqrt(math.log(max(node.available, 1)) / node.visits)
+
+def search_worker(files: Tuple[str, str, str], data: dict, player_name: str, budget: float, seed: int) -> Dict[Tuple, Tuple[int, float, dict]]:
+    """Run an independent search in a worker process; returns root move statistics."""
+    game_state = GameState.from_dict(data, BoardTemplate.load(*files))
+    search = Search(random.Random(seed))
+    search.run(game_state, player_name, time.perf_counter() + budget)
+    return {key: (child.visits, child.reward, child.command) for key, child in search.root.children.items()}
+
+class MCTSBot(Bot):
+    """Monte Carlo tree search over determinized copies of the game, within a wall-clock budget
+    per move. With workers, independent searches run in other processes for most of the budget
+    and their root statistics are merged into the local tree (root parallelization). The tree
+    is kept between turns: observe() follows every applied command down to the new position."""
+    name = 'mcts'
+
+    def __init__(self, seed: int | None = None, budget: float = BUDGET, workers: int = 0):
+        super().__init__(seed)
+        self.budget: float = budget
+        self.workers: int = workers
+        self.search: Search = Search(self.rng)
+        self.last_iterations: int = 0
+
+    def choose(self, game_state: GameState, player_name: str) -> dict:
+        deadline = time.perf_counter() + self.budget
+        legal = {command_key(command): command for command in candidate_commands(game_state, player_name)}
+        if len(legal) == 1:
+            return next(iter(legal.values()))
+        futures = []
+        if self.workers and game_state.template.files is not None:
+            data = game_state.to_dict()
+            pool = worker_pool(self.workers)
+            futures = [
+                pool.submit(search_worker, game_state.template.files, data, player_name,
+                            self.budget * WORKER_MARGIN, self.rng.randrange(2 ** 31))
+                for _ in range(self.workers)
+            ]
+        self.last_iterations = self.search.run(game_state, player_name, deadline)
+        root = self.search.root
+        for future in futures:
+            try:
+                stats = future.result(timeout=max(deadline - time.perf_counter(), 0))
+            except FutureTimeout:
+                continue
+            for key, (visits, reward, command) in stats.items():
+                child = root.children.get(key)
+                if child is None:
+                    child = root.children[key] = Node(command)
+                child.visits += visits
+                child.reward += reward
+        best = max(
+            (key for key in legal if key in root.children),
+            key=lambda key: (root.children[key].visits, root.children[key].reward),
+            default=None
+        )
+        return legal[best] if best is not None else self.fallback(game_state, player_name)
+
+    def observe(self, command: dict) -> None:
+        child = self.search.root.children.get(command_key(command))
+        self.search.root = child if child is not None else Node()
+
+BOTS[MCTSBot.name] = MCTSBot
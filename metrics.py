@@ -0,0 +1,295 @@
+from __future__ import annotations
+
+import cProfile
+import itertools
+import json
+import logging
+import os
+import threading
+import time
+from bisect import bisect_left
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import wraps
+from typing import Callable, Dict, List, Sequence, Set, Tuple
+
+import redis
+import socketio
+
+logger = logging.getLogger(__name__)
+
+# Upper bounds of the histogram buckets; +Inf is implied
+SECONDS_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5)
+REDIS_BUCKETS = (0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.1, 0.5)
+BYTES_BUCKETS = (64, 256, 1024, 4096, 16384, 65536, 262144, 1048576)
+FANOUT_BUCKETS = (0, 1, 2, 5, 10, 50, 100, 500, 1000, 5000)
+
+# The handler (Socket.IO event or HTTP endpoint) the current thread or greenlet is serving,
+# so the Redis round trips it makes are counted against it
+current_event: ContextVar[str] = ContextVar('current_event', default='background')
+# Socket.IO events handled or emitted by this process. Payloads of any other event, which
+# clients can name freely, are counted under OTHER_EVENT so they cannot add label sets.
+known_events: Set[str] = set()
+OTHER_EVENT = 'other'
+
+def format_labels(names: Sequence[str], values: Sequence[str], extra: str = '') -> str:
+    pairs = [f'{name}="{escape_label(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return '{' + ','.join(pairs) + '}' if pairs else ''
+
+def escape_label(value: str) -> str:
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+def format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+class Metric:
+    kind = 'untyped'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        self.name: str = name
+        self.help: str = help
+        self.labels: Tuple[str, ...] = (labels,) if isinstance(labels, str) else tuple(labels)
+        self.lock = threading.Lock()
+        REGISTRY.append(self)
+
+    def render(self) -> List[str]:
+        return [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}", *self.samples()]
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+class Counter(Metric):
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = ()):
+        super().__init__(name, help, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, *label_values: str, amount: float = 1) -> None:
+        with self.lock:
+            self.values[label_values] = self.values.get(label_values, 0) + amount
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            values = list(self.values.items())
+        return [f"{self.name}_total{format_labels(self.labels, key)} {format_value(value)}" for key, value in values]
+
+class Gauge(Metric):
+    """A value set as it changes, or read from a function on every scrape."""
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, function: Callable[[], float] | None = None):
+        super().__init__(name, help)
+        self.value: float = 0
+        self.function: Callable[[], float] | None = function
+
+    def inc(self, amount: float = 1) -> None:
+        with self.lock:
+            self.value += amount
+
+    def dec(self, amount: float = 1) -> None:
+        self.inc(-amount)
+
+    def samples(self) -> List[str]:
+        if self.function is not None:
+            try:
+                value = self.function()
+            except Exception:
+                logger.exception("Reading gauge %s failed", self.name)
+                return []
+        else:
+            value = self.value
+        return [f"{self.name} {format_value(value)}"]
+
+class Histogram(Metric):
+    """Counts per bucket, kept non-cumulative and summed up on scrape, so an observation
+    is a bisect and one increment."""
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, labels: Sequence[str] = (), buckets: Sequence[float] = SECONDS_BUCKETS):
+        super().__init__(name, help, labels)
+        self.buckets: Tuple[float, ...] = tuple(buckets)
+        # label values -> [counts per bucket and one for +Inf, sum]
+        self.series: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, *label_values: str) -> None:
+        index = bisect_left(self.buckets, value)
+        with self.lock:
+            series = self.series.get(label_values)
+            if series is None:
+                series = self.series[label_values] = [[0] * (len(self.buckets) + 1), 0.0]
+            series[0][index] += 1
+            series[1] += value
+
+    def samples(self) -> List[str]:
+        with self.lock:
+            series = [(key, counts.copy(), total) for key, (counts, total) in self.series.items()]
+        lines = []
+        for key, counts, total in series:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                le = 'le="' + format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{format_labels(self.labels, key, le)} {cumulative}")
+            labels = format_labels(self.labels, key)
+            lines.append(f"{self.name}_sum{labels} {format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+REGISTRY: List[Metric] = []
+
+def render() -> str:
+    """Every metric of this process in the Prometheus text format."""
+    return '\n'.join(line for metric in REGISTRY for line in metric.render()) + '\n'
+
+HANDLER_SECONDS = Histogram('ttr_handler_seconds', "Time spent handling a Socket.IO event or HTTP request.", 'event')
+REDIS_SECONDS = Histogram('ttr_redis_seconds', "Redis round trips, by the handler that made them.", 'event',
+                          REDIS_BUCKETS)
+PAYLOAD_BYTES = Histogram('ttr_payload_bytes', "Encoded size of Socket.IO messages and HTTP responses.",
+                          ('event', 'direction'), BYTES_BUCKETS)
+FANOUT = Histogram('ttr_emit_fanout', "Clients of this process an emitted Socket.IO event was sent to.", 'event',
+                   FANOUT_BUCKETS)
+SERIALIZE_SECONDS = Histogram('ttr_serialize_seconds', "Time spent building game state documents.", 'what')
+SLOW_PROFILES = Counter('ttr_slow_handler_profiles', "Profiles saved of handlers slower than the threshold.", 'event')
+CONNECTED_SOCKETS = Gauge('ttr_connected_sockets', "Socket.IO clients connected to this process.")
+
+def timed(event: str):
+    """Decorator timing a handler, and counting Redis round trips made from it against it."""
+    known_events.add(event)
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            token = current_event.set(event)
+            start = time.perf_counter()
+            try:
+                if profiler is not None and profiler.sample():
+                    return profiler.run(event, func, args, kwargs)
+                return func(*args, **kwargs)
+            finally:
+                HANDLER_SECONDS.observe(time.perf_counter() - start, event)
+                current_event.reset(token)
+        return wrapper
+    return decorator
+
+def measured(histogram: Histogram, *label_values: str):
+    """Decorator observing the duration of every call in histogram."""
+    def decorator(func):
+        @wraps(func)
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                histogram.observe(time.perf_counter() - start, *label_values)
+        return wrapper
+    return decorator
+
+@contextmanager
+def timer(histogram: Histogram, *label_values: str):
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        histogram.observe(time.perf_counter() - start, *label_values)
+
+class SlowHandlerProfiler:
+    """Profiles one handler call in every `every` and saves the profile (for pstats or
+    snakeviz) when the call took longer than `threshold` seconds. Calls not sampled run
+    unprofiled."""
+    def __init__(self, threshold: float, every: int = 100, directory: str = 'profiles'):
+        self.threshold: float = threshold
+        self.every: int = max(every, 1)
+        self.directory: str = directory
+        self.calls = itertools.count()
+
+    def sample(self) -> bool:
+        return next(self.calls) % self.every == 0
+
+    def run(self, event: str, func, args, kwargs):
+        profile = cProfile.Profile()
+        start = time.perf_counter()
+        try:
+            return profile.runcall(func, *args, **kwargs)
+        finally:
+            elapsed = time.perf_counter() - start
+            if elapsed >= self.threshold:
+                os.makedirs(self.directory, exist_ok=True)
+                path = os.path.join(self.directory, f"{event}-{time.strftime('%Y%m%d-%H%M%S')}-{os.getpid()}.prof")
+                profile.dump_stats(path)
+                SLOW_PROFILES.inc(event)
+                logger.warning("%s took %.0f ms, profile saved to %s", event, elapsed * 1000, path)
+
+profiler: SlowHandlerProfiler | None = None
+
+def enable_profiler(threshold: float, every: int = 100, directory: str = 'profiles') -> None:
+    global profiler
+    profiler = SlowHandlerProfiler(threshold, every, directory)
+
+# ----- Redis -----
+
+class TimedPipeline(redis.client.Pipeline):
+    def execute(self, raise_on_error: bool = True):
+        start = time.perf_counter()
+        try:
+            return super().execute(raise_on_error)
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, current_event.get())
+
+class TimedRedis(redis.Redis):
+    """Redis client timing every command, pipeline and script call as one round trip."""
+    def execute_command(self, *args, **options):
+        start = time.perf_counter()
+        try:
+            return super().execute_command(*args, **options)
+        finally:
+            REDIS_SECONDS.observe(time.perf_counter() - start, current_event.get())
+
+    def pipeline(self, transaction: bool = True, shard_hint=None) -> TimedPipeline:
+        return TimedPipeline(self.connection_pool, self.response_callbacks, transaction, shard_hint)
+
+# ----- Socket.IO -----
+
+def event_label(event: str) -> str:
+    return event if event in known_events else OTHER_EVENT
+
+class PayloadSizeJSON:
+    """The json module Socket.IO encodes and decodes packets with, measuring them on the way.
+    An event packet's data is [event name, *arguments]."""
+    @staticmethod
+    def dumps(data, *args, **kwargs) -> str:
+        encoded = json.dumps(data, *args, **kwargs)
+        if isinstance(data, list) and data and isinstance(data[0], str):
+            PAYLOAD_BYTES.observe(len(encoded), event_label(data[0]), 'out')
+        return encoded
+
+    @staticmethod
+    def loads(encoded, *args, **kwargs):
+        data = json.loads(encoded, *args, **kwargs)
+        if isinstance(data, list) and data and isinstance(data[0], str):
+            PAYLOAD_BYTES.observe(len(encoded), event_label(data[0]), 'in')
+        return data
+
+class FanoutCounter(socketio.Manager):
+    """Counts the recipients of every emit where it is delivered: in the emitting process
+    without a message queue, in each subscribed process with one."""
+    def emit(self, event, data, namespace, room=None, skip_sid=None, callback=None, to=None, **kwargs):
+        known_events.add(event)  # emitted by the server, before the packets are encoded
+        recipients = self.rooms.get(namespace, {}).get(to or room) or {}
+        skipped = skip_sid if isinstance(skip_sid, list) else [skip_sid]
+        FANOUT.observe(len(recipients) - sum(sid in recipients for sid in skipped if sid is not None), event)
+        return super().emit(event, data, namespace, room=room, skip_sid=skip_sid, callback=callback, to=to, **kwargs)
+
+class CountingRedisManager(socketio.RedisManager, FanoutCounter):
+    # RedisManager publishes emits to the queue; their delivery, from the queue listener,
+    # goes through FanoutCounter.emit, which comes next in the method resolution order
+    pass
+
+def client_manager(message_queue: str | None, channel: str = 'flask-socketio') -> socketio.Manager:
+    """The Socket.IO client manager Flask-SocketIO would create, counting emit fan-out."""
+    if message_queue:
+        return CountingRedisManager(message_queue, channel=channel)
+    return FanoutCounter()
@@ -0,0 +1,100 @@
+from __future__ import annotations
+
+from bisect import bisect_left, bisect_right
+from typing import Dict, List, Sequence, Tuple
+
+from board_state import CARD_COLOR_INDEX, CardColor, ColoredEdge, FerryEdge, Graph
+
+GREY = -1  # bucket of grey routes, tunnels included
+FERRY = -2  # bucket of ferries
+JOKER = CARD_COLOR_INDEX[CardColor.JOKER]
+
+class RouteIndex:
+    """The routes of a board grouped by what pays for them, for one board.
+
+    buckets[kind]   edge ids of one kind (a CardColor index, GREY or FERRY), sorted by
+                    length, so the routes of each length are one slice and the routes a hand
+                    can pay for are a prefix found by bisecting lengths[kind]
+    siblings[e]     the other routes between the same two cities, for the double route rules
+    """
+    def __init__(self, graph: Graph):
+        buckets: Dict[int, List[Tuple[int, int]]] = {}
+        for edge in graph.edge_list:
+            buckets.setdefault(route_kind(edge), []).append((edge.length, edge.index))
+        self.buckets: Dict[int, List[int]] = {}
+        self.lengths: Dict[int, List[int]] = {}
+        for kind, routes in buckets.items():
+            routes.sort()
+            self.lengths[kind] = [length for length, _ in routes]
+            self.buckets[kind] = [index for _, index in routes]
+        self.kind: List[int] = [route_kind(edge) for edge in graph.edge_list]
+        self.length: List[int] = [edge.length for edge in graph.edge_list]
+        self.joker_cost: List[int] = [edge.joker_cost if isinstance(edge, FerryEdge) else 0 for edge in graph.edge_list]
+        self.siblings: List[Tuple[int, ...]] = [
+            tuple(other for other in graph.edge_ids_between(edge.node1.index, edge.node2.index) if other != edge.index)
+            for edge in graph.edge_list
+        ]
+
+def route_kind(edge) -> int:
+    if isinstance(edge, ColoredEdge):
+        return CARD_COLOR_INDEX[edge.color]
+    return FERRY if isinstance(edge, FerryEdge) else GREY
+
+class OpenRouteIndex:
+    """The buckets of a RouteIndex restricted to the routes nobody has claimed, for one game.
+
+    claim() takes a route out of its bucket, so a query only ever looks at open routes.
+    """
+    def __init__(self, index: RouteIndex, claimed: Sequence[bool] = ()):
+        self.index: RouteIndex = index
+        self.buckets: Dict[int, List[int]] = {
+            kind: [edge for edge in edges if not (edge < len(claimed) and claimed[edge])]
+            for kind, edges in index.buckets.items()
+        }
+        self.lengths: Dict[int, List[int]] = {
+            kind: [index.length[edge] for edge in edges] for kind, edges in self.buckets.items()
+        }
+
+    def claim(self, edge: int) -> None:
+        kind, length = self.index.kind[edge], self.index.length[edge]
+        edges, lengths = self.buckets[kind], self.lengths[kind]
+        position = bisect_left(lengths, length)
+        while position < len(edges) and lengths[position] == length:
+            if edges[position] == edge:
+                del edges[position]
+                del lengths[position]
+                return
+            position += 1
+
+    def affordable(self, cards: Sequence[int], trains_left: int) -> List[int]:
+        """Open routes a hand (card counts by CardColor index) and trains_left can pay for,
+        by edge id."""
+        jokers = cards[JOKER]
+        most = max(count for color, count in enumerate(cards) if color != JOKER)
+        routes = []
+        for kind, edges in self.buckets.items():
+            if kind >= 0:
+                limit = cards[kind] + jokers
+            else:
+                limit = most + jokers
+            end = bisect_right(self.lengths[kind], min(limit, trains_left))
+            if kind == FERRY:
+                joker_cost = self.index.joker_cost
+                routes.extend(edge for edge in edges[:end] if joker_cost[edge] <= jokers)
+            else:
+                routes.extend(edges[:end])
+        return routes
+
+    def within_trains(self, trains_left: int) -> List[int]:
+        """Open routes no longer than trains_left, by edge id."""
+        routes = []
+        for kind, edges in self.buckets.items():
+            routes.extend(edges[:bisect_right(self.lengths[kind], trains_left)])
+        return routes
+
+    def copy(self) -> OpenRouteIndex:
+        index = OpenRouteIndex.__new__(OpenRouteIndex)
+        index.index = self.index
+        index.buckets = {kind: edges.copy() for kind, edges in self.buckets.items()}
+        index.lengths = {kind: lengths.copy() for kind, lengths in self.lengths.items()}
+        return index
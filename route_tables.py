@@ -0,0 +1,218 @@
+from __future__ import annotations
+
+import hashlib
+import heapq
+import os
+from math import inf
+from typing import Dict, List, Sequence
+
+import numpy as np
+
+from board_state import FerryEdge, Graph
+
+FERRY_PENALTY = 0.0  # extra cost per ferry route, on top of its length in trains
+TUNNEL_PENALTY = 0.0  # extra cost per tunnel route
+NO_HOP = -1
+EPSILON = 1e-9  # slack when comparing sums of fractional penalties
+CACHE_FORMAT = 1  # bump when the layout of the cached arrays changes
+
+class RouteTables:
+    """All-pairs route costs over a board, indexed by Node.index.
+
+    trains[a, b]    cheapest cost from a to b: route lengths plus ferry and tunnel penalties
+    hops[a, b]      fewest routes from a to b
+    next_hop[a, b]  the city after a on a cheapest path to b, NO_HOP if there is none
+    Unreachable pairs cost inf.
+    """
+    def __init__(self, trains: np.ndarray, hops: np.ndarray, next_hop: np.ndarray):
+        self.trains: np.ndarray = trains
+        self.hops: np.ndarray = hops
+        self.next_hop: np.ndarray = next_hop
+
+    @classmethod
+    def compute(cls, graph: Graph, ferry_penalty: float = FERRY_PENALTY, tunnel_penalty: float = TUNNEL_PENALTY,
+                blocked: Sequence[bool] | None = None) -> RouteTables:
+        """Floyd-Warshall over the board, leaving out routes flagged in blocked (by Edge.index)."""
+        weights = route_weights(graph, ferry_penalty, tunnel_penalty, blocked)
+        trains, next_hop = floyd_warshall(weights)
+        hops, _ = floyd_warshall(unit_weights(weights))
+        return cls(trains, hops, next_hop)
+
+    @classmethod
+    def load(cls, graph: Graph, cities_file: str, connections_file: str,
+             ferry_penalty: float = FERRY_PENALTY, tunnel_penalty: float = TUNNEL_PENALTY) -> RouteTables:
+        """Read the tables cached next to connections_file, computing and caching them if the
+        board files or penalties changed since."""
+        digest = hashlib.sha1(repr((CACHE_FORMAT, ferry_penalty, tunnel_penalty)).encode())
+        for path in (cities_file, connections_file):
+            with open(path, 'rb') as f:
+                digest.update(f.read())
+        cache_file = os.path.join(os.path.dirname(connections_file), f"route_tables.{digest.hexdigest()[:16]}.npz")
+        if os.path.isfile(cache_file):
+            with np.load(cache_file) as cached:
+                return cls(cached['trains'], cached['hops'], cached['next_hop'])
+        tables = cls.compute(graph, ferry_penalty, tunnel_penalty)
+        try:
+            np.savez(cache_file, trains=tables.trains, hops=tables.hops, next_hop=tables.next_hop)
+        except OSError:
+            pass  # a read-only checkout just recomputes at every start
+        return tables
+
+    def copy(self) -> RouteTables:
+        return RouteTables(self.trains.copy(), self.hops.copy(), self.next_hop.copy())
+
+    def path(self, node1: int, node2: int) -> List[int] | None:
+        """Cities of a cheapest path from node1 to node2, both included, or None if unreachable."""
+        if node1 != node2 and self.next_hop[node1, node2] == NO_HOP:
+            return None
+        path = [node1]
+        while node1 != node2:
+            node1 = int(self.next_hop[node1, node2])
+            path.append(node1)
+        return path
+
+class OpenRouteTables(RouteTables):
+    """Route tables over the routes nobody has claimed yet, for one game.
+
+    claim() drops a route and repairs only the rows whose cheapest paths ran over it, with
+    one Dijkstra search per affected city, or a full Floyd-Warshall pass when so many are
+    affected that it is cheaper. Hop counts are rebuilt only when next read.
+    """
+    def __init__(self, graph: Graph, base: RouteTables, ferry_penalty: float = FERRY_PENALTY,
+                 tunnel_penalty: float = TUNNEL_PENALTY):
+        super().__init__(base.trains.copy(), base.hops.copy(), base.next_hop.copy())
+        self.graph: Graph = graph
+        self.ferry_penalty: float = ferry_penalty
+        self.tunnel_penalty: float = tunnel_penalty
+        self.blocked: List[bool] = [False] * len(graph.edge_list)
+        self.weights: np.ndarray = route_weights(graph, ferry_penalty, tunnel_penalty)
+        self.full_recompute_rows: int = max(len(self.weights) // 8, 1)
+        self.neighbours: List[Dict[int, float]] = [
+            {int(other): float(row[other]) for other in np.flatnonzero(np.isfinite(row)) if other != node}
+            for node, row in enumerate(self.weights)
+        ]
+
+    @property
+    def hops(self) -> np.ndarray:
+        if self._hops is None:
+            self._hops, _ = floyd_warshall(unit_weights(self.weights))
+        return self._hops
+
+    @hops.setter
+    def hops(self, hops: np.ndarray | None) -> None:
+        self._hops = hops
+
+    def copy(self) -> OpenRouteTables:
+        tables = OpenRouteTables.__new__(OpenRouteTables)
+        tables.__dict__.update(self.__dict__)
+        tables.trains, tables.next_hop = self.trains.copy(), self.next_hop.copy()
+        tables._hops = self._hops.copy() if self._hops is not None else None
+        tables.blocked = self.blocked.copy()
+        tables.weights = self.weights.copy()
+        tables.neighbours = [neighbours.copy() for neighbours in self.neighbours]
+        return tables
+
+    def claim(self, edge_index: int) -> None:
+        if self.blocked[edge_index]:
+            return
+        self.blocked[edge_index] = True
+        graph = self.graph
+        u, v = graph.edge_node1[edge_index], graph.edge_node2[edge_index]
+        if u == v:
+            return
+        old_weight = self.weights[u, v]
+        weight = min(
+            (self.weight(i) for i in graph.edge_ids_between(u, v) if not self.blocked[i]),
+            default=np.inf
+        )
+        self.weights[u, v] = self.weights[v, u] = weight
+        if np.isfinite(weight):
+            self.neighbours[u][v] = self.neighbours[v][u] = weight
+        else:
+            self.neighbours[u].pop(v, None)
+            self.neighbours[v].pop(u, None)
+        # Sources with some cheapest path through u-v; paths are symmetric, so rows suffice.
+        # Any other row keeps its costs, and its next hops lead through rows that either
+        # kept theirs too or were recomputed to the same cost.
+        trains = self.trains
+        if weight > old_weight:
+            # Pairs that cannot reach each other have no path to lose, though inf <= inf
+            through = np.isfinite(trains) & (
+                (trains[:, u, None] + old_weight + trains[v] <= trains + EPSILON) |
+                (trains[:, v, None] + old_weight + trains[u] <= trains + EPSILON)
+            )
+            sources = np.flatnonzero(through.any(axis=1))
+            if len(sources) > self.full_recompute_rows:
+                self.trains, self.next_hop = floyd_warshall(self.weights)
+            else:
+                for source in sources:
+                    trains[source], self.next_hop[source] = dijkstra(self.neighbours, source)
+                    trains[:, source] = trains[source]
+        if not np.isfinite(weight):
+            self._hops = None
+
+    def weight(self, edge_index: int) -> float:
+        edge = self.graph.edge_list[edge_index]
+        return edge_weight(edge, self.ferry_penalty, self.tunnel_penalty)
+
+def edge_weight(edge, ferry_penalty: float, tunnel_penalty: float) -> float:
+    weight = float(edge.length)
+    if isinstance(edge, FerryEdge):
+        weight += ferry_penalty
+    if edge.tunnel:
+        weight += tunnel_penalty
+    return weight
+
+def route_weights(graph: Graph, ferry_penalty: float, tunnel_penalty: float,
+                  blocked: Sequence[bool] | None = None) -> np.ndarray:
+    """Dense matrix of the cheapest direct route between each pair of cities."""
+    n = len(graph.node_list)
+    weights = np.full((n, n), np.inf)
+    np.fill_diagonal(weights, 0.0)
+    for edge in graph.edge_list:
+        if blocked is not None and blocked[edge.index]:
+            continue
+        u, v = edge.node1.index, edge.node2.index
+        if u != v:
+            weight = edge_weight(edge, ferry_penalty, tunnel_penalty)
+            if weight < weights[u, v]:
+                weights[u, v] = weights[v, u] = weight
+    return weights
+
+def unit_weights(weights: np.ndarray) -> np.ndarray:
+    """Every direct route counted as one hop."""
+    unit = np.where(np.isfinite(weights), 1.0, np.inf)
+    np.fill_diagonal(unit, 0.0)
+    return unit
+
+def floyd_warshall(weights: np.ndarray):
+    n = len(weights)
+    dist = weights.copy()
+    next_hop = np.where(np.isfinite(weights), np.arange(n)[None, :], NO_HOP).astype(np.int16)
+    np.fill_diagonal(next_hop, np.arange(n))
+    for k in range(n):
+        through = dist[:, k, None] + dist[k]
+        better = through < dist
+        np.copyto(dist, through, where=better)
+        np.copyto(next_hop, next_hop[:, k, None], where=better)
+    return dist, next_hop
+
+def dijkstra(neighbours: List[Dict[int, float]], source: int):
+    """Cheapest costs and first hops from one city, over per-city {neighbour: weight} maps."""
+    n = len(neighbours)
+    dist = [inf] * n
+    first = [NO_HOP] * n
+    dist[source] = 0.0
+    first[source] = source
+    heap = [(0.0, source)]
+    while heap:
+        cost, node = heapq.heappop(heap)
+        if cost > dist[node]:
+            continue
+        for neighbour, weight in neighbours[node].items():
+            through = cost + weight
+            if through < dist[neighbour]:
+                dist[neighbour] = through
+                first[neighbour] = neighbour if node == source else first[node]
+                heapq.heappush(heap, (through, neighbour))
+    return np.array(dist), np.array(first, dtype=np.int16)
@@ -0,0 +1,46 @@
+"""Production entry point: the app on gevent.
+
+Every connection is a greenlet and the standard library is monkey-patched, so Redis round
+trips, sleeps and socket reads yield to the other connections instead of holding a thread.
+An idle websocket costs a greenlet and a file descriptor, which lets one process keep tens
+of thousands of them open. Bot searches are CPU-bound and run on gevent's thread pool.
+
+Run from the repository root:
+    python serve.py [--host HOST] [--port PORT]
+
+or under gunicorn, with a single worker per process (run more processes behind a sticky
+load balancer, see README.md):
+    gunicorn -k gevent -w 1 -b 0.0.0.0:5000 serve:app
+"""
+from gevent import monkey
+monkey.patch_all()
+
+import argparse
+import os
+import resource
+
+os.environ.setdefault('SOCKETIO_ASYNC_MODE', 'gevent')
+
+from app import app, socketio
+
+def raise_open_file_limit():
+    """Every websocket holds a file descriptor; the usual soft limit of 1024 is far too low."""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+    return resource.getrlimit(resource.RLIMIT_NOFILE)[0]
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=int(os.environ.get('PORT', 5000)))
+    args = parser.parse_args()
+    limit = raise_open_file_limit()
+    print(f"Serving on {args.host}:{args.port} ({socketio.async_mode}, up to {limit} open files)")
+    socketio.run(app, host=args.host, port=args.port, log_output=False)
+
+if __name__ == '__main__':
+    main()
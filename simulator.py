@@ -0,0 +1,116 @@
+"""Play complete games between bots, headless, and stream one JSON line of results per game.
+
+Run from the repository root:
+    python simulator.py --games 1000 --bots greedy greedy random --out results.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import List, Sequence, Tuple
+
+import mcts  # registers the 'mcts' bot
+from bots import BOTS
+from game_engine import GameEngine
+from game_setup import BoardTemplate, PlayerColor, board_files, setup_game
+
+MAX_MOVES = 2000  # a game still running after this many commands is reported unfinished
+
+def play_game(seed: int, bot_names: Sequence[str], board: str = 'europe', max_moves: int = MAX_MOVES) -> dict:
+    """Play one game. The same seed, bots and board always give the same game, unless a bot
+    searches against the clock."""
+    start = time.perf_counter()
+    player_info = [(f"{name}{seat}", color) for seat, (name, color) in enumerate(zip(bot_names, PlayerColor))]
+    game_state = setup_game(*board_files(board), player_info, seed=seed)
+    bots = {
+        player_name: BOTS[name](seed * len(bot_names) + seat)
+        for seat, ((player_name, _), name) in enumerate(zip(player_info, bot_names))
+    }
+    engine = GameEngine(game_state)
+    moves = rejected = 0
+    while not game_state.game_over and moves < max_moves:
+        player_name = game_state.current_player_turn
+        bot = bots[player_name]
+        command = bot.choose(game_state, player_name)
+        error = engine.apply(command)[1] if command is not None else None
+        if error is not None:
+            rejected += 1
+        if command is None or error is not None:
+            command = bot.fallback(game_state, player_name)
+            error = engine.apply(command)[1] if command is not None else None
+            if command is None or error is not None:
+                rejected += 1
+                break  # the bot cannot move, reported unfinished
+        for other in bots.values():
+            other.observe(command)
+        game_state.discard_changes()  # nobody is listening for patches
+        moves += 1
+    return {
+        'seed': seed,
+        'board': board,
+        'bots': list(bot_names),
+        'finished': game_state.game_over,
+        'moves': moves,
+        'rejected': rejected,
+        'players': {
+            player_name: {
+                'score': player.score,
+                'trains_left': player.trains_left,
+                'tickets_completed': len(player.ticket_progress.completed),
+                'tickets_failed': len(player.ticket_progress.pending),
+                'longest_path': game_state.longest_path(player_name),
+            }
+            for player_name, player in game_state.players.items()
+        },
+        'elapsed_ms': round((time.perf_counter() - start) * 1e3, 3),
+    }
+
+def _play(job: Tuple[int, Tuple[str, ...], str, int]) -> dict:
+    return play_game(*job)
+
+def simulate(seeds: Sequence[int], bot_names: Sequence[str], board: str = 'europe', workers: int | None = None,
+             out=sys.stdout, max_moves: int = MAX_MOVES, chunksize: int = 8) -> int:
+    """Play a game per seed over a process pool, writing results as they come in. Returns the number of games."""
+    BoardTemplate.for_board(board)  # parse once here; forked workers inherit it
+    jobs = [(seed, tuple(bot_names), board, max_moves) for seed in seeds]
+    count = 0
+    if workers == 1:
+        for result in map(_play, jobs):
+            out.write(json.dumps(result) + '\n')
+            count += 1
+        return count
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        for result in executor.map(_play, jobs, chunksize=chunksize):
+            out.write(json.dumps(result) + '\n')
+            count += 1
+    return count
+
+def main(argv: List[str] | None = None):
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--games', type=int, default=100)
+    parser.add_argument('--first-seed', type=int, default=0)
+    parser.add_argument('--bots', nargs='+', default=['greedy', 'greedy'], choices=sorted(BOTS))
+    parser.add_argument('--board', default='europe')
+    parser.add_argument('--workers', type=int, default=os.cpu_count())
+    parser.add_argument('--max-moves', type=int, default=MAX_MOVES)
+    parser.add_argument('--out', help='JSONL file to append to, standard output by default')
+    args = parser.parse_args(argv)
+    if not 2 <= len(args.bots) <= len(PlayerColor):
+        parser.error(f"between 2 and {len(PlayerColor)} bots are needed")
+
+    seeds = range(args.first_seed, args.first_seed + args.games)
+    start = time.perf_counter()
+    if args.out:
+        with open(args.out, 'a') as out:
+            count = simulate(seeds, args.bots, args.board, args.workers, out, args.max_moves)
+    else:
+        count = simulate(seeds, args.bots, args.board, args.workers, sys.stdout, args.max_moves)
+    elapsed = time.perf_counter() - start
+    print(f"{count} games in {elapsed:.1f} s, {count / elapsed:.1f} games/s with {args.workers} workers", file=sys.stderr)
+
+if __name__ == '__main__':
+    main()
@@ -6,6 +6,8 @@ let currentUsername = '';
 let currentLobby = null;
 let currentPlayerId = null;
 let pendingLobbyId = null; // Store lobby ID to join after username setup
+let lobbies = new Map(); // Open lobbies by id, kept up to date with deltas
+let lobbyListVersion = 0;
 
 // Check URL for lobby ID on page load
 const pathParts = window.location.pathname.split('/');
@@ -79,6 +81,13 @@ function setUsername() {
 }
 
 // Socket.IO event handlers
+socket.on('connect', () => {
+    // A reconnected socket has lost its lobby list subscription
+    if (lobbyBrowserScreen.classList.contains('active')) {
+        socket.emit('get_lobby_list');
+    }
+});
+
 socket.on('username_set', (data) => {
     currentUsernameSpan.textContent = data.username;
     switchScreen(lobbyBrowserScreen);
@@ -91,7 +100,23 @@ socket.on('username_set', (data) => {
 });
 
 socket.on('lobby_list_update', (data) => {
-    renderLobbyList(data.lobbies);
+    lobbies = new Map(data.lobbies.map(lobby => [lobby.id, lobby]));
+    lobbyListVersion = data.version;
+    renderLobbyList([...lobbies.values()]);
+});
+
+socket.on('lobby_list_delta', (data) => {
+    // Deltas older than the snapshot we have are already part of it
+    if (data.version <= lobbyListVersion) return;
+    lobbyListVersion = data.version;
+    for (const change of data.changes) {
+        if (change.op === 'remove') {
+            lobbies.delete(change.id);
+        } else {
+            lobbies.set(change.id, change.lobby);
+        }
+    }
+    renderLobbyList([...lobbies.values()]);
 });
 
 socket.on('lobby_created', (data) => {
@@ -201,7 +226,6 @@ backToLobbyBtn.addEventListener('click', () => {
     // For demo purposes, we'll go back to lobby browser
     socket.emit('leave_lobby');
     switchScreen(lobbyBrowserScreen);
-    socket.emit('get_lobby_list');
     
     // Reset URL to home
     window.history.pushState({}, '', '/');
@@ -274,6 +298,10 @@ function renderLobbyRoom(lobby) {
 function switchScreen(screen) {
     document.querySelectorAll('.screen').forEach(s => s.classList.remove('active'));
     screen.classList.add('active');
+    // Subscribes to the lobby list, which is only sent while the browser is shown
+    if (screen === lobbyBrowserScreen) {
+        socket.emit('get_lobby_list');
+    }
 }
 
 function openModal(modal) {
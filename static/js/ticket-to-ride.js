@@ -22,22 +22,60 @@ const color_map = {
 const lobby_id = window.location.pathname.split('/').pop();
 
 let two = null;
-const socket = io();
+// Last views of the game received from the server and their versions:
+// the public view shared by the table and this player's own cards and tickets
+let gameState = null;
+let gameVersion = null;
+let playerState = null;
+// Game version at which this player's own view last changed; the server only sends private
+// patches when it does, starting from this version
+let playerVersion = null;
+// The lobby id lets a load balancer send every connection to this game to one server process
+const socket = io({ query: { lobby: lobby_id } });
 init();
-getGameState();
 
 socket.on('connect', () => {
     // Re-join the socket room for this lobby so the broadcast reaches us.
     // The server already placed every player into the room before redirecting,
     // but a fresh page-load gets a new socket connection, so we rejoin here.
-    socket.emit('rejoin_game', { lobby_id });
+    // Sending the last seen version lets the server answer with a patch instead of a snapshot.
+    socket.emit('rejoin_game', { lobby_id, version: gameVersion, player_version: playerVersion });
+});
+
+socket.on('game_update', (message) => {
+    if (message.type === 'snapshot') {
+        gameState = message.state;
+    } else if (message.from_version === gameVersion) {
+        gameState = applyPatch(gameState, message.patch);
+    } else {
+        // Missed an update, ask for whatever we need to catch up
+        socket.emit('sync_game', { lobby_id, version: gameVersion, player_version: playerVersion });
+        return;
+    }
+    gameVersion = message.version;
+    console.log('Game state:', gameState);
+});
+
+socket.on('player_update', (message) => {
+    if (message.type === 'snapshot') {
+        playerState = message.state;
+    } else if (message.from_version === playerVersion) {
+        playerState = applyPatch(playerState, message.patch);
+    } else {
+        socket.emit('sync_game', { lobby_id, version: gameVersion, player_version: playerVersion });
+        return;
+    }
+    playerVersion = message.version;
+    console.log('Player state:', playerState);
 });
 
 // ========= FUNCTIONS ===========
 
 async function init() {
-    const response = await fetch(`/api/init_board`);
-    const data = await response.json();
+    // Screen pixels per board unit, used by the server to pick a level of detail
+    const zoom = 1 / SCALE;
+    const response = await fetch(`/api/board/europe/geometry?zoom=${zoom}`);
+    const data = decodeGeometry(await response.arrayBuffer());
     console.log('Board bbox', data.bbox);
     const params = {
         type: Two.Types.svg,
@@ -51,21 +89,92 @@ async function init() {
     // getCards(), getInitialTickets(), etc.
 }
 
-async function getGameState() {
-    try {
-        const response = await fetch(`/api/get-game-state`, {
-            method: 'GET',
-            headers: {
-                'Content-Type': 'application/json'
+// Applies the subset of JSON Patch (RFC 6902) the server sends: add/replace/remove.
+// Returns the patched document, which is a new one if the patch replaces the root.
+function applyPatch(doc, patch) {
+    patch.forEach(op => {
+        if (op.path === '') {
+            doc = op.value;
+            return;
+        }
+        const parts = op.path.split('/').slice(1).map(p => p.replace(/~1/g, '/').replace(/~0/g, '~'));
+        const key = parts.pop();
+        const parent = parts.reduce((node, part) => node[Array.isArray(node) ? Number(part) : part], doc);
+        const index = Array.isArray(parent) ? Number(key) : key;
+        if (op.op === 'remove') {
+            if (Array.isArray(parent)) parent.splice(index, 1); else delete parent[index];
+        } else if (op.op === 'add' && Array.isArray(parent)) {
+            parent.splice(key === '-' ? parent.length : index, 0, op.value);
+        } else {
+            parent[index] = op.value;
+        }
+    });
+    return doc;
+}
+
+// Decodes the binary board geometry written by geometry_format.py into the same
+// {bbox, elements} structure as /api/init_board
+function decodeGeometry(buffer) {
+    const ELEMENT_TYPES = ['Path', 'Ellipse'];
+    const view = new DataView(buffer);
+    const magic = String.fromCharCode(...new Uint8Array(buffer, 0, 4));
+    if (magic !== 'TTRG') throw new Error('Not a board geometry file');
+    const headerLength = view.getUint32(8, true);
+    const header = JSON.parse(new TextDecoder().decode(new Uint8Array(buffer, 12, headerLength)));
+    const counts = header.counts;
+    const n = counts.elements;
+    let pos = 12 + headerLength;
+    function take(ArrayType, count) {
+        pos += (4 - pos % 4) % 4;
+        const arr = new ArrayType(buffer, pos, count);
+        pos += arr.byteLength;
+        return arr;
+    }
+    const types = take(Uint8Array, n);
+    const fills = take(Uint16Array, n);
+    const strokes = take(Uint16Array, n);
+    const widths = take(Float32Array, n);
+    const ellipses = take(Float32Array, 4 * counts.ellipses);
+    const elementRings = take(Uint32Array, n + 1);
+    const elementBodies = take(Uint32Array, n);
+    const ringOffsets = take(Uint32Array, counts.rings + 1);
+    const coords = take(Int16Array, 2 * counts.vertices);
+
+    const [originX, originY] = header.origin;
+    const scale = header.scale;
+    const elements = [];
+    let ellipseIndex = 0;
+    for (let i = 0; i < n; i++) {
+        const rings = [];
+        for (let r = elementRings[i]; r < elementRings[i + 1]; r++) {
+            const ring = [];
+            let qx = 0, qy = 0;
+            for (let v = ringOffsets[r]; v < ringOffsets[r + 1]; v++) {
+                qx += coords[2 * v];
+                qy += coords[2 * v + 1];
+                ring.push([originX + qx / scale, originY + qy / scale]);
             }
+            rings.push(ring);
+        }
+        const attributes = {
+            fill: header.palette[fills[i]],
+            stroke: header.palette[strokes[i]],
+            stroke_width: widths[i]
+        };
+        if (ELEMENT_TYPES[types[i]] === 'Ellipse') {
+            const e = 4 * ellipseIndex++;
+            attributes.centre = [ellipses[e], ellipses[e + 1]];
+            attributes.radius = [ellipses[e + 2], ellipses[e + 3]];
+        }
+        elements.push({
+            type: ELEMENT_TYPES[types[i]],
+            id: header.ids[i],
+            bodies: rings.slice(0, elementBodies[i]),
+            holes: rings.slice(elementBodies[i]),
+            attributes
         });
-        const data = await response.json();
-        console.log('Game state:', data);
-        //drawCards(data.cards);
-        //drawTickets(data.tickets);
-    } catch (error) {
-        console.error('Error fetching game state:', error);
     }
+    return { bbox: header.bbox, elements };
 }
 
 function pointsToAnchors(points) {
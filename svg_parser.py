@@ -1,5 +1,11 @@
 from svgelements import *
 import json
+import os
+import sys
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from geometry_format import encode_geometry, LOD_TOLERANCES
+from geometry_tiles import write_geometry_tiles
 
 def subpath_vertices(subpath):
     """Return ordered vertices of a subpath consisting of straight lines."""
@@ -36,14 +42,95 @@ def signed_area(ring):
         for (x1, y1), (x2, y2) in zip(ring, ring[1:])
     )
 
-def extract_svg_elements(svg_path):
-    elements_data = []
+def path_subpaths(path):
+    """Walk a path once, returning the Move/Line end points of each subpath (split like
+    Path.as_subpaths) and the bounding box of any curve segments, which the rings skip."""
+    subpaths = []
+    current = None
+    curve_bbox = None
+    for seg in path:
+        if isinstance(seg, Move):
+            current = [(seg.end.x, seg.end.y)]
+            subpaths.append(current)
+        elif isinstance(seg, Close):
+            current = None
+        else:
+            if current is None:
+                current = []
+                subpaths.append(current)
+            if isinstance(seg, Line):
+                current.append((seg.end.x, seg.end.y))
+            else:
+                seg_bbox = seg.bbox()
+                curve_bbox = seg_bbox if curve_bbox is None else union_bbox(curve_bbox, seg_bbox)
+    return subpaths, curve_bbox
 
-    drawing = SVG.parse(svg_path)
-    bbox = drawing.bbox()
+def ring_array(points):
+    """Vertices of a subpath as a closed (n, 2) array, same rules as subpath_vertices."""
+    points = np.array(points, dtype=np.float64).reshape(-1, 2)
+    # drop consecutive duplicates
+    if len(points) > 1:
+        keep = np.empty(len(points), dtype=bool)
+        keep[0] = True
+        np.any(points[1:] != points[:-1], axis=1, out=keep[1:])
+        points = points[keep]
+    # close the ring
+    if len(points) > 2 and np.any(points[0] != points[-1]):
+        points = np.vstack((points, points[:1]))
+    return points
+
+def ellipse_bbox(element):
+    """Closed-form bbox of a (possibly rotated and transformed) ellipse.
 
+    Shape.bbox walks the ellipse as arcs, which is by far the slowest step for boards with
+    many city markers.
+    """
+    m = element.transform
+    theta = float(element.rotation)
+    cos, sin = np.cos(theta), np.sin(theta)
+    # columns of transform @ rotation @ diag(rx, ry)
+    ux, uy = element.rx * cos, element.rx * sin
+    vx, vy = -element.ry * sin, element.ry * cos
+    half_width = float(np.hypot(m.a * ux + m.c * uy, m.a * vx + m.c * vy))
+    half_height = float(np.hypot(m.b * ux + m.d * uy, m.b * vx + m.d * vy))
+    cx = m.a * element.cx + m.c * element.cy + m.e
+    cy = m.b * element.cx + m.d * element.cy + m.f
+    return cx - half_width, cy - half_height, cx + half_width, cy + half_height
+
+def ring_signed_areas(points, offsets):
+    """Signed areas of the rings points[offsets[i]:offsets[i + 1]], computed in one pass."""
+    x, y = points[:, 0], points[:, 1]
+    terms = np.empty(len(points))
+    terms[:-1] = -(x[1:] - x[:-1]) * (y[1:] + y[:-1])
+    terms[-1] = 0.0
+    # segments joining the last vertex of a ring to the first of the next one don't count
+    terms[offsets[1:] - 1] = 0.0
+    return np.add.reduceat(terms, offsets[:-1])
+
+def split_rings(rings):
+    """Drop degenerate rings and sort the rest into bodies (positive area) and holes."""
+    lengths = np.array([len(ring) for ring in rings], dtype=np.intp)
+    valid = lengths >= 4  # 3 + closing point
+    if not valid.any():
+        return [], []
+    rings = [ring for ring, ok in zip(rings, valid) if ok]
+    offsets = np.zeros(len(rings) + 1, dtype=np.intp)
+    np.cumsum(lengths[valid], out=offsets[1:])
+    areas = ring_signed_areas(np.concatenate(rings), offsets)
+    bodies = [ring.tolist() for ring, area in zip(rings, areas) if area > 0]
+    holes = [ring.tolist() for ring, area in zip(rings, areas) if area <= 0]
+    return bodies, holes
+
+def iter_svg_elements(drawing):
+    """Yield (element_info, bbox) for every Path and Ellipse of a parsed drawing, in document order.
+
+    The bbox covers everything drawn by the element so the caller can build the drawing's
+    bounding box without a second pass over the document.
+    """
     for element in drawing.elements():
         if type(element) not in [Ellipse, Path]:
+            if isinstance(element, Shape):
+                yield None, element.bbox()
             continue
         bodies = []
         holes = []
@@ -55,18 +142,16 @@ def extract_svg_elements(svg_path):
         if isinstance(element, Ellipse):
             attributes['centre'] = (element.cx, element.cy)
             attributes['radius'] = (element.rx, element.ry)
-        elif isinstance(element, Path):
-            for sub in element.as_subpaths():
-                vertices = subpath_vertices(sub)
-                # ignore degenerate paths
-                if len(vertices) < 4:  # 3 + closing point
-                    continue
-                area = signed_area(vertices)
-
-                if area > 0:
-                    bodies.append(vertices)
-                else:
-                    holes.append(vertices)
+            bbox = ellipse_bbox(element)
+        else:
+            subpaths, bbox = path_subpaths(element)
+            rings = [ring_array(points) for points in subpaths]
+            bodies, holes = split_rings(rings)
+            points = [ring for ring in rings if len(ring)]
+            if points:
+                points = np.concatenate(points)
+                points_bbox = (*points.min(axis=0).tolist(), *points.max(axis=0).tolist())
+                bbox = points_bbox if bbox is None else union_bbox(bbox, points_bbox)
 
         element_info = {
             'type': type(element).__name__,
@@ -75,9 +160,42 @@ def extract_svg_elements(svg_path):
             'holes': holes,
             'attributes': attributes
         }
-        elements_data.append(element_info)
+        yield element_info, bbox
+
+def union_bbox(a, b):
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+def extract_svg_elements(svg_path):
+    elements_data = []
+    bbox = None
+
+    drawing = SVG.parse(svg_path)
+    for element_info, element_bbox in iter_svg_elements(drawing):
+        if element_info is not None:
+            elements_data.append(element_info)
+        if element_bbox is not None:
+            bbox = element_bbox if bbox is None else union_bbox(bbox, element_bbox)
     return elements_data, bbox
 
+def extract_boards(svg_paths, max_workers=None):
+    """Extract several boards at once, one process per board.
+
+    SVG.parse dominates extraction and is inherently serial within a document, so boards
+    rather than elements are the unit of parallelism.
+    """
+    svg_paths = list(svg_paths)
+    if len(svg_paths) == 1 or max_workers == 1:
+        return [extract_svg_elements(svg_path) for svg_path in svg_paths]
+    with ProcessPoolExecutor(max_workers=max_workers) as pool:
+        return list(pool.map(extract_svg_elements, svg_paths))
+
+def write_geometry_lods(elements, bbox, out_dir, tolerances=LOD_TOLERANCES):
+    """Write the compact binary geometry, one file per level of detail."""
+    os.makedirs(out_dir, exist_ok=True)
+    for lod, tolerance in enumerate(tolerances):
+        with open(os.path.join(out_dir, f'lod{lod}.bin'), 'wb') as f:
+            f.write(encode_geometry(elements, bbox, tolerance))
+
 def draw_svg_elements(elements, bbox):
     import matplotlib.pyplot as plt
     fig, ax = plt.subplots()
@@ -97,12 +215,18 @@ def draw_svg_elements(elements, bbox):
     plt.show()
 
 if __name__ == '__main__':
-    svg_path = 'static/europe/svg/board.svg'
-    elements, bbox = extract_svg_elements(svg_path)
-    data = {
-        'bbox': bbox,
-        'elements': elements,
-    }
-
-    with open('static/europe/svg_elements.json', 'w') as f:
-        json.dump(data, f, indent=1)
\ No newline at end of file
+    # Boards named on the command line, by default every board with an SVG
+    boards = sys.argv[1:] or sorted(
+        name for name in os.listdir('static') if os.path.isfile(f'static/{name}/svg/board.svg')
+    )
+    extracted = extract_boards(f'static/{board}/svg/board.svg' for board in boards)
+    for board, (elements, bbox) in zip(boards, extracted):
+        data = {
+            'bbox': bbox,
+            'elements': elements,
+        }
+
+        with open(f'static/{board}/svg_elements.json', 'w') as f:
+            json.dump(data, f, indent=1)
+        write_geometry_lods(elements, bbox, f'static/{board}/geometry')
+        write_geometry_tiles(elements, bbox, f'static/{board}/tiles')